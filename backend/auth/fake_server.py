@@ -0,0 +1,135 @@
+"""
+Local stand-in for Auth0's JWKS endpoint, for offline benchmarks and load tests.
+
+Run it with
+
+    python -m auth.fake_server --port 9001 --token-for auth0|bench-user
+
+and point the backend at it with
+AUTH0_JWKS_URL=http://127.0.0.1:9001/.well-known/jwks.json. Tokens printed by
+--token-for (or made with FakeAuth0.token) verify against that key set.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+class FakeAuth0:
+    """
+    One RSA signing key, the JWKS document for it and a token factory using
+    the audience and issuer the backend expects.
+    """
+
+    def __init__(self, kid='fake-key', latency=0.0):
+        self.kid = kid
+        self.latency = latency
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        self.jwks = {'keys': [{**jwk, 'kid': kid, 'use': 'sig', 'alg': 'RS256'}]}
+        self.requests = 0
+
+    def token(self, sub='auth0|bench-user', lifetime=3600, **claims):
+        from django.conf import settings
+
+        payload = {
+            'sub': sub,
+            'email': f"{sub.split('|')[-1]}@example.com",
+            'name': sub,
+            'aud': settings.AUTH0_AUDIENCE,
+            'iss': f"https://{settings.AUTH0_DOMAIN}/",
+            'iat': int(time.time()),
+            'exp': int(time.time()) + lifetime,
+            **claims,
+        }
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            fake.requests += 1
+            if self.path != '/.well-known/jwks.json':
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if fake.latency:
+                time.sleep(fake.latency)
+            data = json.dumps(fake.jwks).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeAuth0Server:
+    """
+    Serve a FakeAuth0's JWKS on a background thread:
+
+        server = FakeAuth0Server().start()
+        ... settings.AUTH0_JWKS_URL = server.jwks_url ...
+        token = server.fake.token('auth0|1')
+        server.stop()
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        self.fake = FakeAuth0(**options)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.fake))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def jwks_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/.well-known/jwks.json'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    import os
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9001)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--token-for', action='append', default=[], metavar='SUB', help='print a token for this user')
+    args = parser.parse_args()
+
+    server = FakeAuth0Server(args.host, args.port, latency=args.latency)
+    print(f'Fake Auth0 JWKS at {server.jwks_url}')
+    for sub in args.token_for:
+        print(f'{sub}: {server.fake.token(sub, lifetime=24 * 3600)}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,139 @@
-from django.test import TestCase
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework import exceptions
+
+from backend import authentication
+from backend.authentication import Auth0JSONWebTokenAuthentication
+
+from .fake_server import FakeAuth0Server
+
+
+def make_signing_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk['kid'] = kid
+    return private_key, jwk
+
+
+class JWKSResponse:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'keys': self.keys}
+
+
+class Auth0AuthenticationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key, cls.jwk = make_signing_key('key-1')
+
+    def setUp(self):
+        authentication.jwks_store.clear()
+        authentication.verified_tokens.clear()
+        patcher = mock.patch.object(authentication.requests, 'get', return_value=JWKSResponse([self.jwk]))
+        self.jwks_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_token(self, kid='key-1', private_key=None, **claims):
+        payload = {
+            'sub': 'auth0|123',
+            'email': 'user@example.com',
+            'aud': settings.AUTH0_AUDIENCE,
+            'iss': f"https://{settings.AUTH0_DOMAIN}/",
+            'exp': int(time.time()) + 600,
+            **claims,
+        }
+        return jwt.encode(payload, private_key or self.private_key, algorithm='RS256', headers={'kid': kid})
+
+    def authenticate(self, token):
+        request = mock.Mock(META={'HTTP_AUTHORIZATION': f'Bearer {token}'})
+        return Auth0JSONWebTokenAuthentication().authenticate(request)
+
+    def test_jwks_is_fetched_once_across_authenticator_instances(self):
+        self.authenticate(self.make_token())
+        self.authenticate(self.make_token(email='other@example.com'))
+        self.assertEqual(self.jwks_get.call_count, 1)
+
+    def test_repeat_token_skips_signature_verification(self):
+        token = self.make_token()
+        self.authenticate(token)
+        with mock.patch.object(authentication.jwt, 'decode') as decode:
+            user, _ = self.authenticate(token)
+        decode.assert_not_called()
+        self.assertEqual(user.auth0_sub, 'auth0|123')
+
+    def test_expired_cached_token_is_reverified(self):
+        token = self.make_token()
+        self.authenticate(token)
+        with mock.patch.object(authentication.time, 'time', return_value=time.time() + 3600):
+            self.assertIsNone(authentication.verified_tokens.get(token))
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.authenticate(self.make_token())
+        rotated_key, rotated_jwk = make_signing_key('key-2')
+        token = self.make_token(kid='key-3', private_key=rotated_key)
+        for _ in range(3):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate(token)
+        # One initial fetch plus a single refetch for the unknown kid
+        self.assertEqual(self.jwks_get.call_count, 2)
+
+    def test_rotated_key_is_picked_up(self):
+        self.authenticate(self.make_token())
+        rotated_key, rotated_jwk = make_signing_key('key-2')
+        self.jwks_get.return_value = JWKSResponse([self.jwk, rotated_jwk])
+        user, _ = self.authenticate(self.make_token(kid='key-2', private_key=rotated_key))
+        self.assertEqual(user.auth0_sub, 'auth0|123')
+
+
+class FakeAuth0ServerTests(TestCase):
+    def setUp(self):
+        self.server = FakeAuth0Server().start()
+        self.addCleanup(self.server.stop)
+        authentication.jwks_store.clear()
+        authentication.verified_tokens.clear()
+        self.addCleanup(authentication.jwks_store.clear)
+
+    def test_tokens_verify_against_the_configured_jwks_url(self):
+        token = self.server.fake.token('auth0|bench-1')
+        request = mock.Mock(META={'HTTP_AUTHORIZATION': f'Bearer {token}'})
+        with override_settings(AUTH0_JWKS_URL=self.server.jwks_url):
+            user, _ = Auth0JSONWebTokenAuthentication().authenticate(request)
+        self.assertEqual(user.auth0_sub, 'auth0|bench-1')
+        self.assertEqual(self.server.fake.requests, 1)
+
+
+class Auth0UserTests(TestCase):
+    def setUp(self):
+        authentication._user_ids.clear()
+        self.payload = {'sub': 'google-oauth2|42', 'email': 'a@example.com', 'name': 'Ann'}
+
+    def test_principal_needs_no_queries(self):
+        with self.assertNumQueries(0):
+            user = Auth0JSONWebTokenAuthentication().get_or_create_user(self.payload)
+        self.assertTrue(user.is_authenticated)
+        self.assertEqual(user.username, 'google-oauth2_42')
+        self.assertEqual(user.name, 'Ann')
+
+    def test_django_user_is_created_lazily_without_hashing(self):
+        principal = authentication.Auth0User(self.payload)
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.encode') as encode:
+            django_user = principal.get_django_user()
+        encode.assert_not_called()
+        self.assertFalse(django_user.has_usable_password())
+        self.assertEqual(django_user.email, 'a@example.com')
+
+        with self.assertNumQueries(0):
+            user_id = authentication.Auth0User(self.payload).get_django_user_id()
+        self.assertEqual(user_id, django_user.pk)
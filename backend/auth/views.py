@@ -1,39 +1,58 @@
+import logging
+
 from django.http import HttpResponse
 from django.shortcuts import render
 from django.conf import settings
-from authlib.integrations.django_client import OAuth
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import auth
+from backend.instrumentation import track
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
-oauth = OAuth()
+_oauth = None
+
+
+def get_oauth():
+    """
+    Return the Auth0 OAuth registry, building it on first use. authlib is
+    only imported here, so processes that never handle a login (API
+    workers, management commands) don't pay for it at startup.
+    """
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.django_client import OAuth
 
-oauth.register(
-    "auth0",
-    client_id=settings.AUTH0_CLIENT_ID,
-    client_secret=settings.AUTH0_CLIENT_SECRET,
-    client_kwargs={
-        "scope": "openid profile email",
-    },
-    server_metadata_url=(f"https://{settings.AUTH0_DOMAIN}/"+
-        ".well-known/openid-configuration"),
-    authorize_params={
-        "audience": settings.AUTH0_AUDIENCE,  # Request JWT access token for API
-    },
-)
+        oauth = OAuth()
+        oauth.register(
+            "auth0",
+            client_id=settings.AUTH0_CLIENT_ID,
+            client_secret=settings.AUTH0_CLIENT_SECRET,
+            client_kwargs={
+                "scope": "openid profile email",
+            },
+            server_metadata_url=(f"https://{settings.AUTH0_DOMAIN}/"+
+                ".well-known/openid-configuration"),
+            authorize_params={
+                "audience": settings.AUTH0_AUDIENCE,  # Request JWT access token for API
+            },
+        )
+        _oauth = oauth
+    return _oauth
 
 def callback(request):
     try:
         # Get the access token from Auth0
-        token = oauth.auth0.authorize_access_token(request)
+        with track('auth0', service='auth0'):
+            token = get_oauth().auth0.authorize_access_token(request)
         
         # Extract the access token (JWT) and user info
         access_token = token.get('access_token')
         id_token = token.get('id_token')
         user_info = token.get('userinfo')
         
-        print(f"User info from Auth0: {user_info}")
+        logger.debug("auth0 callback", extra={'sub': (user_info or {}).get('sub')})
         
         if access_token and user_info:
             # Extract user details
@@ -55,11 +74,12 @@ def callback(request):
         
         return HttpResponse("Authentication failed - no token received", status=400)
     except Exception as e:
-        print(f"Auth callback error: {e}")
+        logger.exception("auth0 callback failed")
         return HttpResponse(f"Authentication error: {str(e)}", status=400)
 
 def login(request):
-    return oauth.auth0.authorize_redirect(
-        request,
-        request.build_absolute_uri(reverse("callback")),
-    )
\ No newline at end of file
+    with track('auth0', service='auth0'):  # Fetches the OIDC metadata on first use
+        return get_oauth().auth0.authorize_redirect(
+            request,
+            request.build_absolute_uri(reverse("callback")),
+        )
\ No newline at end of file
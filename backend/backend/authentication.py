@@ -1,30 +1,151 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
 import jwt
 import requests
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.http import JsonResponse
 from rest_framework import authentication
 from rest_framework import exceptions
 from django.conf import settings
-from functools import lru_cache
 
+from .instrumentation import track
 
-class Auth0JSONWebTokenAuthentication(authentication.BaseAuthentication):
+
+class JWKSStore:
     """
-    Custom DRF authentication class that validates Auth0 JWT tokens.
+    Process-wide cache of Auth0's signing keys.
+
+    Keys are parsed into RSA key objects once per fetch. The key set is
+    refreshed in the background once it gets close to its TTL, and a token
+    with an unknown `kid` triggers a refetch at most once per
+    AUTH0_JWKS_MIN_REFETCH_INTERVAL seconds (covers key rotation without
+    letting bad tokens hammer Auth0).
     """
-    
-    @lru_cache(maxsize=1)
-    def get_jwks(self):
-        """
-        Fetch the JSON Web Key Set (JWKS) from Auth0.
-        Cached to avoid repeated requests.
-        """
-        jwks_url = f"https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json"
+
+    def __init__(self):
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._last_refetch = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _fetch(self):
         try:
-            response = requests.get(jwks_url, timeout=10)
+            with track('auth0', service='auth0'):
+                response = requests.get(settings.AUTH0_JWKS_URL, timeout=10)
             response.raise_for_status()
-            return response.json()
+            jwks = response.json()
         except Exception as e:
             raise exceptions.AuthenticationFailed(f"Unable to fetch JWKS: {str(e)}")
+
+        keys = {}
+        for key in jwks.get('keys', []):
+            if key.get('kid'):
+                keys[key['kid']] = jwt.algorithms.RSAAlgorithm.from_jwk(key)
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch()
+        except exceptions.AuthenticationFailed:
+            pass  # Keep serving the keys we have; the next call retries
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        with self._lock:
+            self._fetch()
+
+    def get_key(self, kid):
+        ttl = settings.AUTH0_JWKS_TTL
+        age = time.monotonic() - self._fetched_at
+
+        if not self._keys or age > ttl:
+            with self._lock:
+                if not self._keys or time.monotonic() - self._fetched_at > ttl:
+                    self._fetch()
+        elif age > ttl * 0.8 and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+        key = self._keys.get(kid)
+        if key is None:
+            # Possibly a rotated key - refetch, but rate limited
+            with self._lock:
+                now = time.monotonic()
+                if kid not in self._keys and now - self._last_refetch >= settings.AUTH0_JWKS_MIN_REFETCH_INTERVAL:
+                    self._last_refetch = now
+                    self._fetch()
+            key = self._keys.get(kid)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = 0.0
+            self._last_refetch = 0.0
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of already-verified token payloads, keyed by the token's
+    SHA-256 and dropped once the token's `exp` has passed. A hit skips the
+    RSA signature check entirely.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        key = self.key_for(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, token, payload):
+        expires_at = payload.get('exp')
+        if not expires_at or self.maxsize <= 0:
+            return
+        key = self.key_for(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+jwks_store = JWKSStore()
+verified_tokens = VerifiedTokenCache(settings.AUTH0_TOKEN_CACHE_SIZE)
+
+
+class Auth0JSONWebTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Custom DRF authentication class that validates Auth0 JWT tokens.
+    """
     
     def get_signing_key(self, token):
         """
@@ -38,18 +159,38 @@ class Auth0JSONWebTokenAuthentication(authentication.BaseAuthentication):
             if not kid:
                 raise exceptions.AuthenticationFailed("Token missing 'kid' in header")
             
-            # Get JWKS and find the matching key
-            jwks = self.get_jwks()
-            
-            for key in jwks.get('keys', []):
-                if key.get('kid') == kid:
-                    return jwt.algorithms.RSAAlgorithm.from_jwk(key)
-            
-            raise exceptions.AuthenticationFailed("Unable to find matching key in JWKS")
+            # Look the key up in the process-wide JWKS cache
+            signing_key = jwks_store.get_key(kid)
+            if signing_key is None:
+                raise exceptions.AuthenticationFailed("Unable to find matching key in JWKS")
+            return signing_key
             
         except jwt.DecodeError as e:
             raise exceptions.AuthenticationFailed(f"Invalid token header: {str(e)}")
     
+    def decode_token(self, token):
+        """
+        Verify and decode the token, reusing the result of an earlier
+        verification of the same token while it is still valid.
+        """
+        payload = verified_tokens.get(token)
+        if payload is not None:
+            return payload
+
+        # Get the signing key
+        signing_key = self.get_signing_key(token)
+
+        # Verify and decode the token
+        payload = jwt.decode(
+            token,
+            signing_key,
+            algorithms=['RS256'],
+            audience=settings.AUTH0_AUDIENCE,
+            issuer=f"https://{settings.AUTH0_DOMAIN}/"
+        )
+        verified_tokens.set(token, payload)
+        return payload
+
     def authenticate(self, request):
         """
         Authenticate the request by validating the JWT token.
@@ -69,17 +210,7 @@ class Auth0JSONWebTokenAuthentication(authentication.BaseAuthentication):
         token = parts[1]
         
         try:
-            # Get the signing key
-            signing_key = self.get_signing_key(token)
-            
-            # Verify and decode the token
-            payload = jwt.decode(
-                token,
-                signing_key,
-                algorithms=['RS256'],
-                audience=settings.AUTH0_AUDIENCE,
-                issuer=f"https://{settings.AUTH0_DOMAIN}/"
-            )
+            payload = self.decode_token(token)
             
             # Extract user information from token
             user_sub = payload.get('sub')  # Auth0 user ID (e.g., "google-oauth2|123456")
@@ -105,28 +236,97 @@ class Auth0JSONWebTokenAuthentication(authentication.BaseAuthentication):
     
     def get_or_create_user(self, payload):
         """
-        Get or create a Django user from the JWT payload.
+        Build the request principal from the JWT payload. No database access
+        happens here; see Auth0User.get_django_user for paths that need a row.
         """
-        user_sub = payload.get('sub')
-        
+        return Auth0User(payload)
+
+
+# username -> Django user id, filled the first time a principal needs its row
+_user_ids = {}
+USER_ID_CACHE_SIZE = 10000
+
+
+class Auth0User:
+    """
+    Stateless principal built straight from verified token claims.
+
+    Most endpoints only need the Auth0 `sub`, email and name, which are all
+    in the token, so authenticating a request costs no database queries.
+    Code that really needs a Django User calls get_django_user(), which
+    creates the row on first use.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, payload):
+        self.auth0_sub = payload['sub']
         # Replace pipe character with underscore for Django username
-        username = user_sub.replace('|', '_')
-        
-        # Try to get existing user
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            # Create new user
-            user = User.objects.create_user(
-                username=username,
-                email=payload.get('email', ''),
-                first_name=payload.get('given_name', ''),
-                last_name=payload.get('family_name', '')
+        self.username = self.auth0_sub.replace('|', '_')
+        self.email = payload.get('email', '')
+        self.first_name = payload.get('given_name', '')
+        self.last_name = payload.get('family_name', '')
+        self.name = payload.get('name', f"{self.first_name} {self.last_name}".strip())
+        self._django_user = None
+
+    def __str__(self):
+        return self.username
+
+    def get_username(self):
+        return self.username
+
+    def get_django_user_id(self):
+        """
+        Return the id of the Django User row for this principal, creating the
+        row on first use. New rows get an unusable password so the password
+        hasher never runs. The id is cached in-process, so repeat calls cost
+        no queries.
+        """
+        user_id = _user_ids.get(self.username)
+        if user_id is None:
+            user, _ = User.objects.get_or_create(
+                username=self.username,
+                defaults={
+                    'email': self.email,
+                    'first_name': self.first_name,
+                    'last_name': self.last_name,
+                    'password': make_password(None),
+                },
             )
-        
-        # Store additional user info as attributes (not saved to DB)
-        user.auth0_sub = user_sub
-        user.email = payload.get('email', user.email)
-        user.name = payload.get('name', f"{user.first_name} {user.last_name}".strip())
-        
-        return user
+            if len(_user_ids) >= USER_ID_CACHE_SIZE:
+                _user_ids.clear()
+            user_id = _user_ids[self.username] = user.pk
+            self._django_user = user
+        return user_id
+
+    def get_django_user(self):
+        if self._django_user is None:
+            user_id = self.get_django_user_id()
+            self._django_user = User.objects.filter(pk=user_id).first()
+            if self._django_user is None:
+                # Row was deleted since we cached its id
+                _user_ids.pop(self.username, None)
+                return self.get_django_user()
+        return self._django_user
+
+
+def jwt_required(view):
+    """
+    Authenticate an async (non-DRF) view with Auth0JSONWebTokenAuthentication,
+    answering like DRF's IsAuthenticated would when it fails.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            # May fetch JWKS over HTTP on a cold cache, so keep it off the loop
+            result = await sync_to_async(Auth0JSONWebTokenAuthentication().authenticate)(request)
+        except exceptions.AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=403)
+        if result is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+        request.user, request.auth = result
+        return await view(request, *args, **kwargs)
+    return wrapper
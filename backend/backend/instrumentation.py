@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+
+class RequestTimings:
+    """
+    Time spent by one request, split by where it went. Durations are in
+    seconds; `spans` holds outbound calls and serialization by name.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = [f'total;dur={total * 1000:.1f}', f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        return ', '.join(entries)
+
+
+# The timings of the request being handled. A ContextVar, so it follows the
+# request into sync_to_async threads and stays separate per asyncio task.
+_current = ContextVar('request_timings', default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def track(name, service=None):
+    """
+    Time a block and add it to the current request as span `name`. With
+    `service`, it is also recorded as an outbound call, even outside a request
+    (e.g. from the reconciliation worker).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+        if service is not None:
+            metrics.outbound_duration.observe(elapsed, service=service)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_time += time.perf_counter() - started
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+# Every connection, including ones opened later in other threads, counts its
+# queries towards the request that ran them
+connection_created.connect(_install)
+for _connection in connections.all(initialized_only=True):
+    _install(_connection)
@@ -0,0 +1,68 @@
+"""
+Structured logging that stays off the request path.
+
+Records are formatted as one JSON object per line and handed to a queue; a
+background thread writes them out, so a slow stdout/stderr never blocks a
+request. Below WARNING, only a LOG_SAMPLE_RATE fraction of records is kept.
+Configured through LOGGING in settings.py.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keep every WARNING and above, and a `rate` fraction of everything else.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class BufferedStreamHandler(QueueHandler):
+    """
+    Queue records for a background thread that writes them to `stream`
+    (stderr by default). When the queue is full, records are dropped rather
+    than making the caller wait.
+    """
+
+    def __init__(self, stream=None, capacity=10000):
+        super().__init__(queue.Queue(capacity))
+        self.dropped = 0
+        target = logging.StreamHandler(stream or sys.stderr)  # Writes the message preformatted by prepare()
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,120 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+
+# Prometheus-style metrics kept in process memory and served by /metrics.
+# Every worker process has its own registry; scrape each one (or sum them)
+# when running several.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_labels(self.labels, key)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), values):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels((*self.labels, "le"), (*key, bound))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, key)} {values[-1]}'
+            yield f'{self.name}_count{_labels(self.labels, key)} {cumulative}'
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Wall time spent handling requests', ('view', 'method'),
+)
+requests_total = Counter('http_requests_total', 'Requests handled', ('view', 'method', 'status'))
+db_duration = Histogram('http_request_db_duration_seconds', 'Database time per request', ('view',))
+db_queries_total = Counter('http_request_db_queries_total', 'Database queries run by requests', ('view',))
+serialize_duration = Histogram('http_request_serialize_duration_seconds', 'JSON encoding time per request', ('view',))
+outbound_duration = Histogram(
+    'outbound_request_duration_seconds', 'Time spent calling external services', ('service',),
+)
+db_pool_wait = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled database connection', ('database',),
+)
+throttled_total = Counter('http_requests_throttled_total', 'Requests rejected by the rate limiter', ('scope',))
+coalesced_total = Counter(
+    'catalog_requests_coalesced_total', 'Catalog requests answered by a concurrent identical request', ('view',),
+)
+
+REGISTRY = (
+    request_duration, requests_total, db_duration, db_queries_total, serialize_duration, outbound_duration,
+    db_pool_wait, throttled_total, coalesced_total,
+)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this process's metrics. Requires
+    `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set; with
+    no token it is only served when DEBUG is on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
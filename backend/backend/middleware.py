@@ -0,0 +1,110 @@
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+from .instrumentation import end_request, start_request
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is used without it
+    brotli = None
+
+
+accepts_brotli = re.compile(r'\bbr\b').search
+
+# Brotli level 5 compresses about as well as gzip -9 at a fraction of the CPU
+BROTLI_QUALITY = 5
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses with Brotli when the client accepts it (and the
+    brotli package is installed), otherwise with gzip. Only installed when
+    RESPONSE_COMPRESSION is set; it lists the encodings to offer, e.g. "br,gzip".
+    """
+
+    def process_response(self, request, response):
+        encodings = settings.RESPONSE_COMPRESSION
+        if (
+            brotli is not None and 'br' in encodings
+            and not response.streaming
+            and accepts_brotli(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return self.compress_brotli(response)
+        if 'gzip' in encodings:
+            return super().process_response(request, response)
+        return response
+
+    def compress_brotli(self, response):
+        # Same rules as GZipMiddleware: skip tiny or already encoded bodies
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        # The body changed, so a strong ETag no longer holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'br'
+        return response
+
+
+class InstrumentationMiddleware:
+    """
+    Record each request's wall time, database queries and time, outbound
+    calls (Khalti, Auth0) and JSON encoding time into the /metrics
+    histograms, and report them in a Server-Timing header when
+    SERVER_TIMING_HEADER is on. Works for both sync and async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+
+        metrics.request_duration.observe(total, view=view, method=request.method)
+        metrics.requests_total.inc(view=view, method=request.method, status=response.status_code)
+        metrics.db_duration.observe(timings.db_time, view=view)
+        metrics.db_queries_total.inc(timings.db_queries, view=view)
+        if 'serialize' in timings.spans:
+            metrics.serialize_duration.observe(timings.spans['serialize'], view=view)
+
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
@@ -0,0 +1,72 @@
+"""
+PostgreSQL backend that takes its connections from a per-process pool.
+
+Django's own backend opens one connection per thread and keeps it for
+CONN_MAX_AGE; under ASGI every sync_to_async thread holds its own, so the
+number of server connections follows the number of threads. Here Django
+"closes" a connection at the end of each request (CONN_MAX_AGE = 0) and it
+goes back to a pool of at most POOL['max_size'] connections per database,
+which any thread can pick up. Enabled with DATABASE_POOL=True; see
+settings.py.
+"""
+import threading
+import time
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from backend import metrics
+from .pool import ConnectionPool
+
+# Database alias -> ConnectionPool
+_pools = {}
+_pools_lock = threading.Lock()
+
+# connection.info.transaction_status values, the same in psycopg2 and psycopg 3
+TRANSACTION_IDLE = 0
+TRANSACTION_UNKNOWN = 4
+
+
+def reset_connection(connection):
+    """
+    Roll back whatever the returned connection left open; broken ones are
+    not reused.
+    """
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == TRANSACTION_UNKNOWN:
+        return False
+    if status != TRANSACTION_IDLE:
+        connection.rollback()
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _get_or_create_pool(self, conn_params):
+        pool = _pools.get(self.alias)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(self.alias)
+                if pool is None:
+                    connect = lambda: base.DatabaseWrapper.get_new_connection(self, conn_params)
+                    pool = _pools[self.alias] = ConnectionPool(
+                        connect, reset=reset_connection, **self.settings_dict.get('POOL', {}),
+                    )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_or_create_pool(conn_params)
+        started = time.perf_counter()
+        connection = pool.getconn()
+        metrics.db_pool_wait.observe(time.perf_counter() - started, database=self.alias)
+        # Normally set by the parent's get_new_connection, which only ran for
+        # whichever wrapper opened the connection
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = IsolationLevel.READ_COMMITTED if isolation_level is None else IsolationLevel(isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # Hand the connection back instead of closing it
+            _pools[self.alias].putconn(self.connection)
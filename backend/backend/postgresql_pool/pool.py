@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections shared by every thread (and so
+    every sync_to_async task) of a process.
+
+    At most `max_size` connections are checked out at once; getconn() waits
+    up to `timeout` seconds for one to come back before raising PoolTimeout.
+    Idle connections are reused newest first and closed once they are older
+    than `max_lifetime`. `reset(connection)` runs when a connection is
+    returned and decides whether it can be reused.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10.0, max_lifetime=3600.0, reset=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.reset = reset
+        self._idle = deque()
+        self._opened_at = {}  # connection -> time.monotonic() when opened
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def _expired(self, connection):
+        return time.monotonic() - self._opened_at.get(connection, 0) > self.max_lifetime
+
+    def _discard(self, connection):
+        with self._lock:
+            self._opened_at.pop(connection, None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection became free within {self.timeout}s')
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    connection = self.connect()
+                    with self._lock:
+                        self._opened_at[connection] = time.monotonic()
+                    return connection
+                if not self._expired(connection):
+                    return connection
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, connection, discard=False):
+        try:
+            if not discard and not self._expired(connection):
+                try:
+                    discard = self.reset is not None and not self.reset(connection)
+                except Exception:
+                    discard = True
+            if discard or self._expired(connection):
+                self._discard(connection)
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """
+        Close the idle connections. Checked out ones are closed when returned.
+        """
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {'open': len(self._opened_at), 'idle': len(self._idle), 'max_size': self.max_size}
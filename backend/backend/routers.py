@@ -0,0 +1,69 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+
+# Set by @read_replica for the duration of a view. A ContextVar, like the
+# request timings in instrumentation.py, so concurrent requests don't share it.
+_replica_scope = ContextVar('replica_scope', default=None)
+
+
+class ReplicaScope:
+    def __init__(self):
+        self.alias = random.choice(settings.DATABASE_REPLICAS)
+        self.pinned = False  # Set once the view writes; later reads go to the primary
+
+
+def read_replica(view):
+    """
+    Send the reads a view makes to one of DATABASE_REPLICAS (the same one
+    for the whole request). Only for views whose data may lag the primary by
+    the replication delay; anything that reads what it just wrote, like
+    khalti_verify, stays undecorated.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not settings.DATABASE_REPLICAS:
+            return view(*args, **kwargs)
+        token = _replica_scope.set(ReplicaScope())
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _replica_scope.reset(token)
+    return wrapper
+
+
+def use_primary():
+    """Send the rest of the current @read_replica view's reads to the primary."""
+    scope = _replica_scope.get()
+    if scope is not None:
+        scope.pinned = True
+
+
+class ReplicaRouter:
+    """
+    Reads inside @read_replica go to a replica until the view writes
+    something; everything else, and every write, goes to 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        scope = _replica_scope.get()
+        if scope is None:
+            return None
+        return 'default' if scope.pinned else scope.alias
+
+    def db_for_write(self, model, **hints):
+        scope = _replica_scope.get()
+        if scope is not None:
+            scope.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
@@ -10,10 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from decimal import Decimal
 from pathlib import Path
 import os
 from dotenv import load_dotenv
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -58,11 +60,13 @@ INSTALLED_APPS = [
     'corsheaders',
     'products',
     'khalti',
+    'cart',
     'cloudinary',
     'cloudinary_storage',
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,7 +77,15 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
 ]
+# Opt-in response compression: a comma separated list of encodings to offer,
+# e.g. "br,gzip" (Brotli needs the brotli package) or "gzip"
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', '')
+if RESPONSE_COMPRESSION:
+    # Before anything else that reads or changes the response body
+    MIDDLEWARE.insert(2, 'backend.middleware.CompressionMiddleware')
+
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -98,14 +110,30 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Pool PostgreSQL connections per process (backend/postgresql_pool) instead of
+# keeping one persistent connection per thread
+DATABASE_POOL = os.getenv('DATABASE_POOL', 'False') == 'True'
+DATABASE_POOL_OPTIONS = {
+    'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+    'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 10)),  # Seconds to wait for a free connection
+    'max_lifetime': float(os.getenv('DATABASE_POOL_MAX_LIFETIME', 3600)),
+}
+
+
+def database_from_url(url):
+    config = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+    if DATABASE_POOL and config['ENGINE'] == 'django.db.backends.postgresql':
+        # Connections go back to the pool at the end of each request
+        config.update(
+            ENGINE='backend.postgresql_pool', CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False, POOL=DATABASE_POOL_OPTIONS,
+        )
+    return config
+
+
 # Use PostgreSQL in production (when DATABASE_URL is set), SQLite for local development
 if os.getenv('DATABASE_URL'):
     DATABASES = {
-        'default': dj_database_url.config(
-            default=os.getenv('DATABASE_URL'),
-            conn_max_age=600,
-            conn_health_checks=True,
-        )
+        'default': database_from_url(os.getenv('DATABASE_URL')),
     }
 else:
     DATABASES = {
@@ -115,6 +143,55 @@ else:
         }
     }
 
+# Read replicas, comma separated. Views decorated with @read_replica
+# (backend/routers.py) read from them; writes always go to 'default'.
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {**database_from_url(url.strip()), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+# Seconds after a catalog write during which catalog cache misses are rendered
+# from the primary, so a replica that hasn't caught up can't get its stale
+# answer cached under the new catalog version. Set it above the usual
+# replication lag; a replica lagging longer can still serve (and cache) a
+# stale page until the next catalog write or CATALOG_CACHE_TIMEOUT.
+DATABASE_REPLICA_LAG = float(os.getenv('DATABASE_REPLICA_LAG', 5))
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+
+
+# Caches
+# The catalog cache holds rendered /products/ responses. locmem is per process;
+# use the file or redis backend when running several workers so that an admin
+# edit invalidates the cache for all of them.
+CATALOG_CACHE_BACKEND = os.getenv('CATALOG_CACHE_BACKEND', 'locmem')
+
+if CATALOG_CACHE_BACKEND == 'file':
+    CATALOG_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CATALOG_CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'catalog')),
+    }
+elif CATALOG_CACHE_BACKEND == 'redis':
+    CATALOG_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    }
+else:
+    CATALOG_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': CATALOG_CACHE,
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+# Upper bound on how long a cached response can live, in seconds
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -166,6 +243,11 @@ CLOUDINARY_STORAGE = {
     'API_KEY': os.environ.get('CLOUDINARY_API_KEY'),
     'API_SECRET': os.environ.get('CLOUDINARY_API_SECRET'),
 }
+# How Card image variants are made: 'cloudinary' uses URL transformations,
+# 'local' resizes with Pillow and stores the copies (no Cloudinary account needed)
+CARD_IMAGE_PIPELINE = os.getenv(
+    'CARD_IMAGE_PIPELINE', 'cloudinary' if CLOUDINARY_STORAGE['CLOUD_NAME'] else 'local'
+)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -174,16 +256,126 @@ AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN', 'dev-csffvmbg2hzm6jyq.us.auth0.com')
 AUTH0_AUDIENCE = os.getenv('AUTH0_AUDIENCE', 'https://shopping.com')  # Auth0 API identifier
 AUTH0_CLIENT_ID = os.getenv('AUTH0_CLIENT_ID')
 AUTH0_CLIENT_SECRET = os.getenv('AUTH0_CLIENT_SECRET')
+# Where signing keys are fetched from; point it at auth/fake_server.py for load tests
+AUTH0_JWKS_URL = os.getenv('AUTH0_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# JWKS cache lifetime and minimum delay between refetches for unknown key IDs (seconds)
+AUTH0_JWKS_TTL = int(os.getenv('AUTH0_JWKS_TTL', 3600))
+AUTH0_JWKS_MIN_REFETCH_INTERVAL = int(os.getenv('AUTH0_JWKS_MIN_REFETCH_INTERVAL', 30))
+# Number of verified tokens kept in memory to skip repeat signature checks
+AUTH0_TOKEN_CACHE_SIZE = int(os.getenv('AUTH0_TOKEN_CACHE_SIZE', 4096))
+
+# Khalti ePayment gateway (see khalti/gateway.py)
+# Use https://dev.khalti.com/api/v2/ for the sandbox, or the local fake server
+# (python -m khalti.fake_server) for offline testing
+KHALTI_BASE_URL = os.getenv('KHALTI_BASE_URL', 'https://a.khalti.com/api/v2/')
+KHALTI_SECRET_KEY = os.getenv('KHALTI_SECRET_KEY', 'live_secret_key_68791341fdd94846a146f0457ff7b455')
+KHALTI_TIMEOUT = float(os.getenv('KHALTI_TIMEOUT', 10))
+KHALTI_CONNECT_TIMEOUT = float(os.getenv('KHALTI_CONNECT_TIMEOUT', 3))
+KHALTI_POOL_SIZE = int(os.getenv('KHALTI_POOL_SIZE', 20))
+KHALTI_MAX_RETRIES = int(os.getenv('KHALTI_MAX_RETRIES', 2))
+KHALTI_RETRY_BACKOFF = float(os.getenv('KHALTI_RETRY_BACKOFF', 0.2))
+# Consecutive failures before the circuit opens, and seconds until it is retried
+KHALTI_BREAKER_THRESHOLD = int(os.getenv('KHALTI_BREAKER_THRESHOLD', 5))
+KHALTI_BREAKER_RESET = float(os.getenv('KHALTI_BREAKER_RESET', 30))
+
+# Payment reconciliation (python manage.py reconcile_payments)
+# Seconds after initiate before the worker first looks a payment up
+KHALTI_RECONCILE_INITIAL_DELAY = int(os.getenv('KHALTI_RECONCILE_INITIAL_DELAY', 60))
+KHALTI_RECONCILE_BATCH_SIZE = int(os.getenv('KHALTI_RECONCILE_BATCH_SIZE', 50))
+KHALTI_RECONCILE_CONCURRENCY = int(os.getenv('KHALTI_RECONCILE_CONCURRENCY', 10))
+# Worker sleep when there is nothing due, in seconds
+KHALTI_RECONCILE_INTERVAL = float(os.getenv('KHALTI_RECONCILE_INTERVAL', 5))
+KHALTI_RECONCILE_MAX_DELAY = int(os.getenv('KHALTI_RECONCILE_MAX_DELAY', 600))
+KHALTI_RECONCILE_MAX_ATTEMPTS = int(os.getenv('KHALTI_RECONCILE_MAX_ATTEMPTS', 30))
+# Minimum seconds between inline lookups triggered by khalti_verify for one payment
+KHALTI_VERIFY_MIN_INTERVAL = int(os.getenv('KHALTI_VERIFY_MIN_INTERVAL', 5))
+# Seconds an Idempotency-Key response is replayed for
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+# Seconds after which a request still holding its key is assumed to have died
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 120))
 
 # Frontend URL for Auth0 callback redirects
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'backend.authentication.Auth0JSONWebTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Proxies in front of the app, so rate limits key on the client's IP from
+    # X-Forwarded-For (1 on Render). 0 ignores the header, which clients can
+    # set to anything, and uses REMOTE_ADDR.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
+}
+
+# Instrumentation (backend/middleware.py, backend/metrics.py)
+# Send per-request timing breakdowns to clients in a Server-Timing header
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', str(DEBUG)) == 'True'
+# When set, /metrics requires "Authorization: Bearer <token>"; without one
+# it is only served when DEBUG is on
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Structured JSON logs, written from a background thread (backend/logs.py).
+# Below WARNING only LOG_SAMPLE_RATE of the records are kept.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'backend.logs.JSONFormatter'},
+    },
+    'filters': {
+        'sample': {'()': 'backend.logs.SampleFilter', 'rate': LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'buffered': {
+            'class': 'backend.logs.BufferedStreamHandler',
+            'formatter': 'json',
+            'filters': ['sample'],
+        },
+    },
+    'loggers': {
+        name: {'handlers': ['buffered'], 'level': LOG_LEVEL, 'propagate': False}
+        for name in ('auth', 'backend', 'cart', 'khalti', 'products')
+    },
 }
+
+# Startup warm-up (backend/warmup.py)
+# Run it when the WSGI/ASGI application loads, before serving requests
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'False') == 'True'
+# Comma separated subset of imports,jwks,oidc,catalog,suggest; empty means all
+WARMUP_STEPS = [step for step in os.getenv('WARMUP_STEPS', '').split(',') if step]
+# Scheme and host the warmed catalog pages are rendered for
+WARMUP_BASE_URL = os.getenv('WARMUP_BASE_URL', f'https://{ALLOWED_HOSTS[0]}')
+WARMUP_MAX_CATEGORY_PAGES = int(os.getenv('WARMUP_MAX_CATEGORY_PAGES', 20))
+
+# Catalog listing
+# Default and maximum number of cards returned per page by /products/cards/
+CATALOG_PAGE_SIZE = int(os.getenv('CATALOG_PAGE_SIZE', 50))
+CATALOG_MAX_PAGE_SIZE = int(os.getenv('CATALOG_MAX_PAGE_SIZE', 200))
+# Upper bounds of the price buckets counted by /products/cards/?facets=1
+CATALOG_PRICE_BUCKETS = [Decimal(bound) for bound in os.getenv('CATALOG_PRICE_BUCKETS', '10,25,50,100').split(',')]
+
+# Token-bucket rate limits for the public catalog endpoints (backend/throttling.py).
+# RATE is tokens refilled per second, BURST the bucket size. Signed-in users
+# are limited per Auth0 sub, everyone else per IP.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMIT_IP_RATE = float(os.getenv('RATE_LIMIT_IP_RATE', 10))
+RATE_LIMIT_IP_BURST = int(os.getenv('RATE_LIMIT_IP_BURST', 100))
+RATE_LIMIT_USER_RATE = float(os.getenv('RATE_LIMIT_USER_RATE', 20))
+RATE_LIMIT_USER_BURST = int(os.getenv('RATE_LIMIT_USER_BURST', 200))
+# Where buckets live: local (per worker process) or redis (shared, needs `pip install redis`)
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'local')
+RATE_LIMIT_REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1')
+
+# Purchase history page sizes for /khalti/history/
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 100))
@@ -0,0 +1,141 @@
+"""
+Token-bucket rate limiting for the public catalog endpoints.
+
+Every client gets a bucket of RATE_LIMIT_*_BURST tokens that refills at
+RATE_LIMIT_*_RATE tokens per second; a request takes one token and is
+answered 429 (with Retry-After) when the bucket is empty. Signed-in clients
+are keyed on their Auth0 `sub`, everyone else on their IP address.
+
+Buckets live in a store chosen by RATE_LIMIT_STORE: "local" keeps them in
+process memory (per worker), "redis" shares them between workers through
+REDIS_URL and updates each bucket atomically in a Lua script.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+
+class LocalBucketStore:
+    """
+    Buckets in an LRU dict, for a single process. At most `max_buckets` are
+    kept; evicting the least recently used one only hands that client a
+    full bucket again, so memory stays bounded however many keys show up.
+    """
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, updated at)
+
+    def take(self, key, rate, burst):
+        """
+        Take a token from the bucket at `key`. Returns 0 when one was
+        available, otherwise the seconds until there will be one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# KEYS[1] = bucket, ARGV = rate, burst, now. Returns the wait in ms (0 = allowed).
+_TAKE_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return wait
+"""
+
+
+class RedisBucketStore:
+    """Buckets in Redis hashes, shared by every worker."""
+
+    def __init__(self, url=None):
+        import redis  # Only needed for RATE_LIMIT_STORE=redis
+
+        self._client = redis.Redis.from_url(url or settings.RATE_LIMIT_REDIS_URL)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        # Redis' clock, so workers on different hosts agree on refills
+        seconds, microseconds = self._client.time()
+        wait_ms = self._take(keys=[f'ratelimit:{key}'], args=[rate, burst, seconds + microseconds / 1e6])
+        return int(wait_ms) / 1000
+
+    def clear(self):
+        for key in self._client.scan_iter('ratelimit:*'):
+            self._client.delete(key)
+
+
+STORES = {
+    'local': LocalBucketStore,
+    'redis': RedisBucketStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = STORES[settings.RATE_LIMIT_STORE]()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle backed by the configured bucket store. `scope` separates
+    buckets of endpoints that are limited independently.
+    """
+    scope = 'catalog'
+
+    def get_key(self, request):
+        sub = getattr(request.user, 'auth0_sub', None)
+        if sub:
+            return f'{self.scope}:sub:{sub}', settings.RATE_LIMIT_USER_RATE, settings.RATE_LIMIT_USER_BURST
+        # REMOTE_ADDR, unless NUM_PROXIES says how much of X-Forwarded-For
+        # was added by our own proxies
+        return f'{self.scope}:ip:{self.get_ident(request)}', settings.RATE_LIMIT_IP_RATE, settings.RATE_LIMIT_IP_BURST
+
+    def allow_request(self, request, view):
+        if not settings.RATE_LIMIT_ENABLED:
+            return True
+        key, rate, burst = self.get_key(request)
+        self._wait = get_store().take(key, rate, burst)
+        if self._wait:
+            metrics.throttled_total.inc(scope=self.scope)
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
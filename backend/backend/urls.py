@@ -20,10 +20,14 @@ from django.conf import settings
 from django.conf.urls.static import static
 import os
 
+from backend.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
     path('products/',include('products.urls')),
     path('khalti/',include('khalti.urls')),
+    path('cart/',include('cart.urls')),
     path('',include('auth.urls')),
 ]
 
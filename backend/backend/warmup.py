@@ -0,0 +1,109 @@
+"""
+Warm-up for freshly started processes.
+
+A new instance otherwise pays for JWKS, the Auth0 OIDC metadata, the lazily
+imported client libraries and an empty catalog cache on its first requests.
+Set WARMUP_ON_STARTUP=True to run these steps when the WSGI/ASGI application
+is loaded, so each worker warms its own in-process caches before taking
+traffic.
+
+With a shared catalog cache (CATALOG_CACHE_BACKEND=file or redis) the
+catalog pages can also be pre-filled once, e.g. as a release step:
+
+    python manage.py warmup
+"""
+import logging
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+
+# Libraries that are only imported on first use; see auth/views.py,
+# khalti/gateway.py and products/images.py
+LAZY_MODULES = ('authlib.integrations.django_client', 'httpx', 'PIL.Image')
+
+
+def warm_imports():
+    for name in LAZY_MODULES:
+        import_module(name)
+
+
+def warm_jwks():
+    from .authentication import jwks_store
+    jwks_store.refresh()
+
+
+def warm_oidc_metadata():
+    from auth.views import get_oauth
+    get_oauth().auth0.load_server_metadata()
+
+
+def catalog_paths():
+    """
+    The catalog URLs the frontend loads first: the category list, the first
+    page of cards and the first page of each category (up to
+    WARMUP_MAX_CATEGORY_PAGES of them).
+    """
+    from products.models import Category
+
+    yield '/products/categories/'
+    yield '/products/cards/'
+    category_ids = Category.objects.values_list('id', flat=True)[:settings.WARMUP_MAX_CATEGORY_PAGES]
+    for category_id in category_ids:
+        yield f'/products/cards/?category={category_id}'
+
+
+def warm_catalog():
+    """
+    Render the hot catalog pages through their views, which stores them in
+    the catalog cache exactly as a real request would.
+    """
+    from django.test import RequestFactory
+
+    base = urlsplit(settings.WARMUP_BASE_URL)
+    factory = RequestFactory(HTTP_HOST=base.netloc)
+    for path in catalog_paths():
+        request = factory.get(path, secure=base.scheme == 'https')
+        match = resolve(request.path_info)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+
+
+def warm_suggest_index():
+    from products.suggest import get_index
+    get_index()
+
+
+WARMUP_STEPS = {
+    'imports': warm_imports,
+    'jwks': warm_jwks,
+    'oidc': warm_oidc_metadata,
+    'catalog': warm_catalog,
+    'suggest': warm_suggest_index,
+}
+
+
+def warmup(steps=None):
+    """
+    Run the named warm-up steps (all by default) and return
+    {step: seconds taken, or the error message}. A failing step, e.g. Auth0
+    being unreachable, is logged and doesn't stop the others; the lazy paths
+    still work.
+    """
+    results = {}
+    for name in steps or WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            WARMUP_STEPS[name]()
+        except Exception as e:
+            results[name] = f'{type(e).__name__}: {e}'
+            logger.warning("warm-up step %s failed: %s", name, results[name])
+        else:
+            results[name] = time.perf_counter() - started
+    return results
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402 - needs the settings module set above
+
+if settings.WARMUP_ON_STARTUP:
+    from backend.warmup import warmup
+    warmup(settings.WARMUP_STEPS)
@@ -0,0 +1,221 @@
+"""
+asyncio load test for the products, cart, khalti and auth endpoints.
+
+Starts the ASGI app under uvicorn in a child process, with Khalti and Auth0
+replaced by the local stand-ins in khalti/fake_server.py and
+auth/fake_server.py, then runs --users virtual users for --duration seconds.
+Each user signs in with its own token and loops over weighted scenarios:
+browsing the catalog, searching, autocomplete, purchase history and a full
+cart -> initiate -> verify checkout. Run from the backend directory against a
+database filled by benchmarks.seed:
+
+    python -m benchmarks.load --users 20 --duration 30
+
+Reports p50/p95/p99 latency per request. benchmarks.run --load does the
+seeding and compares the numbers with the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.seed import ADJECTIVES, NOUNS, user_sub
+
+# Scenario -> relative weight
+SCENARIOS = {'browse': 50, 'search': 20, 'suggest': 15, 'history': 10, 'checkout': 5}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, client, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except Exception:
+            response = None
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        if response is None or response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return None
+        return response.json()
+
+    def summary(self, elapsed):
+        results = {}
+        for name, samples in sorted(self.latencies.items()):
+            cuts = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+            results[f'load.{name}'] = {
+                'p50_ms': cuts[49] * 1000,
+                'p95_ms': cuts[94] * 1000,
+                'p99_ms': cuts[98] * 1000,
+                'requests': len(samples),
+                'rps': len(samples) / elapsed,
+                'errors': self.errors.get(name, 0),
+            }
+        return results
+
+
+async def browse(client, recorder, context):
+    page = await recorder.request(client, 'cards', 'GET', '/products/cards/')
+    if page and page['next']:
+        await recorder.request(client, 'cards_next', 'GET', '/products/cards/', params={'cursor': page['next']})
+    await recorder.request(client, 'categories', 'GET', '/products/categories/')
+    await recorder.request(
+        client, 'cards_category', 'GET', '/products/cards/',
+        params={'category': random.choice(context['category_ids'])},
+    )
+
+
+async def search(client, recorder, context):
+    query = f'{random.choice(ADJECTIVES)} {random.choice(NOUNS)[:random.randint(3, 6)]}'
+    await recorder.request(client, 'search', 'GET', '/products/search/', params={'q': query})
+
+
+async def suggest(client, recorder, context):
+    noun = random.choice(NOUNS).lower()
+    for length in (2, 3, 4):  # As typed
+        await recorder.request(client, 'suggest', 'GET', '/products/suggest/', params={'q': noun[:length]})
+
+
+async def history(client, recorder, context):
+    await recorder.request(client, 'history', 'GET', '/khalti/history/', headers=context['auth'])
+
+
+async def checkout(client, recorder, context):
+    items = [{'id': card_id, 'quantity': 1} for card_id in random.sample(context['card_ids'], 2)]
+    headers = context['auth']
+    if not await recorder.request(client, 'cart_add', 'POST', '/cart/items/', json={'items': items}, headers=headers):
+        return
+    payment = await recorder.request(client, 'khalti_initiate', 'POST', '/khalti/initiate/', json={}, headers=headers)
+    if payment:
+        await recorder.request(
+            client, 'khalti_verify', 'POST', '/khalti/verify/', json={'pidx': payment['pidx']}, headers=headers,
+        )
+
+
+async def virtual_user(client, recorder, context, deadline):
+    names, weights = list(SCENARIOS), list(SCENARIOS.values())
+    scenarios = globals()
+    while time.monotonic() < deadline:
+        await scenarios[random.choices(names, weights)[0]](client, recorder, context)
+
+
+async def run_load(base_url, users, duration, tokens, card_ids, category_ids):
+    import httpx
+
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(client, recorder, {
+                'auth': {'Authorization': f'Bearer {tokens[n]}'},
+                'card_ids': card_ids,
+                'category_ids': category_ids,
+            }, deadline)
+            for n in range(users)
+        ))
+        return recorder.summary(time.perf_counter() - started)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(base_url, process, timeout=60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The server exited during startup')
+        try:
+            httpx.get(f'{base_url}/products/categories/', timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f'The server did not come up within {timeout}s')
+
+
+def run(users=10, duration=10, khalti_latency=0.05, seed=0):
+    """
+    Start the stand-ins and the app server, run the load and return
+    {'load.<request>': {p50_ms, p95_ms, p99_ms, requests, rps, errors}}.
+    """
+    from auth.fake_server import FakeAuth0Server
+    from khalti.fake_server import FakeKhaltiServer
+    from products.models import Card, Category
+
+    random.seed(seed)
+    card_ids = list(Card.objects.filter(price__gte=10).order_by('id').values_list('id', flat=True)[:1000])
+    category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+    auth0 = FakeAuth0Server().start()
+    khalti = FakeKhaltiServer(latency=khalti_latency).start()
+    port = free_port()
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'backend.settings',
+        'AUTH0_JWKS_URL': auth0.jwks_url,
+        'KHALTI_BASE_URL': khalti.base_url,
+        'KHALTI_SECRET_KEY': 'test_secret_key',
+        'WARMUP_ON_STARTUP': 'False',
+        'LOG_LEVEL': 'WARNING',
+        # Every virtual user comes from 127.0.0.1; measure capacity, not the limiter
+        'RATE_LIMIT_ENABLED': 'False',
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'backend.asgi:application',
+         '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+        env=env,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(base_url, server)
+        tokens = [auth0.fake.token(user_sub(n)) for n in range(users)]
+        return asyncio.run(run_load(base_url, users, duration, tokens, card_ids, category_ids))
+    finally:
+        server.terminate()
+        server.wait()
+        khalti.stop()
+        auth0.stop()
+
+
+def main():
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run for')
+    parser.add_argument('--khalti-latency', type=float, default=0.05, help='seconds each fake Khalti call takes')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the scenario mix')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.users, args.duration, args.khalti_latency, args.seed)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'request':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<28}{result['p50_ms']:10.1f}{result['p95_ms']:10.1f}{result['p99_ms']:10.1f}"
+            f"{result['rps']:10.1f}{result['errors']:8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
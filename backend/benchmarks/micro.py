@@ -0,0 +1,173 @@
+"""
+Micro-benchmarks for the hot paths of the products, khalti and auth apps.
+
+Each benchmark reports the median wall time of one call in milliseconds and
+the number of SQL queries it ran. Tokens are signed by the local Auth0
+stand-in in auth/fake_server.py, so nothing leaves the machine. Run from the
+backend directory against a database filled by benchmarks.seed:
+
+    python -m benchmarks.micro --repeat 50
+
+benchmarks.run does both and compares the results with the baseline.
+"""
+import argparse
+import json
+import statistics
+import time
+
+
+def measure(func, repeat, setup=None):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    # One untimed call first, so lazy imports and connection setup don't count
+    if setup:
+        setup()
+    func()
+    timings, queries = [], 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        queries = max(queries, len(context.captured_queries))
+    return {'ms': statistics.median(timings) * 1000, 'queries': queries}
+
+
+def serializer_benchmarks(request, page_size):
+    from products.models import Card
+    from products.serializers import CardSerializer, card_rows, serialize_card_rows
+
+    cards = Card.objects.select_related('category').order_by('id')
+    return {
+        'serializer.card_serializer': lambda: CardSerializer(
+            cards[:page_size], many=True, context={'request': request},
+        ).data,
+        'serializer.flat_rows': lambda: serialize_card_rows(card_rows(cards)[:page_size], request),
+        'serializer.sparse_rows': lambda: serialize_card_rows(
+            card_rows(cards, ['id', 'name', 'price'])[:page_size], request, ['id', 'name', 'price'],
+        ),
+    }
+
+
+def jwt_benchmarks(token):
+    from django.test import RequestFactory
+
+    from backend import authentication
+
+    auth = authentication.Auth0JSONWebTokenAuthentication()
+    request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+    return {
+        # Signature check every time (what each new token costs)
+        'jwt.verify': (lambda: auth.decode_token(token), authentication.verified_tokens.clear),
+        # Same token again, answered from the verified-token cache
+        'jwt.verify_cached': lambda: auth.decode_token(token),
+        'jwt.authenticate': lambda: auth.authenticate(request),
+    }
+
+
+def search_benchmarks():
+    from products import search
+    from products.suggest import suggest
+
+    return {
+        'search.two_words': lambda: search.search_card_ids('golden dragon', 20),
+        'search.prefix': lambda: search.search_card_ids('phoe', 20),
+        'suggest.trigram': lambda: suggest('drag', 10),
+    }
+
+
+def endpoint_benchmarks(client, token, category_id):
+    from django.core.cache import caches
+
+    clear_catalog = caches['catalog'].clear
+    auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+    catalog = {
+        'cards': '/products/cards/',
+        'cards_by_price': '/products/cards/?ordering=price',
+        'cards_sparse': '/products/cards/?fields=id,name,price',
+        'cards_category': f'/products/cards/?category={category_id}',
+        'cards_filtered': f'/products/cards/?category={category_id}&min_price=50&max_price=200&ordering=-price&facets=1',
+        'categories': '/products/categories/',
+        'search': '/products/search/?q=golden+dragon',
+        'suggest': '/products/suggest/?q=drag',
+        'bestsellers': '/products/bestsellers/',
+    }
+    benchmarks = {}
+    for name, path in catalog.items():
+        benchmarks[f'endpoint.{name}'] = (lambda path=path: client.get(path), clear_catalog)
+        benchmarks[f'endpoint.{name}_cached'] = lambda path=path: client.get(path)
+    benchmarks['endpoint.history'] = lambda: client.get('/khalti/history/', **auth)
+    benchmarks['endpoint.history_summary'] = lambda: client.get('/khalti/history/?summary=1', **auth)
+    benchmarks['endpoint.cart'] = lambda: client.get('/cart/', **auth)
+    return benchmarks
+
+
+def run(repeat=30, page_size=24, only=None):
+    """
+    Run the micro-benchmarks (those whose name starts with one of `only`, or
+    all) and return {name: {'ms': ..., 'queries': ...}}.
+    """
+    from django.test import Client, RequestFactory, override_settings
+
+    from auth.fake_server import FakeAuth0Server
+    from backend import authentication
+    from benchmarks.seed import user_sub
+    from products.models import Category
+
+    server = FakeAuth0Server().start()
+    try:
+        with override_settings(
+            AUTH0_JWKS_URL=server.jwks_url, ALLOWED_HOSTS=['localhost', 'testserver'], RATE_LIMIT_ENABLED=False,
+        ):
+            authentication.jwks_store.clear()
+            authentication.verified_tokens.clear()
+            token = server.fake.token(user_sub(0))
+            request = RequestFactory().get('/products/cards/', HTTP_HOST='localhost')
+            category_id = Category.objects.order_by('id').values_list('id', flat=True).first()
+
+            benchmarks = {
+                **serializer_benchmarks(request, page_size),
+                **jwt_benchmarks(token),
+                **search_benchmarks(),
+                **endpoint_benchmarks(Client(HTTP_HOST='localhost'), token, category_id),
+            }
+            results = {}
+            for name, benchmark in benchmarks.items():
+                if only and not name.startswith(tuple(only)):
+                    continue
+                func, setup = benchmark if isinstance(benchmark, tuple) else (benchmark, None)
+                results[name] = measure(func, repeat, setup)
+            return results
+    finally:
+        server.stop()
+
+
+def main():
+    import os
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=30, help='timed calls per benchmark')
+    parser.add_argument('--page-size', type=int, default=24, help='cards per serializer benchmark')
+    parser.add_argument('--only', action='append', help='only run benchmarks starting with this prefix')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.page_size, args.only)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'benchmark':<36}{'median ms':>12}{'queries':>10}")
+    for name, result in results.items():
+        print(f"{name:<36}{result['ms']:12.3f}{result['queries']:10}")
+
+
+if __name__ == '__main__':
+    main()
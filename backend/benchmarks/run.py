@@ -0,0 +1,155 @@
+"""
+Run the benchmark suite and fail on regressions against the stored baseline.
+
+Seeds a throwaway SQLite database with --cards cards (see benchmarks.seed),
+runs benchmarks.micro and, with --load, benchmarks.load, then compares the
+results with benchmarks/baseline.json:
+
+- query counts must not go up at all,
+- latencies may be up to --tolerance slower (plus --slack-ms, so sub-millisecond
+  noise doesn't count),
+- load test error rates may not grow by more than --max-error-increase.
+
+Exits with status 1 when anything regressed. Run from the backend directory:
+
+    python -m benchmarks.run                      # compare
+    python -m benchmarks.run --update-baseline    # accept the current numbers
+
+Latencies depend on the machine, so refresh the baseline on the machine that
+runs the comparison. The committed baseline has no load test numbers; record
+them with --load --update-baseline where the load test runs. Results are
+stored per data set size; pass --cards 10000 (up to 1000000) to benchmark
+larger catalogs. Use --database-url to run against an existing, already
+seeded database, e.g. Postgres; SQLite serializes writes, so checkout
+requests in the load test can fail with "database is locked" there.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BASELINE = Path(__file__).with_name('baseline.json')
+
+
+def compare(baseline, results, tolerance=0.5, slack_ms=0.5, max_error_increase=0.05):
+    """
+    Return a list of (benchmark, metric, baseline value, current value) that
+    regressed. Benchmarks missing from `results` count as regressions.
+    """
+    regressions = []
+    for name, expected in baseline.items():
+        current = results.get(name)
+        if current is None:
+            regressions.append((name, 'missing', None, None))
+            continue
+        for metric, old in expected.items():
+            new = current.get(metric)
+            if new is None:
+                continue
+            if metric == 'queries':
+                regressed = new > old
+            elif metric == 'ms' or metric.endswith('_ms'):
+                regressed = new > old * (1 + tolerance) + slack_ms
+            elif metric == 'errors':
+                old_rate = old / max(expected.get('requests', 1), 1)
+                new_rate = new / max(current.get('requests', 1), 1)
+                regressed = new_rate > old_rate + max_error_increase
+            else:
+                continue  # Throughput and counts are informational
+            if regressed:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def child(module, env, *args):
+    out = subprocess.run(
+        [sys.executable, '-m', module, '--json', *args], check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def collect(args, env):
+    results = child('benchmarks.micro', env, '--repeat', str(args.repeat))
+    if args.load:
+        results.update(child('benchmarks.load', env, '--users', str(args.users), '--duration', str(args.duration)))
+    return results
+
+
+def print_results(results, baseline):
+    print(f"{'benchmark':<36}{'metric':>10}{'baseline':>12}{'current':>12}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            if metric in ('requests', 'rps'):
+                continue
+            old = baseline.get(name, {}).get(metric)
+            old = '-' if old is None else f'{old:.2f}' if isinstance(old, float) else str(old)
+            new = f'{value:.2f}' if isinstance(value, float) else str(value)
+            print(f'{name:<36}{metric:>10}{old:>12}{new:>12}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, default=1000, help='size of the seeded data set')
+    parser.add_argument('--repeat', type=int, default=30, help='timed calls per micro-benchmark')
+    parser.add_argument('--load', action='store_true', help='also run the load test')
+    parser.add_argument('--users', type=int, default=10, help='load test virtual users')
+    parser.add_argument('--duration', type=float, default=10, help='load test seconds')
+    parser.add_argument('--database-url', help='existing, seeded database to use instead of a temporary one')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed latency increase, 0.5 = 50%%')
+    parser.add_argument('--slack-ms', type=float, default=0.5, help='latency increase always allowed, in ms')
+    parser.add_argument('--max-error-increase', type=float, default=0.05, help='allowed error rate increase')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args()
+
+    env = {
+        **os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings',
+        'WARMUP_ON_STARTUP': 'False', 'CATALOG_CACHE_BACKEND': 'locmem',
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url:
+            env['DATABASE_URL'] = args.database_url
+        else:
+            env['DATABASE_URL'] = f'sqlite:///{tmp}/bench.sqlite3?timeout=20'
+            subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], check=True, env=env)
+            subprocess.run([sys.executable, '-m', 'benchmarks.seed', '--cards', str(args.cards)], check=True, env=env)
+        results = collect(args, env)
+
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    scale = str(args.cards)
+    baseline = stored.get(scale, {})
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        # Without --load, keep whatever load numbers were stored before
+        kept = {name: metrics for name, metrics in baseline.items() if name.startswith('load.') and not args.load}
+        stored[scale] = {
+            **kept,
+            **{
+                name: {metric: round(value, 3) for metric, value in metrics.items()}
+                for name, metrics in results.items()
+            },
+        }
+        args.baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + '\n')
+        print(f'Baseline for {scale} cards written to {args.baseline}')
+        return
+    if not baseline:
+        print(f'No baseline for {scale} cards; run with --update-baseline to create one')
+        return
+
+    # Only compare what was run this time (e.g. the load test is optional)
+    ran = {name: metrics for name, metrics in baseline.items() if args.load or not name.startswith('load.')}
+    regressions = compare(ran, results, args.tolerance, args.slack_ms, args.max_error_increase)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s):')
+        for name, metric, old, new in regressions:
+            print(f'  {name} {metric}: {old} -> {new}')
+        sys.exit(1)
+    print('\nNo regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Seeded data generator for benchmarks and load tests.
+
+Fills the configured database with cards, categories and a purchase history
+shaped like real traffic: a few cards sell most of the units (Pareto
+popularity), purchases have 1-5 lines and are spread over the last year.
+The same --random-seed always produces the same data. Run from the backend
+directory against an empty, migrated database:
+
+    DATABASE_URL=sqlite:////tmp/bench.sqlite3 python -m benchmarks.seed --cards 100000
+
+Rows are bulk inserted, so no signals fire; the search index, category
+counts and sales rollups are rebuilt once at the end instead.
+"""
+import argparse
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+ADJECTIVES = (
+    'Ancient', 'Blazing', 'Crimson', 'Dark', 'Eternal', 'Frozen', 'Golden', 'Hidden', 'Iron', 'Jade',
+    'Lunar', 'Mystic', 'Noble', 'Obsidian', 'Phantom', 'Radiant', 'Shadow', 'Silver', 'Storm', 'Wild',
+)
+NOUNS = (
+    'Dragon', 'Knight', 'Phoenix', 'Golem', 'Wizard', 'Serpent', 'Titan', 'Archer', 'Griffin', 'Sentinel',
+    'Hydra', 'Ranger', 'Wyvern', 'Oracle', 'Paladin', 'Kraken', 'Valkyrie', 'Warden', 'Chimera', 'Rogue',
+)
+THEMES = ('Fire', 'Water', 'Earth', 'Air', 'Light', 'Void', 'Nature', 'Metal', 'Spirit', 'Thunder')
+
+
+def user_sub(n):
+    return f'auth0|bench-{n}'
+
+
+def default_counts(cards):
+    return {
+        'categories': max(10, min(cards // 100, 1000)),
+        'users': max(50, cards // 20),
+        'purchases': max(100, cards // 2),
+    }
+
+
+@contextmanager
+def explicit_purchase_dates(model):
+    # purchase_date is auto_now_add; switch that off so the seeded history
+    # can span a year instead of all landing on "now"
+    field = model._meta.get_field('purchase_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(cards, categories=None, users=None, purchases=None, random_seed=0, batch_size=5000, verbose=False):
+    """
+    Insert the data set and return the number of rows created per model.
+    """
+    from django.db import transaction
+    from django.utils import timezone
+
+    from khalti.models import OrderLine, PurchaseHistory
+    from products import search, tree
+    from products.cache import bump_catalog_version
+    from products.models import Card, Category
+    from products.sales import rebuild_sales
+
+    counts = default_counts(cards)
+    categories = categories or counts['categories']
+    users = users or counts['users']
+    purchases = counts['purchases'] if purchases is None else purchases
+    rng = random.Random(random_seed)
+
+    def log(message):
+        if verbose:
+            print(message, flush=True)
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        Category.objects.bulk_create(
+            Category(name=f'{THEMES[i % len(THEMES)]} {i}', description=f'{THEMES[i % len(THEMES)]} cards')
+            for i in range(categories)
+        )
+        tree.assign_root_paths()
+        category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+
+        def make_cards():
+            for i in range(cards):
+                adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+                yield Card(
+                    sku=f'BENCH-{i}',
+                    name=f'{adjective} {noun} {i}',
+                    description=f'A {adjective.lower()} {noun.lower()} of {rng.choice(THEMES).lower()}.',
+                    price=Decimal(rng.randint(100, 50000)) / 100,
+                    category_id=None if rng.random() < 0.05 else rng.choice(category_ids),
+                )
+
+        for batch in _batches(make_cards(), batch_size):
+            Card.objects.bulk_create(batch)
+        log(f'{cards} cards in {categories} categories')
+
+        catalog = list(Card.objects.order_by('id').values_list('id', 'name', 'price'))
+        # Pareto popularity: a handful of cards get most of the sales
+        weights = list(accumulate(rng.paretovariate(1.16) for _ in catalog))
+        now = timezone.now()
+
+        def make_purchases():
+            for n in range(purchases):
+                picked = {card[0]: card for card in rng.choices(catalog, cum_weights=weights, k=rng.randint(1, 5))}
+                items = [
+                    {'id': card_id, 'name': name, 'price': str(price), 'quantity': rng.randint(1, 3)}
+                    for card_id, name, price in picked.values()
+                ]
+                total = sum(Decimal(item['price']) * item['quantity'] for item in items)
+                sub = user_sub(rng.randrange(users))
+                yield PurchaseHistory(
+                    user_sub=sub,
+                    user_email=f"{sub.split('|')[1]}@example.com",
+                    user_name=sub,
+                    purchase_date=now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                    total_amount=total,
+                    items=items,
+                    pidx=f'bench-{random_seed}-{n}',
+                    status='Completed',
+                    purchase_order_id=f'order-{n}',
+                )
+
+        lines = 0
+        with explicit_purchase_dates(PurchaseHistory):
+            for batch in _batches(make_purchases(), batch_size):
+                created = PurchaseHistory.objects.bulk_create(batch)
+                # Reload ids where the backend doesn't return them (SQLite < 3.35)
+                if created[0].pk is None:
+                    pidx = [purchase.pidx for purchase in batch]
+                    ids = dict(PurchaseHistory.objects.filter(pidx__in=pidx).values_list('pidx', 'id'))
+                    for purchase in created:
+                        purchase.pk = ids[purchase.pidx]
+                order_lines = [
+                    OrderLine(
+                        purchase_id=purchase.pk, card_id=item['id'], name=item['name'],
+                        quantity=item['quantity'], unit_price=Decimal(item['price']),
+                    )
+                    for purchase in created for item in purchase.items
+                ]
+                OrderLine.objects.bulk_create(order_lines, batch_size=batch_size)
+                lines += len(order_lines)
+        log(f'{purchases} purchases with {lines} lines by {users} users')
+
+        search.rebuild_index()
+        tree.recount_categories()
+        rebuild_sales(OrderLine, batch_size=batch_size)
+    bump_catalog_version()
+    log(f'seeded in {time.perf_counter() - started:.1f}s')
+    return {'categories': categories, 'cards': cards, 'users': users, 'purchases': purchases, 'order_lines': lines}
+
+
+def main():
+    import os
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, default=1000, help='10^3 to 10^6 is the supported range')
+    parser.add_argument('--categories', type=int, help='default: cards / 100, between 10 and 1000')
+    parser.add_argument('--users', type=int, help='default: cards / 20')
+    parser.add_argument('--purchases', type=int, help='default: cards / 2')
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    seed(
+        args.cards, args.categories, args.users, args.purchases,
+        random_seed=args.random_seed, batch_size=args.batch_size, verbose=True,
+    )
+
+
+if __name__ == '__main__':
+    main()
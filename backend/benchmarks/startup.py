@@ -0,0 +1,112 @@
+"""
+Time-to-first-request benchmark.
+
+Starts fresh Python processes, loads the WSGI application and times the
+first (and second) request to a few endpoints, with and without the warm-up
+from backend/warmup.py. Run from the backend directory:
+
+    python -m benchmarks.startup --runs 5
+
+By default it runs against a throwaway SQLite database seeded with --cards
+cards; pass --database-url to use an existing one. Network steps (jwks, oidc) are left out by default so the numbers only
+reflect this process; pass --steps to include them.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PATHS = ('/products/categories/', '/products/cards/', '/products/suggest/?q=ca')
+
+
+def seed(cards):
+    import django
+    django.setup()
+    from products.models import Card, Category
+
+    categories = Category.objects.bulk_create(Category(name=f'Category {i}') for i in range(10))
+    Card.objects.bulk_create(
+        Card(name=f'Card {i}', description=f'Description of card {i}', price=i % 500 + 10, category=categories[i % 10])
+        for i in range(cards)
+    )
+
+
+def child(steps):
+    # Runs in a fresh interpreter, so imports and caches are really cold
+    started = time.perf_counter()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    timings = {'load': time.perf_counter() - started}
+
+    if steps is not None:
+        from backend.warmup import warmup
+        began = time.perf_counter()
+        warmup(steps)
+        timings['warmup'] = time.perf_counter() - began
+
+    from django.test import Client
+    client = Client(HTTP_HOST='localhost')
+    for path in PATHS:
+        for attempt in ('first', 'second'):
+            began = time.perf_counter()
+            client.get(path)
+            timings[f'{attempt} {path}'] = time.perf_counter() - began
+    # Whole time until the first real request was answered
+    timings['time to first request'] = time.perf_counter() - started
+    print(json.dumps(timings))
+
+
+def run(steps, runs, env):
+    args = [sys.executable, '-m', 'benchmarks.startup', '--child']
+    if steps is not None:
+        args += ['--steps', ','.join(steps)]
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(args, check=True, capture_output=True, text=True, env=env).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--steps', default='imports,catalog,suggest', help='warm-up steps to compare against')
+    parser.add_argument('--database-url', help='database to run against (default: a temporary seeded SQLite file)')
+    parser.add_argument('--cards', type=int, default=5000, help='cards to seed the temporary database with')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    steps = [step for step in args.steps.split(',') if step]
+
+    if args.seed:
+        seed(args.cards)
+        return
+    if args.child:
+        child(steps if '--steps' in sys.argv else None)
+        return
+
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings', 'WARMUP_ON_STARTUP': 'False'}
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url:
+            env['DATABASE_URL'] = args.database_url
+        else:
+            env['DATABASE_URL'] = f'sqlite:///{tmp}/bench.sqlite3'
+            subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], check=True, env=env)
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks.startup', '--seed', '--cards', str(args.cards)],
+                check=True, env=env,
+            )
+        cold, warm = run(None, args.runs, env), run(steps, args.runs, env)
+    print(f"{'median ms':<40}{'cold':>10}{'warmed':>10}")
+    for key in warm:
+        cold_ms = f'{cold[key] * 1000:10.1f}' if key in cold else f"{'-':>10}"
+        print(f'{key:<40}{cold_ms}{warm[key] * 1000:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
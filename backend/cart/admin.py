@@ -0,0 +1,21 @@
+from django.contrib import admin
+from .models import Cart, CartItem
+from .pricing import refresh_cart
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    raw_id_fields = ['card']
+    extra = 0
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['user_sub', 'item_count', 'total', 'updated_at']
+    search_fields = ['user_sub']
+    readonly_fields = ['total', 'item_count', 'lines', 'updated_at']
+    inlines = [CartItemInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        refresh_cart(form.instance)
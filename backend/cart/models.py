@@ -0,0 +1,32 @@
+from django.db import models
+
+from products.models import Card
+
+
+class Cart(models.Model):
+    """
+    A user's server-side cart. CartItem rows are the source of truth; total,
+    item_count and lines are a denormalized copy kept up to date by
+    cart.pricing.refresh_cart, so reading a cart (or checking it out) is a
+    single-row lookup no matter how many items it holds.
+    """
+    user_sub = models.CharField(max_length=255, unique=True)  # Auth0 user ID
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    lines = models.JSONField(default=list)  # [{id, name, price, quantity}], priced from Card
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_sub} - Rs {self.total}"
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='cart_items')
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['cart', 'card'], name='cart_cartitem_unique')]
+
+    def __str__(self):
+        return f"{self.card_id} x {self.quantity}"
@@ -0,0 +1,171 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import Card
+from .models import Cart, CartItem
+
+
+# Per-item cap, so a typo can't put 10^9 of something in a cart
+MAX_QUANTITY = 99
+
+
+class InvalidItems(ValueError):
+    pass
+
+
+def parse_quantities(items):
+    """
+    Read [{id|card_id, quantity|qty}] as sent by the frontend into a
+    {card_id: quantity} dict. Repeated ids are added together.
+    """
+    if not isinstance(items, list):
+        raise InvalidItems('items must be a list')
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise InvalidItems('Each item must be an object')
+        card_id = item.get('card_id', item.get('id'))
+        quantity = item.get('quantity', item.get('qty'))
+        # An explicit 0 is rejected below, not read as "no quantity given"
+        quantity = 1 if quantity is None else quantity
+        if isinstance(quantity, bool):
+            raise InvalidItems('quantity must be an integer')
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise InvalidItems('quantity must be an integer')
+        # bool is an int subclass, but true/false are not card ids
+        if not isinstance(card_id, int) or isinstance(card_id, bool) or quantity < 1:
+            raise InvalidItems('Each item needs a card id and a positive quantity')
+        quantities[card_id] = min(quantities.get(card_id, 0) + quantity, MAX_QUANTITY)
+    return quantities
+
+
+def price_items(quantities):
+    """
+    Price a {card_id: quantity} dict from the Card table in one in_bulk
+    query. Returns (lines, total); raises InvalidItems for unknown cards.
+    """
+    cards = Card.objects.only('id', 'name', 'price').in_bulk(list(quantities))
+    missing = set(quantities) - set(cards)
+    if missing:
+        raise InvalidItems(f"Unknown card ids: {sorted(missing)}")
+
+    lines, total = [], Decimal('0.00')
+    for card_id, quantity in quantities.items():
+        card = cards[card_id]
+        lines.append({'id': card.id, 'name': card.name, 'price': str(card.price), 'quantity': quantity})
+        total += card.price * quantity
+    return lines, total
+
+
+def refresh_cart(cart):
+    """
+    Recompute the denormalized total, item_count and lines of `cart` from its
+    items: one query for the quantities, one for the prices, one UPDATE.
+    """
+    quantities = dict(CartItem.objects.filter(cart=cart).order_by('id').values_list('card_id', 'quantity'))
+    lines, total = price_items(quantities)
+    cart.lines, cart.total, cart.item_count = lines, total, sum(quantities.values())
+    cart.save(update_fields=['lines', 'total', 'item_count', 'updated_at'])
+    return cart
+
+
+def _lock(cart):
+    # Serialize concurrent edits of the same cart on its row lock
+    Cart.objects.select_for_update().filter(pk=cart.pk).exists()
+
+
+def add_items(cart, quantities):
+    """
+    Add `quantities` ({card_id: quantity}) to the cart, on top of what is
+    already there.
+    """
+    price_items(quantities)  # Reject unknown cards before touching anything
+    with transaction.atomic():
+        _lock(cart)
+        existing = set(
+            CartItem.objects.filter(cart=cart, card_id__in=quantities).values_list('card_id', flat=True)
+        )
+        for card_id in existing:
+            CartItem.objects.filter(cart=cart, card_id=card_id).update(
+                quantity=F('quantity') + quantities[card_id]
+            )
+        CartItem.objects.filter(cart=cart, quantity__gt=MAX_QUANTITY).update(quantity=MAX_QUANTITY)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, card_id=card_id, quantity=quantity)
+            for card_id, quantity in quantities.items() if card_id not in existing
+        ])
+        return refresh_cart(cart)
+
+
+def remove_item(cart, card_id, quantity=None):
+    """
+    Take `quantity` of a card out of the cart, or all of it when None.
+    """
+    with transaction.atomic():
+        _lock(cart)
+        items = CartItem.objects.filter(cart=cart, card_id=card_id)
+        if quantity is None:
+            items.delete()
+        else:
+            items.filter(quantity__lte=quantity).delete()
+            items.update(quantity=F('quantity') - quantity)
+        return refresh_cart(cart)
+
+
+def remove_quantities(cart, quantities):
+    """
+    Take `quantities` ({card_id: quantity}) out of the cart, e.g. the items
+    of a completed payment. Anything added since stays in the cart.
+    """
+    with transaction.atomic():
+        _lock(cart)
+        for card_id, quantity in quantities.items():
+            items = CartItem.objects.filter(cart=cart, card_id=card_id)
+            items.filter(quantity__lte=quantity).delete()
+            items.update(quantity=F('quantity') - quantity)
+        return refresh_cart(cart)
+
+
+def clear_cart(cart):
+    with transaction.atomic():
+        _lock(cart)
+        CartItem.objects.filter(cart=cart).delete()
+        return refresh_cart(cart)
+
+
+def _reprice(items, cart_ids=()):
+    """
+    Rebuild the denormalized fields of the carts `items` belong to (plus
+    `cart_ids`, which may have none left) from a single query over the items
+    and their card prices, then write them in one bulk UPDATE.
+    """
+    carts = {pk: Cart(pk=pk, lines=[], total=Decimal('0.00'), item_count=0) for pk in cart_ids}
+    items = items.select_related('card').only('cart_id', 'quantity', 'card__id', 'card__name', 'card__price')
+    for item in items.order_by('cart_id', 'id'):
+        cart = carts.setdefault(item.cart_id, Cart(pk=item.cart_id, lines=[], total=Decimal('0.00'), item_count=0))
+        card = item.card
+        cart.lines.append({'id': card.id, 'name': card.name, 'price': str(card.price), 'quantity': item.quantity})
+        cart.total += card.price * item.quantity
+        cart.item_count += item.quantity
+    now = timezone.now()
+    for cart in carts.values():
+        cart.updated_at = now  # bulk_update skips auto_now
+    return Cart.objects.bulk_update(carts.values(), ['lines', 'total', 'item_count', 'updated_at'], batch_size=500)
+
+
+def refresh_carts(cart_ids):
+    """Like refresh_cart for many carts at once, in two queries however many there are."""
+    cart_ids = list(cart_ids)
+    return _reprice(CartItem.objects.filter(cart_id__in=cart_ids), cart_ids) if cart_ids else 0
+
+
+def refresh_carts_for_card(card_id):
+    """
+    Re-price every cart holding `card_id`, e.g. after the card's price changed.
+    """
+    return _reprice(CartItem.objects.filter(cart__items__card_id=card_id))
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.models import Card
+from .models import Cart
+from .pricing import refresh_carts, refresh_carts_for_card
+
+
+@receiver(post_save, sender=Card)
+def reprice_carts(sender, instance, created, **kwargs):
+    # Cart totals are denormalized, so a price or name change has to reach them
+    if not created:
+        refresh_carts_for_card(instance.pk)
+
+
+@receiver(pre_delete, sender=Card)
+def remember_card_carts(sender, instance, **kwargs):
+    instance._cart_ids = list(Cart.objects.filter(items__card=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Card)
+def refresh_orphaned_carts(sender, instance, **kwargs):
+    # The cart items went with the card; drop them from the cached totals too
+    refresh_carts(getattr(instance, '_cart_ids', []))
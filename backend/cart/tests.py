@@ -0,0 +1,75 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from backend.authentication import Auth0JSONWebTokenAuthentication, Auth0User
+from products.models import Card
+from .models import Cart
+from .pricing import add_items, refresh_carts_for_card
+
+
+class CartViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chess = Card.objects.create(name='Chess', description='d', price=Decimal('25.00'))
+        cls.dice = Card.objects.create(name='Dice', description='d', price=Decimal('2.50'))
+
+    def setUp(self):
+        principal = Auth0User({'sub': 'auth0|1', 'email': 'buyer@example.com', 'name': 'Buyer'})
+        patcher = mock.patch.object(Auth0JSONWebTokenAuthentication, 'authenticate', return_value=(principal, 'token'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, data):
+        return self.client.post('/cart/items/', data, content_type='application/json')
+
+    def test_add_view_and_remove(self):
+        self.add({'card_id': self.chess.id})
+        cart = self.add({'items': [{'id': self.dice.id, 'quantity': 2}, {'id': self.chess.id}]}).json()
+        self.assertEqual(cart['total'], '55.00')
+        self.assertEqual(cart['item_count'], 4)
+
+        # Reading the cart is a single query regardless of its size
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/cart/').json(), cart)
+
+        cart = self.client.delete(f'/cart/items/{self.chess.id}/?quantity=1').json()
+        self.assertEqual(cart['total'], '30.00')
+        cart = self.client.delete(f'/cart/items/{self.dice.id}/').json()
+        self.assertEqual([line['name'] for line in cart['items']], ['Chess'])
+
+        cart = self.client.delete('/cart/').json()
+        self.assertEqual(cart, {'items': [], 'total': '0.00', 'item_count': 0})
+
+    def test_unknown_cards_are_rejected(self):
+        response = self.add({'card_id': 999})
+        self.assertEqual(response.status_code, 400)
+
+    def test_zero_quantities_and_boolean_ids_are_rejected(self):
+        for item in ({'card_id': self.chess.id, 'quantity': 0}, {'id': self.chess.id, 'qty': 0},
+                     {'card_id': True}, {'card_id': self.chess.id, 'quantity': True}):
+            self.assertEqual(self.add(item).status_code, 400, item)
+        self.assertFalse(Cart.objects.filter(items__isnull=False).exists())
+        self.assertFalse(Cart.objects.filter(items__isnull=False).exists())
+
+    def test_price_changes_reach_cart_totals(self):
+        self.add({'card_id': self.chess.id, 'quantity': 2})
+        self.chess.price = Decimal('20.00')
+        self.chess.save()
+        self.assertEqual(self.client.get('/cart/').json()['total'], '40.00')
+
+        self.dice.delete()
+        self.chess.delete()
+        self.assertEqual(self.client.get('/cart/').json()['item_count'], 0)
+
+    def test_price_change_reprices_carts_in_batch(self):
+        for n in range(5):
+            add_items(Cart.objects.create(user_sub=f'auth0|{n}'), {self.chess.id: n + 1, self.dice.id: 1})
+        Card.objects.filter(pk=self.chess.pk).update(price=Decimal('20.00'))
+        with self.assertNumQueries(2):  # The carts' items, one bulk UPDATE
+            refresh_carts_for_card(self.chess.pk)
+        self.assertEqual(
+            sorted(Cart.objects.values_list('total', flat=True)),
+            [Decimal('22.50'), Decimal('42.50'), Decimal('62.50'), Decimal('82.50'), Decimal('102.50')],
+        )
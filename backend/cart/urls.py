@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("", views.cart_detail, name="cart_detail"),
+    path("items/", views.add_to_cart, name="cart_add"),
+    path("items/<int:card_id>/", views.remove_from_cart, name="cart_remove"),
+]
@@ -0,0 +1,68 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import Cart
+from .pricing import InvalidItems, add_items, clear_cart, parse_quantities, remove_item
+
+
+def get_user_sub(user):
+    # Carts are keyed on the Auth0 sub, like purchases
+    return getattr(user, 'auth0_sub', None) or getattr(user, 'sub', None) or user.username
+
+
+def cart_response(cart):
+    if cart is None:
+        return Response({'items': [], 'total': '0.00', 'item_count': 0})
+    return Response({'items': cart.lines, 'total': f'{cart.total:.2f}', 'item_count': cart.item_count})
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def cart_detail(request):
+    """
+    GET the cart (one row, totals precomputed) or DELETE to empty it.
+    """
+    cart = Cart.objects.filter(user_sub=get_user_sub(request.user)).first()
+    if request.method == 'DELETE' and cart is not None:
+        cart = clear_cart(cart)
+    return cart_response(cart)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def add_to_cart(request):
+    """
+    Add cards to the cart. Accepts {"card_id", "quantity"} for one card or
+    {"items": [{"id", "quantity"}, ...]} for several at once.
+    """
+    data = request.data
+    items = data.get('items') if 'items' in data else [data]
+    try:
+        quantities = parse_quantities(items)
+        if not quantities:
+            raise InvalidItems('No items to add')
+        cart, _ = Cart.objects.get_or_create(user_sub=get_user_sub(request.user))
+        cart = add_items(cart, quantities)
+    except InvalidItems as e:
+        return Response({"error": str(e)}, status=400)
+    return cart_response(cart)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def remove_from_cart(request, card_id):
+    """
+    Remove a card from the cart, or only ?quantity= of it.
+    """
+    try:
+        quantity = int(request.GET['quantity']) if request.GET.get('quantity') else None
+    except ValueError:
+        return Response({"error": "quantity must be an integer"}, status=400)
+    if quantity is not None and quantity < 1:
+        return Response({"error": "quantity must be positive"}, status=400)
+
+    cart = Cart.objects.filter(user_sub=get_user_sub(request.user)).first()
+    if cart is not None:
+        cart = remove_item(cart, card_id, quantity)
+    return cart_response(cart)
@@ -1,10 +1,40 @@
 from django.contrib import admin
-from .models import PurchaseHistory
+from django.db.models import Q
+from backend.paginators import EstimatedCountPaginator
+from .models import OrderLine, PendingPayment, PurchaseHistory
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    raw_id_fields = ['card']
+
 
 # Register your models here.
 @admin.register(PurchaseHistory)
 class PurchaseHistoryAdmin(admin.ModelAdmin):
+    inlines = [OrderLineInline]
     list_display = ['user_email', 'total_amount', 'status', 'purchase_date']
-    list_filter = ['status', 'purchase_date']
-    search_fields = ['user_email', 'user_name', 'pidx']
+    list_filter = ['status']
+    date_hierarchy = 'purchase_date'  # Drilldown filters by range on khalti_purchase_date
+    # Exact matches only, each served by an index; see get_search_results
+    search_fields = ['pidx']
+    search_help_text = 'Exact pidx, Auth0 user ID or email'
     readonly_fields = ['purchase_date']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(Q(pidx=term) | Q(user_sub=term) | Q(user_email=term)), False
+
+
+@admin.register(PendingPayment)
+class PendingPaymentAdmin(admin.ModelAdmin):
+    list_display = ['pidx', 'user_email', 'status', 'attempts', 'next_check_at', 'created_at']
+    list_filter = ['status']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['pidx', 'user_email']
+    readonly_fields = ['created_at', 'last_checked_at', 'lookup_response']
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Khalti ePayment API, for offline tests and load tests.
+
+Run it with
+
+    python -m khalti.fake_server --port 9000 --latency 0.2
+
+and point the backend at it with KHALTI_BASE_URL=http://127.0.0.1:9000/api/v2/
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeKhalti:
+    """
+    In-memory payment store plus the knobs tests use to simulate Khalti
+    being slow, flaky or down.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, lookup_status='Completed'):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lookup_status = lookup_status
+        self.payments = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def initiate(self, payload):
+        pidx = uuid.uuid4().hex
+        with self.lock:
+            self.payments[pidx] = {
+                'total_amount': payload.get('amount', 0),
+                'purchase_order_id': payload.get('purchase_order_id', ''),
+            }
+        return 200, {
+            'pidx': pidx,
+            'payment_url': f'https://test-pay.khalti.com/?pidx={pidx}',
+            'expires_in': 1800,
+        }
+
+    def lookup(self, payload):
+        with self.lock:
+            payment = self.payments.get(payload.get('pidx'))
+        if payment is None:
+            return 404, {'detail': 'Not found.', 'error_key': 'validation_error'}
+        return 200, {
+            'pidx': payload['pidx'],
+            'total_amount': payment['total_amount'],
+            'status': self.lookup_status,
+            'transaction_id': uuid.uuid4().hex[:22],
+            'fee': 0,
+            'refunded': False,
+            'purchase_order_id': payment['purchase_order_id'],
+        }
+
+    def handle(self, path, payload):
+        with self.lock:
+            self.requests.append(path)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            return 503, {'detail': 'Service unavailable'}
+        if path.endswith('/epayment/initiate/'):
+            return self.initiate(payload)
+        if path.endswith('/epayment/lookup/'):
+            return self.lookup(payload)
+        return 404, {'detail': 'Not found.'}
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                payload = {}
+            status, body = fake.handle(self.path, payload)
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeKhaltiServer:
+    """
+    Run a FakeKhalti on a background thread, e.g. from a test case:
+
+        server = FakeKhaltiServer().start()
+        ... settings.KHALTI_BASE_URL = server.base_url ...
+        server.stop()
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        self.fake = FakeKhalti(**options)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.fake))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/api/v2/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--lookup-status', default='Completed')
+    args = parser.parse_args()
+
+    server = FakeKhaltiServer(
+        args.host, args.port,
+        latency=args.latency, failure_rate=args.failure_rate, lookup_status=args.lookup_status,
+    )
+    print(f'Fake Khalti listening on {server.base_url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from backend.instrumentation import track
+
+
+def _httpx():
+    import httpx  # Deferred so importing the views stays cheap; see backend/warmup.py
+    return httpx
+
+
+class KhaltiError(Exception):
+    pass
+
+
+class KhaltiUnavailable(KhaltiError):
+    """Raised without calling Khalti while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stop calling Khalti after `threshold` consecutive failures. After
+    `reset_timeout` seconds one trial request is let through (half-open);
+    success closes the circuit again, failure re-opens it.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+# Status codes worth retrying: Khalti or its proxy is overloaded/restarting
+RETRY_STATUSES = {502, 503, 504}
+# The subset safe for requests that must not run twice: a 504 may come
+# after Khalti already acted on the request
+UNSENT_RETRY_STATUSES = {502, 503}
+
+
+class KhaltiClient:
+    """
+    Async client for the Khalti ePayment API.
+
+    One pooled keep-alive httpx.AsyncClient is kept per event loop, so
+    requests reuse TCP/TLS connections instead of reconnecting every time.
+    Transient failures are retried with exponential backoff and full jitter,
+    and a circuit breaker fails fast while Khalti is down.
+    """
+
+    def __init__(self, base_url=None, secret_key=None):
+        self.base_url = base_url or settings.KHALTI_BASE_URL
+        self.secret_key = secret_key or settings.KHALTI_SECRET_KEY
+        self.max_retries = settings.KHALTI_MAX_RETRIES
+        self.breaker = CircuitBreaker(settings.KHALTI_BREAKER_THRESHOLD, settings.KHALTI_BREAKER_RESET)
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _http(self):
+        httpx = _httpx()
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Key {self.secret_key}"},
+                timeout=httpx.Timeout(settings.KHALTI_TIMEOUT, connect=settings.KHALTI_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.KHALTI_POOL_SIZE,
+                    max_keepalive_connections=settings.KHALTI_POOL_SIZE,
+                ),
+            )
+            self._clients[loop] = client
+        return client
+
+    async def _post(self, path, payload, idempotent=True):
+        """
+        POST to Khalti with retries. Requests that are not `idempotent` are
+        only retried when they cannot have reached Khalti (connection
+        failures, 502/503), so a retry never opens a second payment session.
+        """
+        if not self.breaker.allow():
+            raise KhaltiUnavailable("Khalti is temporarily unavailable, please retry shortly")
+        try:
+            resp = await self._send(path, payload, idempotent)
+        except BaseException:
+            # Anything, cancellation included, must settle the breaker;
+            # otherwise a half-open trial would stay in flight forever
+            self.breaker.record_failure()
+            raise
+
+        # Khalti answered, so it is up even if it rejected the request
+        self.breaker.record_success()
+        if resp.is_error:
+            raise KhaltiError(f"Khalti request to {path} failed with HTTP {resp.status_code}: {resp.text}")
+        return resp.json()
+
+    async def _send(self, path, payload, idempotent):
+        httpx = _httpx()
+        retry_errors = httpx.TransportError if idempotent else (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+        retry_statuses = RETRY_STATUSES if idempotent else UNSENT_RETRY_STATUSES
+
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # Full jitter: sleep anywhere up to the exponential backoff
+                await asyncio.sleep(random.uniform(0, settings.KHALTI_RETRY_BACKOFF * 2 ** attempt))
+            try:
+                with track('khalti', service='khalti'):
+                    resp = await self._http().post(path, json=payload)
+            except retry_errors as e:
+                error = e
+                continue
+            except httpx.TransportError as e:
+                # May have been sent already; retrying could repeat it
+                raise KhaltiError(f"Khalti request to {path} failed: {e!r}")
+            if resp.status_code in retry_statuses:
+                error = f"HTTP {resp.status_code}"
+                continue
+            return resp
+        raise KhaltiError(f"Khalti request to {path} failed: {error}")
+
+    async def initiate(self, payload):
+        # Not idempotent: every call that reaches Khalti creates a payment session
+        return await self._post("epayment/initiate/", payload, idempotent=False)
+
+    async def lookup(self, pidx):
+        return await self._post("epayment/lookup/", {"pidx": pidx})
+
+    async def aclose(self):
+        for client in list(self._clients.values()):
+            await client.aclose()
+        self._clients.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide KhaltiClient.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = KhaltiClient()
+    return _client
@@ -0,0 +1,78 @@
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+def idempotent(view):
+    """
+    Honour an Idempotency-Key header on an async JWT-protected view.
+
+    The first request with a key claims it (get_or_create on the unique
+    (user_sub, key) pair, so concurrent duplicates cannot both win) and its
+    response is stored. Retries with the same key get the stored response
+    back without running the view again; a retry that arrives while the
+    first request is still running gets a 409.
+
+    Responses that carry Retry-After (the result is not final yet) or are
+    5xx are not stored, so the client can retry with the same key. A claim
+    still in progress after IDEMPOTENCY_LOCK_TIMEOUT is taken to belong to a
+    worker that died and is handed to the next request.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return await view(request, *args, **kwargs)
+
+        user_sub = getattr(request.user, 'auth0_sub', None) or request.user.username
+        record, created = await IdempotencyKey.objects.aget_or_create(
+            user_sub=user_sub, key=key[:255], defaults={'path': request.path},
+        )
+
+        now = timezone.now()
+        expired = record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        abandoned = (
+            record.response_status is None
+            and record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        )
+        if not created and (expired or abandoned):
+            # Conditional on the state we saw, so a response stored meanwhile isn't lost
+            await IdempotencyKey.objects.filter(pk=record.pk, response_status=record.response_status).adelete()
+            return await wrapper(request, *args, **kwargs)
+
+        if not created:
+            if record.path != request.path:
+                return JsonResponse({"error": "Idempotency-Key was already used for another endpoint"}, status=422)
+            if record.response_status is None:
+                return JsonResponse({"error": "A request with this Idempotency-Key is still in progress"}, status=409)
+            response = JsonResponse(record.response_body, status=record.response_status, safe=False)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = await view(request, *args, **kwargs)
+        except Exception:
+            await record.adelete()
+            raise
+
+        if response.status_code >= 500 or response.has_header('Retry-After'):
+            await record.adelete()
+        else:
+            record.response_status = response.status_code
+            record.response_body = json.loads(response.content)
+            await record.asave(update_fields=['response_status', 'response_body'])
+        return response
+    return wrapper
+
+
+def purge_expired_keys():
+    """Delete keys older than IDEMPOTENCY_KEY_TTL; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
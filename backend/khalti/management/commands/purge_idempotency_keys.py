@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from khalti.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete Idempotency-Key records older than IDEMPOTENCY_KEY_TTL (the reconcile worker also does this hourly)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Purged {purge_expired_keys()} expired idempotency keys'))
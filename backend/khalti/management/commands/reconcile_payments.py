@@ -0,0 +1,27 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from khalti.reconcile import reconcile_due, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Look up pending Khalti payments and record the completed ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process one batch and exit')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds to sleep when nothing is due (worker mode)')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = asyncio.run(reconcile_due(options['batch_size']))
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {count} payments'))
+            return
+
+        self.stdout.write('Reconciling pending payments, press Ctrl+C to stop')
+        try:
+            asyncio.run(run_worker(options['interval'], options['batch_size']))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('khalti', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pidx', models.CharField(max_length=255, unique=True)),
+                ('user_sub', models.CharField(max_length=255)),
+                ('user_email', models.EmailField(max_length=254)),
+                ('user_name', models.CharField(max_length=255)),
+                ('items', models.JSONField(default=list)),
+                ('amount', models.PositiveIntegerField(default=0)),
+                ('purchase_order_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(default='Initiated', max_length=50)),
+                ('lookup_response', models.JSONField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_check_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('purchase', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='khalti.purchasehistory')),
+            ],
+        ),
+    ]
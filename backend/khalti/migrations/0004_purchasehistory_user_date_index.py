@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('khalti', '0003_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchasehistory',
+            index=models.Index(fields=['user_sub', '-purchase_date', '-id'], name='khalti_purchase_user_date'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations
+
+# Purchases loaded (and lines written) per round-trip, which bounds memory
+# no matter how large the purchase table is
+CHUNK_SIZE = 500
+
+
+# A frozen copy of khalti.orders as it was when this migration was written:
+# migrations must not import app code, which keeps changing under them.
+def parse_items(items):
+    parsed = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            quantity = int(item.get('quantity') or item.get('qty') or 1)
+            unit_price = Decimal(str(item.get('price') or 0)).quantize(Decimal('0.01'))
+        except (TypeError, ValueError, InvalidOperation):
+            continue
+        card_id = item.get('id')
+        parsed.append((
+            card_id if isinstance(card_id, int) else None,
+            str(item.get('name') or '')[:255],
+            max(quantity, 1),
+            unit_price,
+        ))
+    return parsed
+
+
+def build_order_lines(purchases, OrderLine, Card):
+    rows = [(purchase_id, item) for purchase_id, items in purchases for item in parse_items(items)]
+    ids = {card_id for _, (card_id, *_) in rows if card_id is not None}
+    names = {name for _, (card_id, name, *_) in rows if card_id is None and name}
+    known_ids = set(Card.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+    ids_by_name = {}
+    if names:
+        for card_id, name in Card.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            ids_by_name[name] = card_id
+    return [
+        OrderLine(
+            purchase_id=purchase_id,
+            card_id=card_id if card_id in known_ids else ids_by_name.get(name),
+            name=name, quantity=quantity, unit_price=unit_price,
+        )
+        for purchase_id, (card_id, name, quantity, unit_price) in rows
+    ]
+
+
+def backfill_order_lines(apps, schema_editor):
+    PurchaseHistory = apps.get_model('khalti', 'PurchaseHistory')
+    OrderLine = apps.get_model('khalti', 'OrderLine')
+    Card = apps.get_model('products', 'Card')
+
+    last_id = 0
+    while True:
+        chunk = list(
+            PurchaseHistory.objects
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'items')[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        done = set(
+            OrderLine.objects.filter(purchase_id__in=[p.id for p in chunk])
+            .values_list('purchase_id', flat=True)
+        )
+        lines = build_order_lines(
+            [(p.id, p.items) for p in chunk if p.id not in done], OrderLine, Card,
+        )
+        OrderLine.objects.bulk_create(lines, batch_size=CHUNK_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('khalti', '0005_orderline'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('khalti', '0006_backfill_order_lines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingpayment',
+            name='from_cart',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('khalti', '0007_pendingpayment_from_cart'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchasehistory',
+            index=models.Index(fields=['purchase_date', 'id'], name='khalti_purchase_date'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasehistory',
+            index=models.Index(fields=['user_email'], name='khalti_purchase_email'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('khalti', '0008_purchase_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='idempotencykey',
+            index=models.Index(fields=['created_at'], name='khalti_idempotency_created'),
+        ),
+    ]
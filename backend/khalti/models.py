@@ -15,6 +15,77 @@ class PurchaseHistory(models.Model):
     class Meta:
         ordering = ['-purchase_date']
         verbose_name_plural = "Purchase Histories"
+        indexes = [
+            # Serves get_purchase_history: one user's purchases, newest first
+            models.Index(fields=['user_sub', '-purchase_date', '-id'], name='khalti_purchase_user_date'),
+            # Admin changelist: ordering by date and the date_hierarchy drilldown
+            models.Index(fields=['purchase_date', 'id'], name='khalti_purchase_date'),
+            models.Index(fields=['user_email'], name='khalti_purchase_email'),
+        ]
     
     def __str__(self):
         return f"{self.user_email} - Rs.{self.total_amount} - {self.purchase_date.strftime('%Y-%m-%d')}"
+
+
+class PendingPayment(models.Model):
+    """
+    A payment started through khalti_initiate. The reconciliation worker
+    (khalti/reconcile.py) looks these up at Khalti until they reach a final
+    status, and records the PurchaseHistory row once one completes.
+    """
+    pidx = models.CharField(max_length=255, unique=True)
+    user_sub = models.CharField(max_length=255)  # Auth0 user ID
+    user_email = models.EmailField()
+    user_name = models.CharField(max_length=255)
+    items = models.JSONField(default=list)
+    amount = models.PositiveIntegerField(default=0)  # In paisa, as sent to Khalti
+    from_cart = models.BooleanField(default=False)  # Checked out from the server cart, emptied once paid
+    purchase_order_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=50, default='Initiated')
+    lookup_response = models.JSONField(null=True, blank=True)  # Latest Khalti lookup result
+    purchase = models.OneToOneField(PurchaseHistory, on_delete=models.SET_NULL, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_check_at = models.DateTimeField(null=True, blank=True, db_index=True)  # Null once final
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.pidx} - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response for a request sent with an Idempotency-Key header, so a
+    retried request is answered from here instead of being run again.
+    """
+    user_sub = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)  # Null while in progress
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_sub', 'key'], name='khalti_idempotency_key_per_user'),
+        ]
+        # For purge_expired_keys
+        indexes = [models.Index(fields=['created_at'], name='khalti_idempotency_created')]
+
+    def __str__(self):
+        return f"{self.user_sub} - {self.key}"
+
+
+class OrderLine(models.Model):
+    """
+    One purchased product of a PurchaseHistory, normalized out of the items
+    JSON so sales can be aggregated with GROUP BY instead of parsing blobs.
+    """
+    purchase = models.ForeignKey(PurchaseHistory, on_delete=models.CASCADE, related_name='lines')
+    card = models.ForeignKey('products.Card', on_delete=models.SET_NULL, null=True, blank=True, related_name='order_lines')
+    name = models.CharField(max_length=255)  # Product name at the time of purchase
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.name}"
@@ -0,0 +1,89 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import DecimalField, F, Sum
+
+from products.models import Card
+from .models import OrderLine
+
+
+def parse_items(items):
+    """
+    Normalize the items JSON sent by the frontend into
+    (card_id or None, name, quantity, unit_price) tuples, skipping entries
+    that can't be read.
+    """
+    parsed = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            quantity = int(item.get('quantity') or item.get('qty') or 1)
+            unit_price = Decimal(str(item.get('price') or 0)).quantize(Decimal('0.01'))
+        except (TypeError, ValueError, InvalidOperation):
+            continue
+        card_id = item.get('id')
+        parsed.append((
+            card_id if isinstance(card_id, int) else None,
+            str(item.get('name') or '')[:255],
+            max(quantity, 1),
+            unit_price,
+        ))
+    return parsed
+
+
+def resolve_cards(parsed, card_model=Card):
+    """
+    Map each parsed item to a card id in at most two queries: one checking
+    the ids sent by the frontend, one matching older items by name.
+    """
+    ids = {card_id for card_id, *_ in parsed if card_id is not None}
+    names = {name for card_id, name, *_ in parsed if card_id is None and name}
+
+    known_ids = set(card_model.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+    ids_by_name = {}
+    if names:
+        for card_id, name in card_model.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            ids_by_name[name] = card_id
+
+    return [
+        card_id if card_id in known_ids else ids_by_name.get(name)
+        for card_id, name, *_ in parsed
+    ]
+
+
+def build_order_lines(purchases, line_model=OrderLine, card_model=Card):
+    """
+    Build unsaved order lines for `purchases`, an iterable of
+    (purchase_id, items) pairs. Cards for all of them are resolved together.
+    """
+    rows = [(purchase_id, item) for purchase_id, items in purchases for item in parse_items(items)]
+    card_ids = resolve_cards([item for _, item in rows], card_model)
+    return [
+        line_model(purchase_id=purchase_id, card_id=card_id, name=name, quantity=quantity, unit_price=unit_price)
+        for card_id, (purchase_id, (_, name, quantity, unit_price)) in zip(card_ids, rows)
+    ]
+
+
+def create_order_lines(purchase, items):
+    return OrderLine.objects.bulk_create(build_order_lines([(purchase.pk, items)]))
+
+
+# ------------------------------------------------------------------
+# Sales aggregates
+# ------------------------------------------------------------------
+def units_sold_per_card():
+    return (
+        OrderLine.objects.filter(card__isnull=False)
+        .values('card_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)))
+        .order_by('-units')
+    )
+
+
+def revenue_per_category():
+    return (
+        OrderLine.objects.filter(card__category__isnull=False)
+        .values('card__category_id', 'card__category__name')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)))
+        .order_by('-revenue')
+    )
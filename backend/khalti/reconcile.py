@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .gateway import KhaltiError, get_client
+from .idempotency import purge_expired_keys
+from .models import PendingPayment, PurchaseHistory
+from .orders import create_order_lines, parse_items
+from cart.models import Cart
+from cart.pricing import remove_quantities
+from products.sales import record_sales
+
+logger = logging.getLogger(__name__)
+
+
+# Khalti lookup statuses after which a payment never changes again
+FINAL_STATUSES = {'Completed', 'Refunded', 'Partially Refunded', 'Expired', 'User canceled'}
+
+# First re-check delay for a still-pending payment; doubles per attempt up to
+# KHALTI_RECONCILE_MAX_DELAY
+BASE_DELAY = 10
+# How long a worker owns a claimed payment before another worker may retry it
+CLAIM_LEASE = 60
+# Seconds between purges of expired Idempotency-Keys by the worker
+PURGE_INTERVAL = 3600
+
+
+def schedule_next_check(payment, now):
+    payment.attempts += 1
+    if payment.attempts >= settings.KHALTI_RECONCILE_MAX_ATTEMPTS:
+        payment.next_check_at = None  # Give up; the admin can still see it
+        return
+    delay = min(BASE_DELAY * 2 ** (payment.attempts - 1), settings.KHALTI_RECONCILE_MAX_DELAY)
+    payment.next_check_at = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_due_payments(limit):
+    """
+    Claim up to `limit` payments that are due for a lookup by pushing their
+    next_check_at past a lease, so concurrent workers don't pick them too.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            PendingPayment.objects
+            .select_for_update(skip_locked=True)
+            .filter(next_check_at__lte=now)
+            .order_by('next_check_at')[:limit]
+        )
+        if payments:
+            PendingPayment.objects.filter(pk__in=[p.pk for p in payments]).update(
+                next_check_at=now + timedelta(seconds=CLAIM_LEASE)
+            )
+    return payments
+
+
+def record_purchase(payment, verification):
+    """
+    Write the PurchaseHistory row and its order lines for a completed
+    payment, add them to the sales rollups and take the paid items out of
+    the cart they came from. Keyed on the unique pidx, so running this twice
+    for the same payment is harmless.
+    """
+    purchase, created = PurchaseHistory.objects.get_or_create(
+        pidx=payment.pidx,
+        defaults={
+            'user_sub': payment.user_sub,
+            'user_email': payment.user_email,
+            'user_name': payment.user_name,
+            'total_amount': verification.get('total_amount', 0) / 100,  # Convert from paisa to Rs
+            'items': payment.items,
+            'status': verification.get('status'),
+            'purchase_order_id': verification.get('purchase_order_id', ''),
+        },
+    )
+    if created:
+        lines = create_order_lines(purchase, payment.items)
+        record_sales(lines, timezone.localdate(purchase.purchase_date))
+        if payment.from_cart:
+            paid = Counter()
+            for card_id, _name, quantity, _price in parse_items(payment.items):
+                if card_id is not None:
+                    paid[card_id] += quantity
+            for cart in Cart.objects.filter(user_sub=payment.user_sub):
+                remove_quantities(cart, paid)
+    return purchase
+
+
+def apply_lookup(payment, verification):
+    now = timezone.now()
+    with transaction.atomic():
+        payment.status = verification.get('status') or payment.status
+        payment.lookup_response = verification
+        payment.last_checked_at = now
+        if payment.status == 'Completed':
+            payment.purchase = record_purchase(payment, verification)
+        if payment.status in FINAL_STATUSES:
+            payment.next_check_at = None
+        else:
+            schedule_next_check(payment, now)
+        # Only the lookup's own fields: the rest of the row may have been
+        # changed meanwhile, e.g. by claim_lookup or the worker
+        payment.save(update_fields=['status', 'lookup_response', 'last_checked_at', 'purchase', 'attempts', 'next_check_at'])
+
+
+def apply_failure(payment):
+    now = timezone.now()
+    payment.last_checked_at = now
+    schedule_next_check(payment, now)
+    payment.save(update_fields=['attempts', 'next_check_at', 'last_checked_at'])
+
+
+async def reconcile_payments(payments):
+    """
+    Look the given payments up at Khalti concurrently (bounded by
+    KHALTI_RECONCILE_CONCURRENCY) and store the results. Payments are
+    updated in place.
+    """
+    client = get_client()
+    semaphore = asyncio.Semaphore(settings.KHALTI_RECONCILE_CONCURRENCY)
+
+    async def reconcile(payment):
+        async with semaphore:
+            try:
+                verification = await client.lookup(payment.pidx)
+            except KhaltiError as e:
+                logger.warning("khalti lookup failed", extra={'pidx': payment.pidx, 'error': str(e)})
+                await sync_to_async(apply_failure)(payment)
+                return
+        await sync_to_async(apply_lookup)(payment, verification)
+
+    await asyncio.gather(*(reconcile(payment) for payment in payments))
+
+
+def claim_lookup(payment):
+    """
+    Atomically take the right to look `payment` up now. A single conditional
+    UPDATE, so across all workers at most one caller wins per
+    KHALTI_VERIFY_MIN_INTERVAL and everyone else reuses its result.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.KHALTI_VERIFY_MIN_INTERVAL)
+    claimed = (
+        PendingPayment.objects
+        .filter(pk=payment.pk)
+        .exclude(status__in=FINAL_STATUSES)
+        .filter(Q(last_checked_at__isnull=True) | Q(last_checked_at__lte=stale))
+        .update(last_checked_at=now)
+    )
+    return claimed == 1
+
+
+async def _claim_and_reconcile(payment):
+    if await sync_to_async(claim_lookup)(payment):
+        await reconcile_payments([payment])
+        return True
+    return False
+
+
+# (event loop id, pidx) -> task doing the lookup, shared by concurrent callers
+_lookups = {}
+
+
+async def refresh_payment(payment):
+    """
+    Bring `payment` up to date for khalti_verify. Final payments are returned
+    as stored. Otherwise concurrent callers in this process share a single
+    lookup task, and callers in other processes lose the claim_lookup race
+    and read the stored state instead of calling Khalti themselves.
+    """
+    if payment.status in FINAL_STATUSES:
+        return payment
+
+    key = (id(asyncio.get_running_loop()), payment.pidx)
+    task = _lookups.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_claim_and_reconcile(payment))
+        _lookups[key] = task
+        task.add_done_callback(lambda _: _lookups.pop(key, None))
+        # Shielded like the waiters: cancelling this request must not
+        # cancel the lookup they are sharing
+        if await asyncio.shield(task):
+            return payment
+    else:
+        await asyncio.shield(task)
+
+    await payment.arefresh_from_db()
+    return payment
+
+
+async def reconcile_due(batch_size=None):
+    """
+    Reconcile one batch of due payments. Returns how many were processed.
+    """
+    payments = await sync_to_async(claim_due_payments)(batch_size or settings.KHALTI_RECONCILE_BATCH_SIZE)
+    await reconcile_payments(payments)
+    return len(payments)
+
+
+async def run_worker(interval=None, batch_size=None, stop=None):
+    """
+    Reconcile due payments until `stop` (an asyncio.Event) is set. Sleeps
+    between batches only when there was nothing to do.
+    """
+    interval = interval if interval is not None else settings.KHALTI_RECONCILE_INTERVAL
+    next_purge = 0
+    while stop is None or not stop.is_set():
+        # Expired Idempotency-Keys are cleaned up here, at most hourly
+        if time.monotonic() >= next_purge:
+            purged = await sync_to_async(purge_expired_keys)()
+            if purged:
+                logger.info("purged expired idempotency keys", extra={'count': purged})
+            next_purge = time.monotonic() + PURGE_INTERVAL
+        if not await reconcile_due(batch_size):
+            await asyncio.sleep(interval)
@@ -1,3 +1,493 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cart.models import Cart
+from cart.pricing import add_items
+from backend.authentication import Auth0JSONWebTokenAuthentication, Auth0User
+from backend.paginators import EstimatedCountPaginator
+from . import gateway
+from .fake_server import FakeKhaltiServer
+from products.models import Card, CardSales, Category, DailyCategorySales
+from products.sales import rebuild_sales
+from .models import IdempotencyKey, OrderLine, PendingPayment, PurchaseHistory
+from .orders import create_order_lines, revenue_per_category, units_sold_per_card
+from .reconcile import apply_lookup, reconcile_due, record_purchase, refresh_payment
+
+
+@override_settings(KHALTI_RETRY_BACKOFF=0, KHALTI_MAX_RETRIES=2, KHALTI_BREAKER_THRESHOLD=2, KHALTI_BREAKER_RESET=60)
+class KhaltiClientTests(TestCase):
+    def setUp(self):
+        self.server = FakeKhaltiServer().start()
+        self.addCleanup(self.server.stop)
+        self.client_ = gateway.KhaltiClient(base_url=self.server.base_url, secret_key='test')
+
+    def run_async(self, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await self.client_.aclose()
+        return asyncio.run(run())
+
+    def test_initiate_then_lookup(self):
+        async def flow():
+            initiated = await self.client_.initiate({'amount': 1500, 'purchase_order_id': 'order-1'})
+            return await self.client_.lookup(initiated['pidx'])
+        result = self.run_async(flow())
+        self.assertEqual(result['status'], 'Completed')
+        self.assertEqual(result['total_amount'], 1500)
+
+    def test_transient_failures_are_retried(self):
+        self.server.fake.failure_rate = 1.0
+        with self.assertRaises(gateway.KhaltiError):
+            self.run_async(self.client_.initiate({'amount': 1500}))
+        # First attempt plus KHALTI_MAX_RETRIES retries
+        self.assertEqual(len(self.server.fake.requests), 3)
+
+    def test_initiate_is_not_retried_once_sent(self):
+        import httpx
+
+        for error, calls in ((httpx.ReadTimeout('slow'), 1), (httpx.ConnectError('refused'), 3)):
+            http = mock.Mock(post=mock.AsyncMock(side_effect=error))
+            with mock.patch.object(self.client_, '_http', return_value=http):
+                with self.assertRaises(gateway.KhaltiError):
+                    self.run_async(self.client_.initiate({'amount': 1500}))
+            self.assertEqual(http.post.await_count, calls)
+
+        # lookup is safe to repeat, so any transport error is retried
+        self.client_.breaker.record_success()
+        http = mock.Mock(post=mock.AsyncMock(side_effect=httpx.ReadTimeout('slow')))
+        with mock.patch.object(self.client_, '_http', return_value=http):
+            with self.assertRaises(gateway.KhaltiError):
+                self.run_async(self.client_.lookup('pidx'))
+        self.assertEqual(http.post.await_count, 3)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(gateway.KhaltiError):
+            self.run_async(self.client_.lookup('unknown'))
+        self.assertEqual(len(self.server.fake.requests), 1)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.fake.failure_rate = 1.0
+        for _ in range(2):
+            with self.assertRaises(gateway.KhaltiError):
+                self.run_async(self.client_.initiate({'amount': 1500}))
+        calls = len(self.server.fake.requests)
+        with self.assertRaises(gateway.KhaltiUnavailable):
+            self.run_async(self.client_.initiate({'amount': 1500}))
+        self.assertEqual(len(self.server.fake.requests), calls)
+
+    def test_cancelled_half_open_trial_is_released(self):
+        breaker = self.client_.breaker
+        for _ in range(breaker.threshold):
+            breaker.record_failure()
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertEqual(breaker.state, 'half-open')
+
+        http = mock.Mock(post=mock.AsyncMock(side_effect=asyncio.CancelledError))
+        with mock.patch.object(self.client_, '_http', return_value=http):
+            with self.assertRaises(asyncio.CancelledError):
+                self.run_async(self.client_.lookup('pidx'))
+        self.assertFalse(breaker._trial_in_flight)
+
+        # The next trial is let through once the reset timeout passes again
+        breaker.opened_at -= breaker.reset_timeout
+        result = self.run_async(self.client_.initiate({'amount': 1500}))
+        self.assertIn('pidx', result)
+        self.assertEqual(breaker.state, 'closed')
+
+
+class KhaltiViewTests(TestCase):
+    def setUp(self):
+        self.server = FakeKhaltiServer().start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.object(gateway, '_client', gateway.KhaltiClient(base_url=self.server.base_url, secret_key='test'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        principal = Auth0User({'sub': 'auth0|1', 'email': 'buyer@example.com', 'name': 'Buyer'})
+        patcher = mock.patch.object(Auth0JSONWebTokenAuthentication, 'authenticate', return_value=(principal, 'token'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.card = Card.objects.create(name='Chess', description='d', price=Decimal('25.00'))
+        self.order = {'items': [{'id': self.card.id, 'quantity': 1}]}
+
+    def post(self, path, data, **headers):
+        return self.client.post(path, data, content_type='application/json', HTTP_AUTHORIZATION='Bearer token', **headers)
+
+    def test_checkout_flow(self):
+        initiated = self.post('/khalti/initiate/', {'amount': 25, **self.order}).json()
+        verified = self.post('/khalti/verify/', {'pidx': initiated['pidx']}).json()
+        self.assertEqual(verified['status'], 'Completed')
+        purchase = PurchaseHistory.objects.get(pk=verified['purchase_id'])
+        self.assertEqual(purchase.user_sub, 'auth0|1')
+        self.assertEqual(purchase.total_amount, 25)
+        self.assertEqual(purchase.items, [{'id': self.card.id, 'name': 'Chess', 'price': '25.00', 'quantity': 1}])
+        self.assertEqual(purchase.lines.count(), 1)
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_khalti_time_is_reported(self):
+        response = self.post('/khalti/initiate/', self.order)
+        self.assertIn('khalti;dur=', response['Server-Timing'])
+
+    def test_amount_is_computed_server_side(self):
+        response = self.post('/khalti/initiate/', {'amount': 1, **self.order})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['amount'], '25.00')
+        self.assertEqual(self.server.fake.requests, [])
+
+        self.post('/khalti/initiate/', {'items': [{'id': self.card.id, 'quantity': 2}]})
+        self.assertEqual(PendingPayment.objects.get().amount, 5000)
+
+    def test_checkout_from_server_cart(self):
+        cart = Cart.objects.create(user_sub='auth0|1')
+        add_items(cart, {self.card.id: 3})
+        pidx = self.post('/khalti/initiate/', {}).json()['pidx']
+        self.assertEqual(PendingPayment.objects.get(pidx=pidx).amount, 7500)
+
+        self.post('/khalti/verify/', {'pidx': pidx})
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.lines), (0, []))
+
+    def test_items_added_after_initiate_stay_in_the_cart(self):
+        other = Card.objects.create(name='Other', price=10)
+        cart = Cart.objects.create(user_sub='auth0|1')
+        add_items(cart, {self.card.id: 3})
+        pidx = self.post('/khalti/initiate/', {}).json()['pidx']
+        add_items(cart, {self.card.id: 1, other.id: 2})
+
+        self.post('/khalti/verify/', {'pidx': pidx})
+        cart.refresh_from_db()
+        self.assertEqual(
+            [(line['id'], line['quantity']) for line in cart.lines],
+            [(self.card.id, 1), (other.id, 2)],
+        )
+
+    def test_empty_cart_cannot_be_checked_out(self):
+        self.assertEqual(self.post('/khalti/initiate/', {}).status_code, 400)
+
+    def test_verify_reads_reconciled_state(self):
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        PendingPayment.objects.filter(pidx=pidx).update(next_check_at=timezone.now())
+        self.assertEqual(async_to_sync(reconcile_due)(), 1)
+
+        lookups = len(self.server.fake.requests)
+        verified = self.post('/khalti/verify/', {'pidx': pidx}).json()
+        self.assertEqual(verified['status'], 'Completed')
+        self.assertEqual(len(self.server.fake.requests), lookups)
+
+    def test_reconciliation_is_idempotent(self):
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        self.post('/khalti/verify/', {'pidx': pidx})
+        payment = PendingPayment.objects.get(pidx=pidx)
+        payment.next_check_at = timezone.now()
+        payment.status = 'Initiated'
+        payment.save()
+        async_to_sync(reconcile_due)()
+        self.assertEqual(PurchaseHistory.objects.filter(pidx=pidx).count(), 1)
+
+    def test_pending_payment_is_rechecked_with_backoff(self):
+        self.server.fake.lookup_status = 'Pending'
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        verified = self.post('/khalti/verify/', {'pidx': pidx}).json()
+        self.assertEqual(verified['status'], 'Pending')
+        payment = PendingPayment.objects.get(pidx=pidx)
+        self.assertEqual(payment.attempts, 1)
+        self.assertGreater(payment.next_check_at, timezone.now() + timedelta(seconds=5))
+
+        # An immediate re-poll doesn't call Khalti again
+        lookups = len(self.server.fake.requests)
+        self.post('/khalti/verify/', {'pidx': pidx})
+        self.assertEqual(len(self.server.fake.requests), lookups)
+
+    def test_lookup_only_writes_its_own_fields(self):
+        payment = PendingPayment.objects.create(pidx='p1', user_sub='auth0|1', user_email='x@example.com', user_name='X')
+        PendingPayment.objects.filter(pk=payment.pk).update(purchase_order_id='changed', from_cart=True)
+        apply_lookup(payment, {'status': 'Pending'})
+        payment = PendingPayment.objects.get(pk=payment.pk)
+        self.assertEqual((payment.status, payment.attempts), ('Pending', 1))
+        self.assertEqual((payment.purchase_order_id, payment.from_cart), ('changed', True))
+
+    def test_cannot_verify_someone_elses_payment(self):
+        PendingPayment.objects.create(pidx='other', user_sub='auth0|2', user_email='x@example.com', user_name='X')
+        self.assertEqual(self.post('/khalti/verify/', {'pidx': 'other'}).status_code, 404)
+
+    def test_minimum_amount(self):
+        Card.objects.filter(pk=self.card.pk).update(price=5)
+        response = self.post('/khalti/initiate/', self.order)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.server.fake.requests, [])
+
+    def test_requires_authentication(self):
+        with mock.patch.object(Auth0JSONWebTokenAuthentication, 'authenticate', return_value=None):
+            response = self.client.post('/khalti/initiate/', {'amount': 25}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_concurrent_verifies_share_one_lookup(self):
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        lookups = len(self.server.fake.requests)
+
+        async def verify_twice():
+            first = await PendingPayment.objects.aget(pidx=pidx)
+            second = await PendingPayment.objects.aget(pidx=pidx)
+            return await asyncio.gather(refresh_payment(first), refresh_payment(second))
+
+        results = async_to_sync(verify_twice)()
+        self.assertEqual([payment.status for payment in results], ['Completed', 'Completed'])
+        self.assertEqual(len(self.server.fake.requests), lookups + 1)
+        self.assertEqual(PurchaseHistory.objects.filter(pidx=pidx).count(), 1)
+
+    def test_cancelled_leader_does_not_cancel_the_shared_lookup(self):
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        self.server.fake.latency = 0.2
+
+        async def cancel_leader():
+            leader = asyncio.ensure_future(refresh_payment(await PendingPayment.objects.aget(pidx=pidx)))
+            await asyncio.sleep(0.05)
+            waiter = asyncio.ensure_future(refresh_payment(await PendingPayment.objects.aget(pidx=pidx)))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            return await waiter
+
+        self.assertEqual(async_to_sync(cancel_leader)().status, 'Completed')
+        self.assertEqual(PurchaseHistory.objects.filter(pidx=pidx).count(), 1)
+
+    def test_idempotency_key_replays_initiate(self):
+        first = self.post('/khalti/initiate/', self.order, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        second = self.post('/khalti/initiate/', self.order, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(self.server.fake.requests), 1)
+
+    @override_settings(KHALTI_RETRY_BACKOFF=0)
+    def test_gateway_failure_is_not_replayed(self):
+        self.server.fake.failure_rate = 1.0
+        failed = self.post('/khalti/initiate/', self.order, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(failed.status_code, 502)
+
+        self.server.fake.failure_rate = 0
+        retried = self.post('/khalti/initiate/', self.order, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retried.status_code, 200)
+        self.assertFalse(retried.has_header('Idempotent-Replayed'))
+
+    def test_unexpected_failure_is_not_replayed(self):
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        with mock.patch('khalti.views.refresh_payment', side_effect=RuntimeError('database hiccup')), \
+                self.assertLogs('khalti.views', 'ERROR'):
+            failed = self.post('/khalti/verify/', {'pidx': pidx}, HTTP_IDEMPOTENCY_KEY=f'verify-{pidx}')
+        self.assertEqual(failed.status_code, 500)
+        self.assertNotIn('hiccup', failed.json()['error'])
+
+        retried = self.post('/khalti/verify/', {'pidx': pidx}, HTTP_IDEMPOTENCY_KEY=f'verify-{pidx}')
+        self.assertEqual(retried.json()['status'], 'Completed')
+        self.assertFalse(retried.has_header('Idempotent-Replayed'))
+
+        # Malformed requests are still the client's fault
+        self.assertEqual(self.post('/khalti/verify/', {}).status_code, 400)
+        self.assertEqual(self.post('/khalti/initiate/', [1]).status_code, 400)
+
+    def test_abandoned_idempotency_key_is_reclaimed(self):
+        key = IdempotencyKey.objects.create(user_sub='auth0|1', key='checkout-1', path='/khalti/initiate/')
+        self.assertEqual(self.post('/khalti/initiate/', self.order, HTTP_IDEMPOTENCY_KEY='checkout-1').status_code, 409)
+
+        IdempotencyKey.objects.filter(pk=key.pk).update(created_at=timezone.now() - timedelta(minutes=10))
+        response = self.post('/khalti/initiate/', self.order, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get(key='checkout-1').response_status, 200)
+
+    def test_expired_idempotency_keys_are_purged(self):
+        old = IdempotencyKey.objects.create(user_sub='auth0|1', key='old', path='/khalti/initiate/')
+        IdempotencyKey.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+        IdempotencyKey.objects.create(user_sub='auth0|1', key='new', path='/khalti/initiate/')
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+    def test_pending_verify_is_not_replayed(self):
+        self.server.fake.lookup_status = 'Pending'
+        pidx = self.post('/khalti/initiate/', self.order).json()['pidx']
+        pending = self.post('/khalti/verify/', {'pidx': pidx}, HTTP_IDEMPOTENCY_KEY=f'verify-{pidx}')
+        self.assertTrue(pending.has_header('Retry-After'))
+
+        self.server.fake.lookup_status = 'Completed'
+        PendingPayment.objects.filter(pidx=pidx).update(last_checked_at=None)
+        completed = self.post('/khalti/verify/', {'pidx': pidx}, HTTP_IDEMPOTENCY_KEY=f'verify-{pidx}')
+        self.assertEqual(completed.json()['status'], 'Completed')
+
+
+class PurchaseHistoryViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.purchases = []
+        base = timezone.now() - timedelta(days=10)
+        for i in range(5):
+            purchase = PurchaseHistory.objects.create(
+                user_sub='auth0|1', user_email='buyer@example.com', user_name='Buyer',
+                total_amount=10 + i, items=[{'name': f'Item {i}', 'quantity': 1, 'price': 10 + i}],
+                pidx=f'pidx-{i}', status='Completed', purchase_order_id=f'order-{i}',
+            )
+            # auto_now_add ignores the value passed to create()
+            PurchaseHistory.objects.filter(pk=purchase.pk).update(purchase_date=base + timedelta(days=i))
+            cls.purchases.append(purchase)
+        PurchaseHistory.objects.create(
+            user_sub='auth0|2', user_email='x@example.com', user_name='X', total_amount=1,
+            items=[], pidx='pidx-other', status='Completed', purchase_order_id='other',
+        )
+
+    def setUp(self):
+        principal = Auth0User({'sub': 'auth0|1', 'email': 'buyer@example.com', 'name': 'Buyer'})
+        patcher = mock.patch.object(Auth0JSONWebTokenAuthentication, 'authenticate', return_value=(principal, 'token'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        return self.client.get('/khalti/history/', params, HTTP_AUTHORIZATION='Bearer token').json()
+
+    def test_pages_newest_first(self):
+        ids, cursor = [], None
+        while True:
+            data = self.get(limit=2, **({'cursor': cursor} if cursor else {}))
+            ids += [purchase['id'] for purchase in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(ids, [purchase.id for purchase in reversed(self.purchases)])
+
+    def test_summary_leaves_out_items(self):
+        with self.assertNumQueries(1):
+            data = self.get(summary=1)
+        self.assertNotIn('items', data['results'][0])
+
+    def test_since_returns_only_newer_purchases(self):
+        since = PurchaseHistory.objects.get(pk=self.purchases[2].pk).purchase_date
+        data = self.get(since=since.isoformat())
+        self.assertEqual([p['id'] for p in data['results']], [self.purchases[4].id, self.purchases[3].id])
+
+    def test_naive_since_is_read_as_utc(self):
+        since = PurchaseHistory.objects.get(pk=self.purchases[2].pk).purchase_date
+        response = self.client.get(
+            '/khalti/history/', {'since': since.replace(tzinfo=None).isoformat()}, HTTP_AUTHORIZATION='Bearer token',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.json()['results']], [self.purchases[4].id, self.purchases[3].id])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/khalti/history/', {'cursor': 'bogus'}, HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderLineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = Category.objects.create(name='Games')
+        cls.chess = Card.objects.create(name='Chess', description='d', price=10, category=cls.games)
+        cls.dice = Card.objects.create(name='Dice', description='d', price=2, category=cls.games)
+
+    def make_purchase(self, pidx, items):
+        purchase = PurchaseHistory.objects.create(
+            user_sub='auth0|1', user_email='a@example.com', user_name='A', total_amount=0,
+            items=items, pidx=pidx, status='Completed', purchase_order_id=pidx,
+        )
+        create_order_lines(purchase, items)
+        return purchase
+
+    def test_items_are_resolved_by_id_or_name(self):
+        purchase = self.make_purchase('p1', [
+            {'id': self.chess.id, 'name': 'Chess', 'quantity': 2, 'price': 10},
+            {'name': 'Dice', 'quantity': '3', 'price': '2.50'},
+            {'name': 'Gone', 'quantity': 1, 'price': 1},
+            'garbage',
+        ])
+        lines = {line.name: line for line in purchase.lines.all()}
+        self.assertEqual(set(lines), {'Chess', 'Dice', 'Gone'})
+        self.assertEqual(lines['Chess'].card, self.chess)
+        self.assertEqual(lines['Dice'].card, self.dice)
+        self.assertEqual(lines['Dice'].quantity, 3)
+        self.assertIsNone(lines['Gone'].card)
+
+    def test_sales_aggregates(self):
+        self.make_purchase('p1', [{'id': self.chess.id, 'quantity': 2, 'price': 10}])
+        self.make_purchase('p2', [{'id': self.chess.id, 'quantity': 1, 'price': 10}, {'id': self.dice.id, 'quantity': 5, 'price': 2}])
+
+        with self.assertNumQueries(1):
+            per_card = {row['card_id']: row for row in units_sold_per_card()}
+        self.assertEqual(per_card[self.chess.id]['units'], 3)
+        self.assertEqual(per_card[self.dice.id]['revenue'], 10)
+
+        [games] = revenue_per_category()
+        self.assertEqual(games['revenue'], 40)
+
+    def test_recorded_purchases_update_rollups(self):
+        items = [{'id': self.chess.id, 'quantity': 2, 'price': 10}, {'id': self.dice.id, 'quantity': 1, 'price': 2}]
+        payment = PendingPayment(pidx='p1', user_sub='auth0|1', user_email='a@example.com', user_name='A', items=items)
+        record_purchase(payment, {'status': 'Completed', 'total_amount': 2200})
+        record_purchase(payment, {'status': 'Completed', 'total_amount': 2200})  # replay is not double counted
+
+        self.assertEqual(CardSales.objects.get(card=self.chess).units, 2)
+        self.assertEqual(DailyCategorySales.objects.get(category=self.games).revenue, 22)
+
+        # A rebuild from the order lines lands on the same numbers
+        CardSales.objects.all().delete()
+        rebuild_sales(OrderLine)
+        self.assertEqual(
+            dict(CardSales.objects.values_list('card_id', 'units')),
+            {self.chess.id: 2, self.dice.id: 1},
+        )
+        self.assertEqual(DailyCategorySales.objects.get(category=self.games).revenue, 22)
+
+
+class PurchaseHistoryAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        for i in range(3):
+            PurchaseHistory.objects.create(
+                user_sub=f'auth0|{i}', user_email=f'user{i}@example.com', user_name=f'User {i}',
+                total_amount=10, items=[], pidx=f'pidx-{i}', status='Completed', purchase_order_id=f'order-{i}',
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def pretend_table_size(self, rows):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute(
+                "UPDATE sqlite_stat1 SET stat = %s WHERE tbl = %s", [f'{rows} 1', PurchaseHistory._meta.db_table],
+            )
+
+    def test_large_unfiltered_lists_use_the_estimate(self):
+        self.pretend_table_size(2000000)
+        self.assertEqual(EstimatedCountPaginator(PurchaseHistory.objects.all(), 100).count, 2000000)
+        self.assertEqual(EstimatedCountPaginator(PurchaseHistory.objects.filter(status='Completed'), 100).count, 3)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/khalti/purchasehistory/')
+        self.assertContains(response, '2000000 Purchase Histories')
+        self.assertFalse(any('COUNT(*)' in query['sql'] for query in context.captured_queries))
+
+    def test_small_tables_are_counted_exactly(self):
+        self.pretend_table_size(50)
+        self.assertEqual(EstimatedCountPaginator(PurchaseHistory.objects.all(), 100).count, 3)
+
+    def test_search_and_date_drilldown(self):
+        response = self.client.get('/admin/khalti/purchasehistory/', {'q': 'auth0|1'})
+        self.assertContains(response, 'user1@example.com')
+        self.assertNotContains(response, 'user2@example.com')
+
+        year = timezone.now().year
+        response = self.client.get('/admin/khalti/purchasehistory/', {'purchase_date__year': year})
+        self.assertContains(response, '3 Purchase Histories')
@@ -1,6 +1,8 @@
 import json
+import logging
 import uuid
-import requests
+from decimal import Decimal, InvalidOperation
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -8,35 +10,70 @@ from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import PurchaseHistory
+from backend.authentication import jwt_required
+from backend.routers import read_replica
+from datetime import timedelta, timezone as datetime_timezone
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from cart.models import Cart
+from cart.pricing import parse_quantities, price_items
+from products.pagination import InvalidCursor, decode_token, encode_token, get_page_size
+from .gateway import KhaltiError, KhaltiUnavailable, get_client
+from .models import PendingPayment, PurchaseHistory
+from .idempotency import idempotent
+from .reconcile import FINAL_STATUSES, refresh_payment
+
+logger = logging.getLogger(__name__)
+
+# What a malformed request raises: bad JSON, a missing field, a bad amount.
+# Anything else is our failure and answered 500, which the Idempotency-Key
+# store never keeps, so a retry runs the request again.
+BAD_REQUEST_ERRORS = (ValueError, KeyError, InvalidOperation)
+
+# Khalti calls go through the pooled async client in khalti/gateway.py, so a
+# slow Khalti response parks a coroutine instead of blocking a worker when
+# served through backend/asgi.py.
 
 # ------------------------------------------------------------------
 # 1. Initiate payment (called from React) - JWT PROTECTED
 # ------------------------------------------------------------------
-KHALTI_INITIATE_URL = "https://a.khalti.com/api/v2/epayment/initiate/"   # live URL
-# For testing use: https://a.khalti.com/api/v2/epayment/initiate/
-KHALTI_SECRET_KEY = "live_secret_key_68791341fdd94846a146f0457ff7b455"   # <-- keep this in env!
-
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def khalti_initiate(request):
+@csrf_exempt
+@require_http_methods(["POST"])
+@jwt_required
+@idempotent
+async def khalti_initiate(request):
     try:
         # Get authenticated user from JWT
         user = request.user
-        print(f"User authenticated: {user.username}, Email: {getattr(user, 'email', 'N/A')}")
-        
-        data = request.data
-        print(f"Received payload: {data}")
-        
-        amount = int(data["amount"]) * 100                # Khalti expects paisa
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Request body must be a JSON object"}, status=400)
+
+        # The amount is computed here, never taken from the client: from the
+        # items sent for a direct "buy now", otherwise from the server cart
+        user_sub = getattr(user, 'auth0_sub', None) or user.username
+        from_cart = "items" not in data
+        if from_cart:
+            cart = await Cart.objects.filter(user_sub=user_sub).only('total', 'lines').afirst()
+            items, total = (cart.lines, cart.total) if cart else ([], Decimal('0.00'))
+        else:
+            items, total = await sync_to_async(price_items)(parse_quantities(data["items"]))
+        if not items:
+            return JsonResponse({"error": "Your cart is empty"}, status=400)
+
+        amount = int(total * 100)                         # Khalti expects paisa
+        if "amount" in data and Decimal(str(data["amount"])).quantize(Decimal('0.01')) != total:
+            # Prices changed since the client rendered its total; let the
+            # user see the real amount before paying it
+            return JsonResponse({"error": "Cart total has changed", "amount": str(total)}, status=409)
         if amount < 1000:  # Khalti minimum is Rs 10
-            error_msg = f"Minimum amount is Rs 10. You tried to pay Rs {data['amount']}"
-            print(f"Amount validation failed: {error_msg}")
-            return Response({"error": error_msg}, status=400)
+            error_msg = f"Minimum amount is Rs 10. You tried to pay Rs {total}"
+            logger.info("khalti initiate rejected", extra={'user_sub': user_sub, 'amount': amount})
+            return JsonResponse({"error": error_msg}, status=400)
             
         purchase_order_id = str(data.get("purchase_order_id") or uuid.uuid4())
         purchase_order_name = data.get("purchase_order_name", "Order")
-        items = data.get("items", [])  # Get items from request
 
         # Get user info from JWT token attributes (set by our authentication backend)
         user_name = getattr(user, 'name', None) or user.username
@@ -55,89 +92,109 @@ def khalti_initiate(request):
             }
         }
 
-        print(f"Sending to Khalti: {payload}")
+        # Only identifiers and sizes are logged, never the customer details
+        logger.debug("khalti initiate", extra={
+            'user_sub': user_sub, 'amount': amount, 'items': len(items),
+            'purchase_order_id': purchase_order_id, 'from_cart': from_cart,
+        })
 
-        headers = {
-            "Authorization": f"Key {KHALTI_SECRET_KEY}",
-            "Content-Type": "application/json",
-        }
+        khalti_resp = await get_client().initiate(payload)
 
-        resp = requests.post(KHALTI_INITIATE_URL, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
-        khalti_resp = resp.json()
+        # Remember the payment so the reconciliation worker can confirm it
+        # even if the browser never comes back to khalti_verify
+        await PendingPayment.objects.acreate(
+            pidx=khalti_resp["pidx"],
+            user_sub=user_sub,
+            user_email=user_email,
+            user_name=user_name,
+            items=items,
+            from_cart=from_cart,
+            amount=amount,
+            purchase_order_id=purchase_order_id,
+            next_check_at=timezone.now() + timedelta(seconds=settings.KHALTI_RECONCILE_INITIAL_DELAY),
+        )
 
         # Khalti returns: { "pidx": "...", "payment_url": "...", ... }
-        return Response({
+        return JsonResponse({
             "pidx": khalti_resp["pidx"],
             "payment_url": khalti_resp["payment_url"]
         })
 
-    except Exception as e:
-        print(f"Error in khalti_initiate: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return Response({"error": str(e)}, status=400)
+    except KhaltiUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except KhaltiError as e:
+        # The gateway failed, not the request: 502, which is never stored
+        # under an Idempotency-Key, so the client can retry with the same key
+        logger.warning("khalti initiate failed: %s", e)
+        return JsonResponse({"error": str(e)}, status=502)
+    except BAD_REQUEST_ERRORS as e:  # InvalidItems is a ValueError
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception:
+        logger.exception("khalti initiate failed")
+        return JsonResponse({"error": "Payment could not be started, please retry"}, status=500)
 
 
 # ------------------------------------------------------------------
 # 2. Verify payment (Khalti will POST to this endpoint after payment) - JWT PROTECTED
 # ------------------------------------------------------------------
-KHALTI_LOOKUP_URL = "https://a.khalti.com/api/v2/epayment/lookup/"
-
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def khalti_verify(request):
+@csrf_exempt
+@require_http_methods(["POST"])
+@jwt_required
+@idempotent
+async def khalti_verify(request):
     try:
         # Get authenticated user from JWT
         user = request.user
         
-        data = request.data
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Request body must be a JSON object"}, status=400)
         pidx = data["pidx"]                     # sent by Khalti in return_url query
-        items = data.get("items", [])           # Get items from request
 
-        print(f"Received items from frontend: {items}")
+        # Get user identifier - use Auth0 sub, not Django user ID
+        user_identifier = getattr(user, 'auth0_sub', None) or getattr(user, 'sub', None) or user.username
 
-        payload = {"pidx": pidx}
-        headers = {
-            "Authorization": f"Key {KHALTI_SECRET_KEY}",
-            "Content-Type": "application/json",
-        }
+        # Payments started before reconciliation existed have no pending row
+        # yet, so create one from what the frontend sends
+        payment, _ = await PendingPayment.objects.aget_or_create(
+            pidx=pidx,
+            defaults={
+                'user_sub': user_identifier,
+                'user_email': getattr(user, 'email', '') or f"{user.username}@example.com",
+                'user_name': getattr(user, 'name', '') or user.username,
+                'items': data.get("items", []),
+            },
+        )
+        if payment.user_sub != user_identifier:
+            return JsonResponse({"error": "Payment not found"}, status=404)
 
-        resp = requests.post(KHALTI_LOOKUP_URL, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
-        verification = resp.json()
+        # Normally the worker has already reconciled the payment and this is
+        # a plain read. If not, one caller looks it up (rate limited per
+        # payment) and concurrent duplicates share that single lookup.
+        payment = await refresh_payment(payment)
 
-        # verification["status"] == "Completed" means success
-        if verification.get("status") == "Completed":
-            # Get user identifier - use Auth0 sub, not Django user ID
-            user_identifier = getattr(user, 'auth0_sub', None) or getattr(user, 'sub', None) or user.username
-            user_email = getattr(user, 'email', '') or f"{user.username}@example.com"
-            user_name = getattr(user, 'name', '') or user.username
-            
-            print(f"Saving purchase for user: {user_identifier}, email: {user_email}, name: {user_name}")
-            print(f"Items to save: {items}")
-            
-            # Save purchase history
-            purchase = PurchaseHistory.objects.create(
-                user_sub=user_identifier,
-                user_email=user_email,
-                user_name=user_name,
-                total_amount=verification.get('total_amount', 0) / 100,  # Convert from paisa to Rs
-                items=items,
-                pidx=pidx,
-                status=verification.get('status'),
-                purchase_order_id=verification.get('purchase_order_id', '')
-            )
-            
-            return Response({
+        verification = payment.lookup_response or {"pidx": pidx, "status": payment.status}
+        if payment.purchase_id:
+            return JsonResponse({
                 **verification,
-                'purchase_id': purchase.id
+                'purchase_id': payment.purchase_id
             })
         
-        return Response(verification)
+        response = JsonResponse(verification)
+        if payment.status not in FINAL_STATUSES:
+            # Not settled yet - tell the client to poll again
+            response['Retry-After'] = str(settings.KHALTI_VERIFY_MIN_INTERVAL)
+        return response
 
-    except Exception as e:
-        return Response({"error": str(e)}, status=400)
+    except KhaltiUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except KhaltiError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+    except BAD_REQUEST_ERRORS as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception:
+        logger.exception("khalti verify failed")
+        return JsonResponse({"error": "Payment could not be verified, please retry"}, status=500)
 
 
 # ------------------------------------------------------------------
@@ -145,34 +202,76 @@ def khalti_verify(request):
 # ------------------------------------------------------------------
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def get_purchase_history(request):
+    """
+    One page of the user's purchases, newest first, as {results, next}.
+
+    ?cursor=  continue from the `next` of a previous page
+    ?limit=   page size, capped at HISTORY_MAX_PAGE_SIZE
+    ?summary=1  leave out `items` (not even fetched from the database)
+    ?since=   only purchases made after this ISO timestamp, for incremental sync
+    """
     try:
         # Get authenticated user from JWT
         user = request.user
         # Use Auth0 sub, not Django user ID
         user_sub = getattr(user, 'auth0_sub', None) or getattr(user, 'sub', None) or user.username
-        
-        print(f"Fetching purchase history for user: {user_sub}")
-        
-        # Get all purchases for this user
-        purchases = PurchaseHistory.objects.filter(user_sub=user_sub)
-        
-        print(f"Found {purchases.count()} purchases for user {user_sub}")
-        
+        summary = request.GET.get('summary') in ('1', 'true')
+
+        # Walks the (user_sub, -purchase_date, -id) index
+        purchases = PurchaseHistory.objects.filter(user_sub=user_sub).order_by('-purchase_date', '-id')
+        if summary:
+            purchases = purchases.defer('items')
+
+        since = request.GET.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({"error": "since must be an ISO 8601 timestamp"}, status=400)
+            if timezone.is_naive(since):
+                # Timestamps without an offset are taken as UTC
+                since = timezone.make_aware(since, datetime_timezone.utc)
+            purchases = purchases.filter(purchase_date__gt=since)
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            position = decode_token(cursor)
+            last_date, last_id = parse_datetime(position.get('d') or ''), position.get('id')
+            if last_date is None or not isinstance(last_id, int):
+                raise InvalidCursor('Invalid cursor')
+            purchases = purchases.filter(
+                Q(purchase_date__lt=last_date) | Q(purchase_date=last_date, id__lt=last_id)
+            )
+
+        page_size = get_page_size(request, settings.HISTORY_PAGE_SIZE, settings.HISTORY_MAX_PAGE_SIZE)
+        page = list(purchases[:page_size + 1])
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = encode_token({'d': page[-1].purchase_date.isoformat(), 'id': page[-1].id})
+
         # Serialize the data
         purchase_data = []
-        for purchase in purchases:
-            purchase_data.append({
+        for purchase in page:
+            data = {
                 'id': purchase.id,
                 'purchase_date': purchase.purchase_date.isoformat(),
                 'total_amount': float(purchase.total_amount),
-                'items': purchase.items,
                 'status': purchase.status,
                 'pidx': purchase.pidx,
                 'purchase_order_id': purchase.purchase_order_id
-            })
+            }
+            if not summary:
+                data['items'] = purchase.items
+            purchase_data.append(data)
         
-        return Response(purchase_data)
+        return Response({
+            'results': purchase_data,
+            'next': next_cursor,
+        })
     
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=400)
     except Exception as e:
-        return Response({"error": str(e)}, status=400)
\ No newline at end of file
+        return Response({"error": str(e)}, status=400)
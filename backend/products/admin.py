@@ -1,15 +1,30 @@
 from django.contrib import admin
+
+from backend.paginators import EstimatedCountPaginator
+from . import search
 from .models import Card, Category
 
 # Register your models here.
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description', 'created_at']
+    list_display = ['name', 'parent', 'product_count', 'created_at']
+    list_select_related = ['parent']
     search_fields = ['name']
 
 
 @admin.register(Card)
 class CardAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price', 'category']
+    list_display = ['name', 'sku', 'price', 'category']
     list_filter = ['category']
-    search_fields = ['name', 'description']
\ No newline at end of file
+    list_select_related = ['category']
+    # Searched through the full-text index, see get_search_results
+    search_fields = ['name']
+    search_help_text = 'Words from the name, description or category, or an exact SKU'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return search.filter_cards(queryset, term) | queryset.filter(sku=term), False
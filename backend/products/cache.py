@@ -0,0 +1,171 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from backend import metrics
+from backend.routers import use_primary
+from backend.renderers import dumps
+
+
+# Every cached catalog response is keyed on this version. Saving or deleting
+# a Card/Category bumps it (see products/signals.py), which orphans all old
+# entries at once instead of having to find and delete them one by one.
+VERSION_KEY = 'catalog:version'
+# When the version was last bumped (time.time()), see recently_changed
+BUMPED_AT_KEY = 'catalog:bumped_at'
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_cache()
+    cache.set(BUMPED_AT_KEY, time.time(), timeout=None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key missing (first write or evicted) - start a fresh version
+        cache.set(VERSION_KEY, get_catalog_version() + 1, timeout=None)
+
+
+def recently_changed():
+    """
+    True within DATABASE_REPLICA_LAG seconds of the last catalog write, when
+    a replica may not have that write yet.
+    """
+    bumped_at = get_cache().get(BUMPED_AT_KEY)
+    return bumped_at is not None and time.time() - bumped_at < settings.DATABASE_REPLICA_LAG
+
+
+def catalog_cache_key(view_name, request, version=None):
+    """
+    Build the cache key for a catalog request. Each distinct set of query
+    parameters (category, search term, cursor, ...) gets its own key.
+    """
+    if version is None:
+        version = get_catalog_version()
+    params = sorted((k, v) for k in request.GET for v in request.GET.getlist(k))
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()
+    return f'catalog:v{version}:{view_name}:{digest}'
+
+
+def etag_for_key(key):
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Run a function once per key at a time: callers arriving while the first
+    one is still running wait for it and get its result (or exception)
+    instead of repeating the work. Per process; across workers the shared
+    cache takes over once the first result is stored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [done event, result, exception]
+
+    def do(self, key, fn):
+        """Return (result, shared), `shared` being True for waiters."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], True
+        try:
+            call[1] = fn()
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1], False
+
+
+# Concurrent misses on the same catalog key share one view call
+in_flight = SingleFlight()
+
+
+def cached_catalog_response(view_name):
+    """
+    Cache the rendered JSON body of a catalog view.
+
+    The ETag is derived from the versioned cache key, so a client sending a
+    matching If-None-Match gets a 304 without the body being looked up or
+    serialized. Only successful, non-streaming responses are stored.
+
+    Identical requests that miss the cache at the same time are coalesced:
+    one runs the view, the others wait for and reuse its serialized body.
+
+    Under @read_replica, a miss shortly after a catalog write is rendered
+    from the primary: the body is cached under the new version for
+    CATALOG_CACHE_TIMEOUT, so a lagging replica's stale answer would stick.
+    That trades some primary reads after each write for not caching stale
+    pages; see DATABASE_REPLICA_LAG.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.GET.get('stream') in ('1', 'true'):
+                return view(request, *args, **kwargs)
+
+            key = catalog_cache_key(view_name, request)
+            etag = etag_for_key(key)
+
+            # Compression weakens the ETag (W/"..."), which still matches
+            client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if etag in (tag.removeprefix('W/') for tag in client_etags):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            cache = get_cache()
+            body = cache.get(key)
+            if body is None:
+                def render():
+                    if settings.DATABASE_REPLICAS and recently_changed():
+                        use_primary()
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    body = dumps(response.data)
+                    cache.set(key, body, timeout=settings.CATALOG_CACHE_TIMEOUT)
+                    return body
+
+                body, shared = in_flight.do(key, render)
+                if shared:
+                    metrics.coalesced_total.inc(view=view_name)
+                    if not isinstance(body, bytes):
+                        # The leader's request failed; errors aren't shared
+                        return view(request, *args, **kwargs)
+                elif not isinstance(body, bytes):
+                    return body
+
+            response = HttpResponse(body, content_type='application/json')
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,296 @@
+"""
+Bulk catalog import and export for the import_catalog / export_catalog
+commands.
+
+Files are CSV (with a header row) or JSON Lines, one card per row with the
+columns in CATALOG_COLUMNS. Rows are read, written and saved in chunks, so
+memory use depends on the batch size and not on the size of the file. Cards
+are matched on `sku`: known SKUs are updated, new ones created, and rows
+that change nothing are skipped.
+"""
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from . import search, tree
+from .cache import bump_catalog_version
+from .images import generate_variants
+from .models import Card, Category
+
+CATALOG_COLUMNS = ('sku', 'name', 'description', 'price', 'category', 'image')
+# Card fields an import can change (the image is handled separately)
+UPDATE_FIELDS = ('name', 'description', 'price', 'category_id')
+# Error messages kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def detect_format(path, format=None):
+    if format:
+        return format
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def read_rows(stream, format):
+    """
+    Yield (line number, row dict) for each row of a CSV or JSONL stream. A
+    line that isn't valid JSON is yielded as an InvalidRow instead of a dict.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, InvalidRow(f'Invalid JSON: {e}')
+            continue
+        yield number, row if isinstance(row, dict) else InvalidRow('Expected a JSON object')
+
+
+def clean_row(row):
+    if isinstance(row, InvalidRow):
+        raise row
+
+    def text(column, max_length=None):
+        value = row.get(column)
+        value = '' if value is None else str(value).strip()
+        if max_length and len(value) > max_length:
+            raise InvalidRow(f'{column} is longer than {max_length} characters')
+        return value
+
+    sku, name = text('sku', 64), text('name', 100)
+    if not sku:
+        raise InvalidRow('sku is required')
+    if not name:
+        raise InvalidRow('name is required')
+    try:
+        price = Decimal(text('price')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise InvalidRow(f"Invalid price {row.get('price')!r}")
+    if not price.is_finite() or price < 0 or price >= Decimal('1e8'):
+        raise InvalidRow(f"Invalid price {row.get('price')!r}")
+    return {
+        'sku': sku,
+        'name': name,
+        'description': text('description'),
+        'price': price,
+        'category': text('category', 100) or None,
+        'image': text('image'),
+    }
+
+
+class CategoryMap:
+    """
+    Category name -> id, loaded once and extended with the categories an
+    import creates, so rows are resolved without a query each.
+    """
+
+    def __init__(self):
+        self.ids = dict(Category.objects.values_list('name', 'id'))
+        self.created = 0
+
+    def resolve(self, names):
+        missing = set(names) - self.ids.keys()
+        if missing:
+            # Only count the ones this import adds, not those another
+            # process created since the map was loaded
+            found = dict(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+            Category.objects.bulk_create([Category(name=name) for name in missing - found.keys()], ignore_conflicts=True)
+            tree.assign_root_paths()
+            self.ids.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+            self.created += len(missing) - len(found)
+
+
+def fetch_image(source, image_root):
+    """
+    Return (content, file name) of an image given as an http(s) URL or a
+    path relative to `image_root`.
+    """
+    if source.startswith(('http://', 'https://')):
+        import requests
+
+        response = requests.get(source, timeout=30)
+        response.raise_for_status()
+        return response.content, Path(urlsplit(source).path).name or 'image'
+    path = Path(image_root) / source
+    return path.read_bytes(), path.name
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = self.created = self.updated = self.unchanged = self.images = 0
+        self.errors = []  # (line number, message), the first MAX_REPORTED_ERRORS
+        self.error_count = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rate(self):
+        return self.rows / max(time.monotonic() - self.started, 1e-9)
+
+
+class CatalogImporter:
+    """
+    Upsert cards chunk by chunk. Images named in the rows are fetched,
+    stored and given their responsive variants on `image_workers` threads.
+    """
+
+    def __init__(self, batch_size=1000, image_workers=4, image_root='.', progress=None):
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        self.image_root = image_root
+        self.progress = progress
+        self.stats = ImportStats()
+        self.categories = None
+
+    def run(self, rows):
+        self.categories = CategoryMap()
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            for chunk in chunked(rows, self.batch_size):
+                self.import_chunk(chunk, pool)
+                if self.progress:
+                    self.progress(self.stats)
+        if self.stats.created or self.stats.updated:
+            # Bulk writes skip the Card signals that keep the counts current
+            tree.recount_categories()
+        if self.stats.created or self.stats.updated or self.stats.images or self.categories.created:
+            bump_catalog_version()
+        return self.stats
+
+    def import_chunk(self, chunk, pool):
+        from cart.models import CartItem
+        from cart.pricing import refresh_carts
+
+        stats = self.stats
+        stats.rows += len(chunk)
+        rows = {}
+        for line, raw in chunk:
+            try:
+                row = clean_row(raw)
+            except InvalidRow as e:
+                stats.add_error(line, str(e))
+            else:
+                rows[row['sku']] = row  # A repeated SKU: the last row wins
+        self.categories.resolve(row['category'] for row in rows.values() if row['category'])
+
+        existing = Card.objects.filter(sku__in=rows).only('sku', 'image', *UPDATE_FIELDS).in_bulk(field_name='sku')
+        created, updated, repriced, images = [], [], [], []
+        for sku, row in rows.items():
+            values = {
+                'name': row['name'], 'description': row['description'], 'price': row['price'],
+                'category_id': self.categories.ids.get(row['category']),
+            }
+            card = existing.get(sku)
+            if card is None:
+                card = Card(sku=sku, **values)
+                created.append(card)
+            elif any(getattr(card, field) != value for field, value in values.items()):
+                if card.price != values['price'] or card.name != values['name']:
+                    repriced.append(card.pk)
+                for field, value in values.items():
+                    setattr(card, field, value)
+                updated.append(card)
+            else:
+                stats.unchanged += 1
+            # An exported file names the stored image; that needs no upload
+            if row['image'] and row['image'] != card.image.name:
+                images.append((card, row['image']))
+
+        with transaction.atomic():
+            # An upsert, so a SKU another import created in the meantime is
+            # updated instead of failing the chunk (it still counts as created)
+            Card.objects.bulk_create(
+                created, update_conflicts=True, unique_fields=['sku'], update_fields=list(UPDATE_FIELDS),
+            )
+            Card.objects.bulk_update(updated, UPDATE_FIELDS)
+            if created and created[0].pk is None:  # Backends that don't return ids
+                ids = dict(Card.objects.filter(sku__in=[card.sku for card in created]).values_list('sku', 'id'))
+                for card in created:
+                    card.pk = ids[card.sku]
+            # Bulk writes send no signals: index the cards and re-price the
+            # carts holding them here
+            search.index_cards([card.pk for card in created + updated])
+            refresh_carts(CartItem.objects.filter(card_id__in=repriced).values_list('cart_id', flat=True).distinct())
+        stats.created += len(created)
+        stats.updated += len(updated)
+
+        uploaded = []
+        futures = {pool.submit(self.store_image, card, source): source for card, source in images}
+        for future in as_completed(futures):
+            try:
+                uploaded.append(future.result())
+            except Exception as e:
+                stats.add_error(None, f'Image {futures[future]!r}: {e}')
+        Card.objects.bulk_update(uploaded, ['image', 'image_variants'])
+        stats.images += len(uploaded)
+
+    def store_image(self, card, source):
+        # Runs on a worker thread; touches storage only, never the database
+        content, name = fetch_image(source, self.image_root)
+        card.image.save(name, ContentFile(content), save=False)
+        card.image_variants = generate_variants(card.image)
+        return card
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    """
+    Yield every card as a CATALOG_COLUMNS dict, read in chunks of `chunk_size`.
+    """
+    queryset = Card.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values_list(
+        'sku', 'name', 'description', 'price', 'category__name', 'image',
+    ).iterator(chunk_size=chunk_size)
+    for sku, name, description, price, category, image in rows:
+        yield {
+            'sku': sku or '',
+            'name': name,
+            'description': description,
+            'price': str(price),
+            'category': category or '',
+            'image': image or '',
+        }
+
+
+def write_rows(stream, rows, format):
+    """
+    Write rows as CSV or JSON Lines and yield the running count every 1000
+    rows and at the end, for progress reporting.
+    """
+    if format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=CATALOG_COLUMNS)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda row: stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+    count = 0
+    for count, row in enumerate(rows, 1):
+        write(row)
+        if count % 1000 == 0:
+            yield count
+    yield count
@@ -0,0 +1,50 @@
+"""
+Facet counts for list_cards (?facets=1): how many of the filtered cards fall
+in each category and each price bucket. Both come from a single GROUP BY
+over (category_id, bucket), folded into the two facets in Python.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def price_buckets():
+    """(lower, upper) bounds from CATALOG_PRICE_BUCKETS; the last upper is None."""
+    bounds = [None, *settings.CATALOG_PRICE_BUCKETS, None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def bucket_expression(buckets):
+    # Index of the bucket a card's price falls in
+    whens = [When(price__lt=upper, then=Value(i)) for i, (lower, upper) in enumerate(buckets) if upper is not None]
+    return Case(*whens, default=Value(len(buckets) - 1), output_field=IntegerField())
+
+
+def _bound(value):
+    return None if value is None else str(value)
+
+
+def card_facets(queryset):
+    buckets = price_buckets()
+    rows = (
+        queryset.order_by()
+        .values('category_id', bucket=bucket_expression(buckets))
+        .annotate(count=Count('id'))
+        .values_list('category_id', 'bucket', 'count')
+    )
+    categories, prices = Counter(), Counter()
+    for category_id, bucket, count in rows:
+        categories[category_id] += count
+        prices[bucket] += count
+
+    return {
+        'categories': [
+            {'id': category_id, 'count': count}
+            for category_id, count in sorted(categories.items(), key=lambda item: (item[0] is None, item[0] or 0))
+        ],
+        'price': [
+            {'min': _bound(lower), 'max': _bound(upper), 'count': prices[i]}
+            for i, (lower, upper) in enumerate(buckets)
+        ],
+    }
@@ -0,0 +1,111 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.encoding import iri_to_uri
+
+
+# Responsive variants served for every card image, as (name, max width).
+# Stored on Card.image_variants when the image is uploaded, so listings never
+# compute URLs or ship the full-size original.
+IMAGE_VARIANTS = (('thumb', 200), ('medium', 480), ('large', 1024))
+WEBP_QUALITY = 80
+
+
+def _cloudinary_variants(image):
+    """
+    Cloudinary derives resized copies from a transformation in the URL, so the
+    variants are the original URL with a width limit and WebP conversion.
+    """
+    url = image.storage.url(image.name)
+    return [
+        {
+            'name': name,
+            'width': width,
+            'url': url.replace('/image/upload/', f'/image/upload/c_limit,w_{width},f_webp,q_auto/', 1),
+        }
+        for name, width in IMAGE_VARIANTS
+    ]
+
+
+def _local_variants(image):
+    """
+    Stand-in for Cloudinary's transformations: resize with Pillow and save
+    WebP copies next to the original through the same storage.
+    """
+    from PIL import Image  # Only needed when a card image is uploaded
+
+    storage = image.storage
+    stem = os.path.splitext(os.path.basename(image.name))[0]
+    with storage.open(image.name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    variants = []
+    for name, width in IMAGE_VARIANTS:
+        resized = original
+        if original.width > width:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+        saved = storage.save(f'cards/variants/{stem}-{name}.webp', ContentFile(buffer.getvalue()))
+        variants.append({'name': name, 'width': resized.width, 'url': storage.url(saved)})
+        if resized is original:
+            break  # Larger variants would be the same size as this one
+    return variants
+
+
+def generate_variants(image):
+    """
+    Return the image_variants value for a Card image: the source name it was
+    made from plus one {name, width, url} entry per variant.
+    """
+    if not image:
+        return {}
+    if settings.CARD_IMAGE_PIPELINE == 'cloudinary':
+        variants = _cloudinary_variants(image)
+    else:
+        variants = _local_variants(image)
+    return {'source': image.name, 'variants': variants}
+
+
+def needs_variants(card):
+    return (card.image_variants or {}).get('source') != (card.image.name or None)
+
+
+# ------------------------------------------------------------------
+# URL helpers for serializers
+# ------------------------------------------------------------------
+def absolute_url(request, url):
+    """
+    request.build_absolute_uri(url), with the scheme://host prefix worked
+    out once per request instead of once per image.
+    """
+    if url is None:
+        return None
+    if '//' in url[:8]:
+        return iri_to_uri(url)  # Already absolute (Cloudinary)
+    if not url.startswith('/'):
+        return request.build_absolute_uri(url)
+    prefix = getattr(request, '_absolute_url_prefix', None)
+    if prefix is None:
+        prefix = request._absolute_url_prefix = request.build_absolute_uri('/')[:-1]
+    return iri_to_uri(prefix + url)
+
+
+def variant_fields(request, image_variants):
+    """
+    The thumbnail_url and srcset-ready image_srcset fields for a card.
+    """
+    variants = (image_variants or {}).get('variants') or []
+    if not variants:
+        return {'thumbnail_url': None, 'image_srcset': None}
+    urls = [(absolute_url(request, variant['url']), variant['width']) for variant in variants]
+    return {
+        'thumbnail_url': urls[0][0],
+        'image_srcset': ', '.join(f'{url} {width}w' for url, width in urls),
+    }
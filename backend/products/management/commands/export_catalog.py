@@ -0,0 +1,55 @@
+import sys
+import time
+
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.core.management.base import BaseCommand
+
+from products.catalog_io import detect_format, export_rows, write_rows
+from products.models import Card
+
+
+class Command(BaseCommand):
+    help = 'Write every card to a CSV or JSON Lines file that import_catalog can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to write, or '-' for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000, help='rows fetched per database round-trip')
+        parser.add_argument(
+            '--assign-skus', action='store_true', help='give cards without a sku one (CARD-<id>) before exporting',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = detect_format(path, options['format'])
+        started = time.monotonic()
+
+        if options['assign_skus']:
+            assigned = Card.objects.filter(sku__isnull=True).update(
+                sku=Concat(Value('CARD-'), Cast('id', CharField())),
+            )
+            self.stderr.write(f'Assigned a sku to {assigned} cards')
+
+        # Progress goes to stderr so it never mixes with an export to stdout
+        def export(stream):
+            count = 0
+            for count in write_rows(stream, export_rows(chunk_size=options['batch_size']), format):
+                self.stderr.write(f'{count} rows ({count / max(time.monotonic() - started, 1e-9):.0f} rows/s)')
+            return count
+
+        if path == '-':
+            count = export(sys.stdout)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = export(stream)
+
+        elapsed = time.monotonic() - started
+        without_sku = Card.objects.filter(sku__isnull=True).count()
+        if without_sku:
+            self.stderr.write(self.style.WARNING(
+                f'{without_sku} cards have no sku and cannot be imported back; use --assign-skus'
+            ))
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {count} cards in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
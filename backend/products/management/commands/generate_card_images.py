@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_catalog_version
+from products.images import generate_variants, needs_variants
+from products.models import Card
+
+
+class Command(BaseCommand):
+    help = 'Generate the responsive image variants for cards that are missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='regenerate variants for every card')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        done = 0
+        for card in Card.objects.exclude(image='').exclude(image=None).only('id', 'image', 'image_variants').iterator():
+            if options['force'] or needs_variants(card):
+                try:
+                    variants = generate_variants(card.image)
+                except Exception as e:
+                    self.stderr.write(f'Card {card.pk} ({card.image.name}): {type(e).__name__}: {e}')
+                    continue
+                Card.objects.filter(pk=card.pk).update(image_variants=variants)
+                done += 1
+        if done:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated image variants for {done} cards in {time.monotonic() - started:.2f}s'
+        ))
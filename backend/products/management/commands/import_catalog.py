@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products.catalog_io import CatalogImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update cards from a CSV or JSON Lines file, matching them on sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to read, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows saved per bulk query')
+        parser.add_argument('--image-workers', type=int, default=4, help='threads uploading images')
+        parser.add_argument('--image-root', default='.', help='directory relative image paths are read from')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = detect_format(path, options['format'])
+
+        def progress(stats):
+            self.stdout.write(f'{stats.rows} rows ({stats.rate:.0f} rows/s)')
+
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            image_workers=options['image_workers'],
+            image_root=options['image_root'],
+            progress=progress,
+        )
+        if path == '-':
+            stats = importer.run(read_rows(sys.stdin, format))
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                stats = importer.run(read_rows(stream, format))
+
+        for line, message in stats.errors:
+            self.stderr.write(f'line {line}: {message}' if line else message)
+        if stats.error_count > len(stats.errors):
+            self.stderr.write(f'... and {stats.error_count - len(stats.errors)} more errors')
+        summary = (
+            f'Imported {stats.rows} rows at {stats.rate:.0f} rows/s: {stats.created} created, '
+            f'{stats.updated} updated, {stats.unchanged} unchanged, {stats.images} images, '
+            f'{importer.categories.created} new categories, {stats.error_count} errors'
+        )
+        self.stdout.write(self.style.WARNING(summary) if stats.error_count else self.style.SUCCESS(summary))
@@ -0,0 +1,20 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_catalog_version
+from products.models import CardSales
+from products.sales import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the card and category sales rollups from the recorded order lines'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rebuild_sales(apps.get_model('khalti', 'OrderLine'))
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up sales for {CardSales.objects.count()} cards in {time.monotonic() - started:.2f}s'
+        ))
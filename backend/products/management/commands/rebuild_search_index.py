@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products import search
+from products.cache import bump_catalog_version
+from products.models import Card
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index from the Card table'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            search.rebuild_index()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Card.objects.count()} cards in {time.monotonic() - started:.2f}s'
+        ))
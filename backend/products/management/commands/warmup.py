@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.warmup import warmup
+
+
+class Command(BaseCommand):
+    # Only the catalog step: the other caches (JWKS, OIDC metadata, imports,
+    # the suggest index) live in each worker's memory, which this process
+    # can't reach. Use WARMUP_ON_STARTUP for those.
+    help = 'Pre-fill the shared catalog cache with the hot catalog pages'
+
+    def handle(self, *args, **options):
+        if settings.CATALOG_CACHE_BACKEND == 'locmem':
+            raise CommandError(
+                'CATALOG_CACHE_BACKEND=locmem is per process, so there is nothing to pre-fill from here; '
+                'use the file or redis backend, or WARMUP_ON_STARTUP'
+            )
+
+        result = warmup(['catalog'])['catalog']
+        if isinstance(result, float):
+            self.stdout.write(f'catalog {result * 1000:8.1f} ms')
+        else:
+            raise CommandError(f'catalog failed: {result}')
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE products_card_search ("
+            "card_id bigint PRIMARY KEY REFERENCES products_card (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX products_card_search_document_gin ON products_card_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO products_card_search (card_id, document) "
+            "SELECT c.id, "
+            "setweight(to_tsvector('simple', c.name), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(cat.name, '')), 'B') || "
+            "setweight(to_tsvector('simple', c.description), 'C') "
+            "FROM products_card c LEFT JOIN products_category cat ON cat.id = c.category_id"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE products_card_fts USING fts5("
+            "name, description, category, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO products_card_fts (rowid, name, description, category) "
+            "SELECT c.id, c.name, c.description, coalesce(cat.name, '') "
+            "FROM products_card c LEFT JOIN products_category cat ON cat.id = c.category_id"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS products_card_search")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS products_card_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_category_card_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
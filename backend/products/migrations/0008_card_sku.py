@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_card_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import CharField, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+
+
+def fill_tree(apps, schema_editor):
+    # Every existing category becomes a root: its path is its own id and its
+    # count is the number of cards directly in it
+    Category = apps.get_model('products', 'Category')
+    Card = apps.get_model('products', 'Card')
+    cards = Card.objects.filter(category=OuterRef('pk')).order_by().values('category').annotate(n=Count('id')).values('n')
+    Category.objects.update(
+        path=Concat(Cast('id', CharField()), Value('/')),
+        product_count=Coalesce(Subquery(cards), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_card_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='products.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_tree, migrations.RunPython.noop),
+    ]
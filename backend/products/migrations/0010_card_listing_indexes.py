@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['price', 'id'], name='products_card_price'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['name', 'id'], name='products_card_name'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['category', 'price', 'id'], name='products_card_category_price'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['category', 'name', 'id'], name='products_card_category_name'),
+        ),
+    ]
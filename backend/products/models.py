@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
 # Create your models here.
@@ -5,6 +6,11 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    # Materialized path of ancestor ids ("3/17/"), maintained by products/tree.py
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    # Cards in this category and its whole subtree
+    product_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -13,15 +19,84 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # path and product_count are kept by UPDATEs in products/tree.py;
+        # never write back the possibly stale copies held by this instance
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('path', 'product_count')
+            ]
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        if self.pk and self.parent_id and str(self.pk) in self.parent.path.split('/'):
+            raise ValidationError({'parent': 'A category cannot be moved under itself or one of its subcategories.'})
+
 
 class Card(models.Model):
+    # Stock-keeping unit, the natural key bulk imports match rows on
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=100)
     image = models.ImageField(upload_to='cards/', null=True, blank=True)
+    # Resized WebP copies of `image`, filled in by products/images.py on upload
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
+
+    class Meta:
+        # One per list_cards keyset ordering (see products/pagination.py),
+        # alone and behind category_id, so every filter/sort combination is
+        # an index range scan. Descending orderings scan them backwards.
+        indexes = [
+            models.Index(fields=['price', 'id'], name='products_card_price'),
+            models.Index(fields=['name', 'id'], name='products_card_name'),
+            models.Index(fields=['category', 'price', 'id'], name='products_card_category_price'),
+            models.Index(fields=['category', 'name', 'id'], name='products_card_category_name'),
+        ]
     
     def __str__(self):
         return self.name
-    
-    
\ No newline at end of file
+
+
+# ------------------------------------------------------------------
+# Sales rollups
+# ------------------------------------------------------------------
+# Running totals maintained by products/sales.py whenever a purchase is
+# recorded, so bestseller and per-category counts are read directly instead
+# of being computed from the order tables.
+class SalesTotals(models.Model):
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class CardSales(SalesTotals):
+    card = models.OneToOneField(Card, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+
+    class Meta:
+        indexes = [models.Index(fields=['-units'], name='products_cardsales_units')]
+
+
+class CategorySales(SalesTotals):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+
+
+class DailyCardSales(SalesTotals):
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['card', 'day'], name='products_dailycardsales_unique')]
+        indexes = [models.Index(fields=['day', 'card'], name='products_dailycardsales_day')]
+
+
+class DailyCategorySales(SalesTotals):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['category', 'day'], name='products_dailycategorysales_unique')]
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Q
+
+
+# Orderings we can page through with a keyset. Each one ends in "id" so the
+# sort key is unique and the cursor never skips or repeats a row. All columns
+# of an ordering sort the same way, and each has a composite index on Card
+# (with and without category_id in front), see Card.Meta.indexes. "newest"
+# relies on ids growing with insertion.
+KEYSET_ORDERINGS = {
+    'id': ('id',),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'name': ('name', 'id'),
+    'newest': ('-id',),
+}
+
+# How a cursor's stored values are turned back into column values
+_COLUMN_TYPES = {'id': int, 'price': Decimal, 'name': str}
+
+
+def keyset_columns(ordering):
+    """The columns of a keyset ordering, without direction prefixes."""
+    return tuple(field.lstrip('-') for field in KEYSET_ORDERINGS[ordering])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_token(position):
+    """
+    Pack a small dict into an opaque, URL-safe cursor token.
+    """
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    Reverse encode_token. Raises InvalidCursor for anything that isn't one.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(position, dict):
+        raise InvalidCursor('Invalid cursor')
+    return position
+
+
+def encode_cursor(ordering, row):
+    """
+    Build an opaque cursor pointing just after `row` for the given ordering.
+    `row` may be a model instance or a values() dict.
+    """
+    if isinstance(row, dict):
+        values = [row[column] for column in keyset_columns(ordering)]
+    else:
+        values = [getattr(row, column) for column in keyset_columns(ordering)]
+    return encode_token({'o': ordering, 'k': [str(value) for value in values]})
+
+
+def decode_cursor(token, ordering):
+    """
+    Decode a cursor produced by encode_cursor into the values of the
+    ordering's columns. Raises InvalidCursor if the token is malformed or was
+    issued for a different ordering.
+    """
+    position = decode_token(token)
+    if position.get('o') != ordering:
+        raise InvalidCursor('Cursor does not match the requested ordering')
+    columns = keyset_columns(ordering)
+    values = position.get('k')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor('Invalid cursor')
+    try:
+        return [_COLUMN_TYPES[column](value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError, InvalidOperation):
+        raise InvalidCursor('Invalid cursor')
+
+
+def after_cursor(ordering, values):
+    """
+    Q for the rows sorting after `values`: (a > x) OR (a = x AND b > y) ...,
+    with < for descending columns.
+    """
+    fields = KEYSET_ORDERINGS[ordering]
+    condition = Q()
+    for i, field in enumerate(fields):
+        column, lookup = field.lstrip('-'), 'lt' if field.startswith('-') else 'gt'
+        equal = {prefix.lstrip('-'): value for prefix, value in zip(fields[:i], values)}
+        condition |= Q(**equal, **{f'{column}__{lookup}': values[i]})
+    return condition
+
+
+def get_page_size(request, default=None, maximum=None):
+    """
+    Read ?limit= from the request, clamped to `maximum` (by default
+    CATALOG_MAX_PAGE_SIZE).
+    """
+    default = default or settings.CATALOG_PAGE_SIZE
+    maximum = maximum or settings.CATALOG_MAX_PAGE_SIZE
+    try:
+        size = int(request.GET.get('limit', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=None):
+    """
+    Return (rows, next_cursor) for one page of `queryset` ordered by the
+    keyset `ordering`. Only page_size + 1 rows are fetched, so the cost of a
+    page does not depend on how deep into the catalog the client is.
+    """
+    queryset = queryset.order_by(*KEYSET_ORDERINGS[ordering])
+
+    if cursor:
+        queryset = queryset.filter(after_cursor(ordering, decode_cursor(cursor, ordering)))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(ordering, rows[-1])
+    return rows, next_cursor
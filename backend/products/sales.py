@@ -0,0 +1,88 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+from .models import Card, CardSales, CategorySales, DailyCardSales, DailyCategorySales
+
+
+def _increment(model, units, revenue, **key):
+    """
+    Add to a rollup row, creating it if missing. The UPDATE uses F()
+    expressions so concurrent purchases never overwrite each other.
+    """
+    update = {'units': F('units') + units, 'revenue': F('revenue') + revenue}
+    if model.objects.filter(**key).update(**update):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(units=units, revenue=revenue, **key)
+    except IntegrityError:
+        # Someone else created it first
+        model.objects.filter(**key).update(**update)
+
+
+def record_sales(lines, day):
+    """
+    Add a purchase's order lines to the card and category rollups for `day`.
+    `lines` are OrderLine-like objects with card_id, quantity and unit_price.
+    """
+    per_card = defaultdict(lambda: [0, Decimal('0')])
+    for line in lines:
+        if line.card_id is None:
+            continue
+        totals = per_card[line.card_id]
+        totals[0] += line.quantity
+        totals[1] += line.quantity * line.unit_price
+    if not per_card:
+        return
+
+    per_category = defaultdict(lambda: [0, Decimal('0')])
+    for card_id, category_id in Card.objects.filter(id__in=per_card).values_list('id', 'category_id'):
+        if category_id is not None:
+            per_category[category_id][0] += per_card[card_id][0]
+            per_category[category_id][1] += per_card[card_id][1]
+
+    with transaction.atomic():
+        for card_id, (units, revenue) in per_card.items():
+            _increment(CardSales, units, revenue, card_id=card_id)
+            _increment(DailyCardSales, units, revenue, card_id=card_id, day=day)
+        for category_id, (units, revenue) in per_category.items():
+            _increment(CategorySales, units, revenue, category_id=category_id)
+            _increment(DailyCategorySales, units, revenue, category_id=category_id, day=day)
+
+
+def rebuild_sales(order_line_model, batch_size=1000):
+    """
+    Recompute every rollup from the order lines with GROUP BY queries.
+    Categories are attributed by each card's current category.
+    """
+    revenue = Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    lines = order_line_model.objects.filter(card__isnull=False).annotate(
+        day=TruncDate('purchase__purchase_date'),
+    )
+
+    rollups = [
+        (CardSales, ['card_id'], lines),
+        (DailyCardSales, ['card_id', 'day'], lines),
+        (CategorySales, ['card__category_id'], lines.filter(card__category__isnull=False)),
+        (DailyCategorySales, ['card__category_id', 'day'], lines.filter(card__category__isnull=False)),
+    ]
+
+    with transaction.atomic():
+        for model, group_by, queryset in rollups:
+            model.objects.all().delete()
+            rows = queryset.values(*group_by).annotate(units=Sum('quantity'), revenue=revenue).order_by()
+            model.objects.bulk_create(
+                (
+                    model(
+                        units=row['units'],
+                        revenue=row['revenue'],
+                        **{field.replace('card__', ''): row[field] for field in group_by},
+                    )
+                    for row in rows.iterator()
+                ),
+                batch_size=batch_size,
+            )
@@ -0,0 +1,203 @@
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Card, Category
+
+
+# Full-text index over Card.name, Card.description and the category name.
+#
+# On PostgreSQL the index is a tsvector column with a GIN index; on SQLite it
+# is an FTS5 virtual table whose rowid is the card id. Both tables are created
+# by migration 0005 and kept in sync by the receivers in products/signals.py.
+POSTGRES_TABLE = 'products_card_search'
+SQLITE_TABLE = 'products_card_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+# ------------------------------------------------------------------
+# Queries
+# ------------------------------------------------------------------
+def _tsquery(tokens):
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def _fts5_query(tokens):
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_card_ids(query, limit, offset=0):
+    """
+    Return up to `limit` card ids matching `query`, best match first.
+    Every token is treated as a prefix, so partially typed words match.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    # A read like any other, so it goes where the router sends Card reads
+    # (a replica inside @read_replica views)
+    connection = connections[router.db_for_read(Card)]
+    if connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT card_id FROM {POSTGRES_TABLE}, to_tsquery('simple', %s) query "
+            f"WHERE document @@ query "
+            f"ORDER BY ts_rank(document, query) DESC, card_id "
+            f"LIMIT %s OFFSET %s"
+        )
+        params = [_tsquery(tokens), limit, offset]
+    elif connection.vendor == 'sqlite':
+        # Column weights: name, description, category
+        sql = (
+            f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s "
+            f"ORDER BY bm25({SQLITE_TABLE}, 10.0, 1.0, 4.0), rowid "
+            f"LIMIT %s OFFSET %s"
+        )
+        params = [_fts5_query(tokens), limit, offset]
+    else:
+        return _fallback_search_ids(tokens, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_search_ids(tokens, limit, offset):
+    cards = _filter_unindexed(Card.objects.all(), tokens)
+    return list(cards.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+
+def _filter_unindexed(cards, tokens):
+    # Unindexed scan for databases without a full-text index
+    for token in tokens:
+        cards = cards.filter(
+            Q(name__icontains=token) | Q(description__icontains=token) | Q(category__name__icontains=token)
+        )
+    return cards
+
+
+def filter_cards(queryset, query):
+    """
+    Narrow a Card queryset to the cards matching `query` through the index,
+    keeping the queryset's own ordering. Used by the admin search box.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        sql = f"SELECT card_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+        return queryset.filter(id__in=RawSQL(sql, [_tsquery(tokens)]))
+    if vendor == 'sqlite':
+        sql = f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s"
+        return queryset.filter(id__in=RawSQL(sql, [_fts5_query(tokens)]))
+    return _filter_unindexed(queryset, tokens)
+
+
+# ------------------------------------------------------------------
+# Index maintenance
+# ------------------------------------------------------------------
+def _document_select(where=''):
+    card_table = Card._meta.db_table
+    category_table = Category._meta.db_table
+    if connection.vendor == 'postgresql':
+        columns = (
+            "c.id, "
+            "setweight(to_tsvector('simple', c.name), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(cat.name, '')), 'B') || "
+            "setweight(to_tsvector('simple', c.description), 'C')"
+        )
+    else:
+        columns = "c.id, c.name, c.description, coalesce(cat.name, '')"
+    return (
+        f"SELECT {columns} FROM {card_table} c "
+        f"LEFT JOIN {category_table} cat ON cat.id = c.category_id {where}"
+    )
+
+
+def _id_filter(column, card_ids):
+    return f"WHERE {column} IN ({', '.join(['%s'] * len(card_ids))})"
+
+
+def index_cards(card_ids):
+    """
+    (Re)index the given cards from their current database rows.
+    """
+    card_ids = list(card_ids)
+    if not card_ids:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_TABLE} (card_id, document) "
+                f"{_document_select(_id_filter('c.id', card_ids))} "
+                f"ON CONFLICT (card_id) DO UPDATE SET document = EXCLUDED.document",
+                card_ids,
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE} {_id_filter('rowid', card_ids)}", card_ids)
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, name, description, category) "
+                f"{_document_select(_id_filter('c.id', card_ids))}",
+                card_ids,
+            )
+
+
+def index_category_cards(category_id):
+    """
+    Reindex every card in a category, e.g. after the category was renamed.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_TABLE} (card_id, document) "
+                f"{_document_select('WHERE c.category_id = %s')} "
+                f"ON CONFLICT (card_id) DO UPDATE SET document = EXCLUDED.document",
+                [category_id],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN "
+                f"(SELECT id FROM {Card._meta.db_table} WHERE category_id = %s)",
+                [category_id],
+            )
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, name, description, category) "
+                f"{_document_select('WHERE c.category_id = %s')}",
+                [category_id],
+            )
+
+
+def remove_cards(card_ids):
+    card_ids = list(card_ids)
+    if not card_ids:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"DELETE FROM {POSTGRES_TABLE} {_id_filter('card_id', card_ids)}", card_ids)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE} {_id_filter('rowid', card_ids)}", card_ids)
+
+
+def rebuild_index():
+    """
+    Drop and rebuild the whole index with a single INSERT ... SELECT.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"TRUNCATE {POSTGRES_TABLE}")
+            cursor.execute(f"INSERT INTO {POSTGRES_TABLE} (card_id, document) {_document_select()}")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, name, description, category) {_document_select()}"
+            )
@@ -1,23 +1,147 @@
 from .models import Card, Category
+from .images import absolute_url, variant_fields
 from rest_framework import serializers
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description']
+        fields = ['id', 'name', 'description', 'parent', 'product_count']
+
+
+class CategorySalesSerializer(CategorySerializer):
+    # Read from the CategorySales rollup via an annotation, see list_categories
+    units_sold = serializers.IntegerField(read_only=True)
+
+    class Meta(CategorySerializer.Meta):
+        fields = CategorySerializer.Meta.fields + ['units_sold']
 
 
 class CardSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
     category_id = serializers.IntegerField(source='category.id', read_only=True, allow_null=True)
     
     class Meta:
         model = Card
-        fields = ['id', 'name', 'description', 'price', 'image_url', 'category_id', 'category_name']
+        fields = ['id', 'name', 'description', 'price', 'image_url', 'thumbnail_url', 'image_srcset', 'category_id', 'category_name']
     
     def get_image_url(self, obj):
         request = self.context.get('request')
         if obj.image:
-            return request.build_absolute_uri(obj.image.url)
-        return None
\ No newline at end of file
+            return absolute_url(request, obj.image.url)
+        return None
+
+    def get_thumbnail_url(self, obj):
+        return variant_fields(self.context.get('request'), obj.image_variants)['thumbnail_url']
+
+    def get_image_srcset(self, obj):
+        return variant_fields(self.context.get('request'), obj.image_variants)['image_srcset']
+
+
+# ------------------------------------------------------------------
+# Read-optimized card serialization
+# ------------------------------------------------------------------
+# Columns fetched for the flat read path. The category name is joined in the
+# same query, so listing N cards costs one query instead of N + 1.
+CARD_ROW_FIELDS = ('id', 'name', 'description', 'price', 'image', 'image_variants', 'category_id', 'category__name')
+
+# Reuse DRF's own field so prices are formatted exactly like CardSerializer
+_price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+_image_storage = Card._meta.get_field('image').storage
+
+
+# Sparse fieldsets (?fields=id,name,price): the columns each output field
+# needs, so unrequested columns such as description are never fetched
+CARD_FIELD_COLUMNS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'price': ('price',),
+    'image_url': ('image',),
+    'thumbnail_url': ('image_variants',),
+    'image_srcset': ('image_variants',),
+    'category_id': ('category_id',),
+    'category_name': ('category__name',),
+}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(request):
+    """
+    Read ?fields= into a tuple of output field names, or None for all fields.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in CARD_FIELD_COLUMNS]
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def card_rows(queryset, fields=None, extra=('id',)):
+    """
+    Turn a Card queryset into values() rows for serialize_card_rows. With
+    `fields`, only the columns those fields need (plus `extra`, e.g. the
+    keyset ordering) are selected.
+    """
+    if fields is None:
+        return queryset.values(*CARD_ROW_FIELDS)
+    columns = dict.fromkeys(extra)
+    for field in fields:
+        columns.update(dict.fromkeys(CARD_FIELD_COLUMNS[field]))
+    return queryset.values(*columns)
+
+
+def _image_url(row, request):
+    image = row['image']
+    # The scheme://host prefix is computed once per request, see absolute_url
+    return absolute_url(request, _image_storage.url(image)) if image else None
+
+
+def _category_id(row):
+    category_id = row['category_id']
+    return int(category_id) if category_id is not None else None
+
+
+_CARD_FIELD_GETTERS = {
+    'id': lambda row, request: row['id'],
+    'name': lambda row, request: row['name'],
+    'description': lambda row, request: row['description'],
+    'price': lambda row, request: _price_field.to_representation(row['price']),
+    'image_url': _image_url,
+    'thumbnail_url': lambda row, request: variant_fields(request, row['image_variants'])['thumbnail_url'],
+    'image_srcset': lambda row, request: variant_fields(request, row['image_variants'])['image_srcset'],
+    'category_id': lambda row, request: _category_id(row),
+    'category_name': lambda row, request: row['category__name'],
+}
+
+
+def serialize_card_row(row, request, fields=None):
+    """
+    Serialize one row from card_rows. Produces the same output as
+    CardSerializer without going through the per-field ModelSerializer
+    machinery, or just `fields` of it.
+    """
+    if fields is not None:
+        return {field: _CARD_FIELD_GETTERS[field](row, request) for field in fields}
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'],
+        'price': _price_field.to_representation(row['price']),
+        'image_url': _image_url(row, request),
+        **variant_fields(request, row['image_variants']),
+        'category_id': _category_id(row),
+        'category_name': row['category__name'],
+    }
+
+
+def serialize_card_rows(rows, request, fields=None):
+    return [serialize_card_row(row, request, fields) for row in rows]
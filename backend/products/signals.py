@@ -0,0 +1,103 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import search, tree
+from .cache import bump_catalog_version
+from .images import generate_variants, needs_variants
+from .models import Card, Category
+
+logger = logging.getLogger(__name__)
+
+# Connected first so the cache is invalidated after the variants are stored
+@receiver(post_save, sender=Card)
+def make_image_variants(sender, instance, **kwargs):
+    if needs_variants(instance):
+        try:
+            instance.image_variants = generate_variants(instance.image)
+        except Exception:
+            # A corrupt or unreadable upload must not turn the (already
+            # saved) card into a 500; it is served without variants
+            logger.exception("image variants failed", extra={'card_id': instance.pk, 'image': instance.image.name})
+            instance.image_variants = {}
+        Card.objects.filter(pk=instance.pk).update(image_variants=instance.image_variants)
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    # Any catalog edit invalidates every cached listing and search result
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Card)
+def index_card(sender, instance, **kwargs):
+    search.index_cards([instance.pk])
+
+
+@receiver(post_delete, sender=Card)
+def unindex_card(sender, instance, **kwargs):
+    search.remove_cards([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_cards(sender, instance, created, **kwargs):
+    # The category name is part of each card's search document
+    if not created:
+        search.index_category_cards(instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_cards(sender, instance, **kwargs):
+    # Deleting a category nulls card.category without sending signals, so
+    # note which cards need their document refreshed afterwards
+    instance._search_card_ids = list(instance.products.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_orphaned_cards(sender, instance, **kwargs):
+    search.index_cards(getattr(instance, '_search_card_ids', []))
+
+
+@receiver(post_save, sender=Category)
+def place_category(sender, instance, **kwargs):
+    tree.place(instance)
+
+
+def recount_categories_on_commit():
+    tree.recount_categories()
+
+
+@receiver(post_delete, sender=Category)
+def recount_after_category_delete(sender, instance, using, **kwargs):
+    # The subtree's cards were detached by SET_NULL without signals. A
+    # cascade sends this for every descendant, so schedule a single recount
+    # for when the delete commits (a rolled back delete drops it again).
+    connection = transaction.get_connection(using)
+    if not any(func is recount_categories_on_commit for _, func, _ in connection.run_on_commit):
+        transaction.on_commit(recount_categories_on_commit, using=using)
+
+
+@receiver(pre_save, sender=Card)
+def remember_category(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and not {'category', 'category_id'} & update_fields):
+        instance._previous_category_id = instance.category_id
+        return
+    instance._previous_category_id = (
+        Card.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Card)
+def count_card(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_category_id', instance.category_id)
+    tree.move_cards(previous, instance.category_id)
+
+
+@receiver(post_delete, sender=Card)
+def uncount_card(sender, instance, **kwargs):
+    tree.move_cards(instance.category_id, None)
@@ -0,0 +1,36 @@
+from django.http import StreamingHttpResponse
+
+from backend.renderers import dumps
+
+
+# Rows pulled from the database cursor per round-trip while streaming.
+STREAM_CHUNK_SIZE = 500
+
+
+def iter_json_array(objects, serialize):
+    """
+    Yield a JSON array one element at a time so the full list never has to
+    be built in memory.
+    """
+    yield b'['
+    first = True
+    for obj in objects:
+        if not first:
+            yield b','
+        first = False
+        yield dumps(serialize(obj))
+    yield b']'
+
+
+def streaming_json_response(queryset, serialize):
+    """
+    Stream every row of `queryset` as a JSON array using a server-side
+    iterator, keeping worker memory flat regardless of the result size.
+    """
+    # Pick the database now: the rows are read after the view has returned,
+    # outside any @read_replica scope
+    rows = queryset.using(queryset.db).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    return StreamingHttpResponse(
+        iter_json_array(rows, serialize),
+        content_type='application/json',
+    )
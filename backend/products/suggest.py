@@ -0,0 +1,144 @@
+import heapq
+from collections import Counter
+from itertools import chain
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.db import connection
+
+from .cache import get_catalog_version
+from .models import Card, Category
+
+
+# In-memory trigram index used by /products/suggest/ for search-as-you-type.
+#
+# Postings are stored CSR-style: one sorted tuple of trigrams, an offsets
+# array and a single flat array of entry ids. That keeps the index at a few
+# bytes per posting instead of one Python set per trigram.
+
+def trigrams(text):
+    grams = set()
+    for word in text.lower().split():
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex:
+    def __init__(self, entries):
+        """
+        `entries` is an iterable of (kind, id, name) tuples.
+        """
+        self.kinds = []
+        self.ids = array('q')
+        self.names = []
+        self.gram_counts = array('H')
+
+        postings = {}
+        for kind, obj_id, name in entries:
+            entry = len(self.names)
+            self.kinds.append(kind)
+            self.ids.append(obj_id)
+            self.names.append(name)
+            grams = trigrams(name)
+            self.gram_counts.append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                postings.setdefault(gram, []).append(entry)
+
+        # Freeze the build-time dict into flat arrays
+        self.grams = tuple(sorted(postings))
+        self.offsets = array('I', [0])
+        self.postings = array('I')
+        for gram in self.grams:
+            self.postings.extend(postings[gram])
+            self.offsets.append(len(self.postings))
+
+    def _postings_for(self, gram):
+        slot = bisect_left(self.grams, gram)
+        if slot == len(self.grams) or self.grams[slot] != gram:
+            return ()
+        return self.postings[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def search(self, query, limit):
+        """
+        Return the `limit` best (kind, id, name) matches for `query`, scored by
+        trigram similarity with a bonus for names starting with the query.
+        """
+        query = query.strip().lower()
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        # Very common trigrams (e.g. the leading "  c") say little about the
+        # match but dominate the work; drop them while rarer ones remain
+        lists = sorted((self._postings_for(gram) for gram in query_grams), key=len)
+        cutoff = max(len(self.names) // 50, 1000)
+        lists = lists[:2] + [postings for postings in lists[2:] if len(postings) <= cutoff]
+        shared = Counter(chain.from_iterable(lists))
+        if not shared:
+            return []
+
+        def score(entry):
+            common = shared[entry]
+            similarity = common / (len(query_grams) + self.gram_counts[entry] - common)
+            if self.names[entry].lower().startswith(query):
+                similarity += 1
+            return similarity
+
+        best = heapq.nlargest(limit, shared, key=score)
+        return [(self.kinds[entry], self.ids[entry], self.names[entry]) for entry in best]
+
+
+def build_index():
+    def entries():
+        for category_id, name in Category.objects.values_list('id', 'name').iterator():
+            yield 'category', category_id, name
+        for card_id, name in Card.objects.values_list('id', 'name').iterator():
+            yield 'card', card_id, name
+    return TrigramIndex(entries())
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def _rebuild(version):
+    global _index, _index_version
+    index = build_index()
+    _index, _index_version = index, version
+
+
+def _rebuild_in_background(version):
+    try:
+        _rebuild(version)
+    finally:
+        connection.close()
+        _lock.release()
+
+
+def get_index():
+    """
+    Return the process-wide index, building it on first use. When the catalog
+    version moves on, the index is rebuilt in a background thread while the
+    previous one keeps serving queries.
+    """
+    version = get_catalog_version()
+    if _index is not None and _index_version == version:
+        return _index
+
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _rebuild(version)
+        return _index
+
+    if _lock.acquire(blocking=False):
+        threading.Thread(target=_rebuild_in_background, args=(version,), daemon=True).start()
+    return _index
+
+
+def suggest(query, limit):
+    return get_index().search(query, limit)
@@ -1,3 +1,1068 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import cloudinary
+import cloudinary_storage.app_settings  # noqa: F401 - applies settings credentials before we override them
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from backend.authentication import Auth0JSONWebTokenAuthentication, Auth0User
+from backend.logs import JSONFormatter, SampleFilter
+from backend.postgresql_pool import base as pool_base
+from backend.postgresql_pool.pool import ConnectionPool, PoolTimeout
+from backend.routers import read_replica
+from backend.throttling import LocalBucketStore, get_store
+from backend.renderers import FastJSONRenderer
+from backend.warmup import warmup
+
+from cart.models import Cart
+from cart.pricing import add_items
+from khalti.models import PurchaseHistory
+
+from .cache import SingleFlight, cached_catalog_response
+from .catalog_io import CategoryMap
+from .models import Card, CardSales, Category
+from . import search, suggest, tree
+from .sales import record_sales
+from .serializers import CardSerializer, card_rows, serialize_card_rows
+
+
+@override_settings(CATALOG_PAGE_SIZE=2, CATALOG_MAX_PAGE_SIZE=3)
+class ListCardsPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Games')
+        for i, price in enumerate(['30.00', '10.00', '20.00', '10.00', '5.00']):
+            Card.objects.create(
+                name=f'Card {i}', description='desc', price=Decimal(price),
+                category=cls.category if i % 2 == 0 else None,
+            )
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def collect(self, params):
+        ids, cursor = [], None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get('/products/cards/', query).json()
+            ids += [card['id'] for card in data['results']]
+            cursor = data['next']
+            if not cursor:
+                return ids
+
+    def test_pages_by_id(self):
+        expected = list(Card.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(self.collect({}), expected)
+
+    def test_pages_by_price_then_id(self):
+        expected = list(Card.objects.order_by('price', 'id').values_list('id', flat=True))
+        self.assertEqual(self.collect({'ordering': 'price'}), expected)
+
+    def test_page_size_is_capped(self):
+        data = self.client.get('/products/cards/', {'limit': 100}).json()
+        self.assertEqual(len(data['results']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/products/cards/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_for_other_ordering_is_rejected(self):
+        cursor = self.client.get('/products/cards/').json()['next']
+        response = self.client.get('/products/cards/', {'cursor': cursor, 'ordering': 'price'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_returns_whole_filtered_catalog(self):
+        response = self.client.get('/products/cards/', {'stream': '1', 'category': self.category.id})
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        expected = list(Card.objects.filter(category=self.category).order_by('id').values_list('id', flat=True))
+        self.assertEqual([card['id'] for card in data], expected)
+
+
+@override_settings(CARD_IMAGE_PIPELINE='cloudinary')
+class FlatCardSerializationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Image URLs are built by the Cloudinary storage, which needs a cloud name
+        cloudinary.config(cloud_name='test-cloud')
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+        for i in range(10):
+            Card.objects.create(
+                name=f'Card {i}', description=f'Description {i}', price=Decimal(i) + Decimal('0.5'),
+                image=f'cards/card-{i}.png' if i % 2 else None,
+                category=categories[i % 3] if i % 4 else None,
+            )
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def test_output_matches_card_serializer(self):
+        request = RequestFactory().get('/products/cards/')
+        cards = Card.objects.order_by('id')
+        expected = JSONRenderer().render(CardSerializer(cards, many=True, context={"request": request}).data)
+        actual = JSONRenderer().render(serialize_card_rows(card_rows(cards), request))
+        self.assertEqual(actual, expected)
+
+    def test_cloudinary_variants_are_url_transformations(self):
+        card = Card.objects.exclude(image='').exclude(image=None).first()
+        fields = CardSerializer(card, context={"request": RequestFactory().get('/')}).data
+        self.assertIn('/image/upload/c_limit,w_200,f_webp,q_auto/', fields['thumbnail_url'])
+        self.assertEqual(fields['image_srcset'].count('w, '), 2)
+
+    def test_list_cards_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            self.client.get('/products/cards/', {'limit': 10})
+        # One query against the search index, one for the matching rows
+        with self.assertNumQueries(2):
+            self.client.get('/products/search/', {'q': 'Card'})
+
+
+@override_settings(CATALOG_PRICE_BUCKETS=[Decimal('10'), Decimal('25')])
+class ListCardsFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = Category.objects.create(name='Games')
+        cls.books = Category.objects.create(name='Books')
+        for name, price, category in [
+            ('Chess', '30.00', cls.games), ('Go', '10.00', cls.games), ('Dice', '2.50', cls.games),
+            ('Atlas', '12.00', cls.books), ('Mug', '10.00', None),
+        ]:
+            Card.objects.create(name=name, description='d', price=Decimal(price), category=category)
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def names(self, **params):
+        names, cursor = [], None
+        while True:
+            query = dict(params, limit=2, fields='name', **({'cursor': cursor} if cursor else {}))
+            data = self.client.get('/products/cards/', query).json()
+            names += [card['name'] for card in data['results']]
+            if not (cursor := data['next']):
+                return names
+
+    def test_orderings_page_through_every_card(self):
+        self.assertEqual(self.names(ordering='-price'), ['Chess', 'Atlas', 'Mug', 'Go', 'Dice'])
+        self.assertEqual(self.names(ordering='name'), ['Atlas', 'Chess', 'Dice', 'Go', 'Mug'])
+        self.assertEqual(self.names(ordering='newest'), ['Mug', 'Atlas', 'Dice', 'Go', 'Chess'])
+
+    def test_price_range_and_category(self):
+        self.assertEqual(self.names(min_price='10', max_price='12', ordering='price'), ['Go', 'Mug', 'Atlas'])
+        self.assertEqual(self.names(category=self.games.id, min_price='5', ordering='price'), ['Go', 'Chess'])
+        response = self.client.get('/products/cards/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_facets_come_from_one_query(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/products/cards/', {'facets': '1', 'max_price': '20', 'limit': 1}).json()
+        self.assertEqual(data['facets']['categories'], [
+            {'id': self.games.id, 'count': 2}, {'id': self.books.id, 'count': 1}, {'id': None, 'count': 1},
+        ])
+        self.assertEqual(data['facets']['price'], [
+            {'min': None, 'max': '10', 'count': 1},
+            {'min': '10', 'max': '25', 'count': 3},
+            {'min': '25', 'max': None, 'count': 0},
+        ])
+
+    def test_filtered_listing_uses_the_composite_index(self):
+        cards = Card.objects.filter(category=self.games, price__gte=5).order_by('price', 'id')
+        self.assertIn('products_card_category_price', cards.explain())
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Games')
+        Card.objects.create(name='Chess', description='desc', price=Decimal('10.00'), category=cls.category)
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self.client.get('/products/cards/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/products/cards/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_each_query_gets_its_own_entry(self):
+        self.client.get('/products/cards/')
+        with self.assertNumQueries(1):
+            self.client.get('/products/cards/', {'category': self.category.id})
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/products/categories/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_edit_invalidates_cache(self):
+        etag = self.client.get('/products/search/', {'q': 'Chess'})['ETag']
+        Card.objects.create(name='Chess Deluxe', description='desc', price=Decimal('20.00'))
+        response = self.client.get('/products/search/', {'q': 'Chess'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class CategoryTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = Category.objects.create(name='Games')
+        cls.board = Category.objects.create(name='Board Games', parent=cls.games)
+        cls.chess = Category.objects.create(name='Chess', parent=cls.board)
+        cls.books = Category.objects.create(name='Books')
+        cls.card = Card.objects.create(name='Chess Set', description='d', price=1, category=cls.chess)
+        Card.objects.create(name='Monopoly', description='d', price=1, category=cls.board)
+        Card.objects.create(name='Cards', description='d', price=1, category=cls.games)
+        Card.objects.create(name='Novel', description='d', price=1, category=cls.books)
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'product_count'))
+
+    def test_paths_and_counts(self):
+        self.chess.refresh_from_db()
+        self.assertEqual(self.chess.path, f'{self.games.pk}/{self.board.pk}/{self.chess.pk}/')
+        self.assertEqual(self.counts(), {'Games': 3, 'Board Games': 2, 'Chess': 1, 'Books': 1})
+
+        self.card.category = self.books
+        self.card.save()
+        self.assertEqual(self.counts(), {'Games': 2, 'Board Games': 1, 'Chess': 0, 'Books': 2})
+        self.card.delete()
+        self.assertEqual(self.counts(), {'Games': 2, 'Board Games': 1, 'Chess': 0, 'Books': 1})
+
+    def test_moving_a_subtree(self):
+        self.board.parent = self.books
+        self.board.save()
+        self.chess.refresh_from_db()
+        self.assertEqual(self.chess.path, f'{self.books.pk}/{self.board.pk}/{self.chess.pk}/')
+        self.assertEqual(self.counts(), {'Games': 1, 'Board Games': 2, 'Chess': 1, 'Books': 3})
+        self.assertEqual(tree.recount_categories(), 0)
+
+        self.board.parent = self.chess
+        with self.assertRaises(ValidationError):
+            self.board.full_clean()
+
+    def test_deleting_a_category_recounts(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.board.delete()  # And Chess with it
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.counts(), {'Games': 1, 'Books': 1})
+
+    def test_subtrees_across_a_power_of_ten(self):
+        # "99/1000/" is under "99/" and "100/" is not, whatever the collation
+        parent = Category.objects.create(pk=99, name='Puzzles')
+        child = Category.objects.create(pk=1000, name='Jigsaws', parent=parent)
+        other = Category.objects.create(pk=100, name='Toys')
+        Card.objects.create(name='Cube', description='d', price=1, category=parent)
+        Card.objects.create(name='Map', description='d', price=1, category=child)
+        Card.objects.create(name='Kite', description='d', price=1, category=other)
+
+        response = self.client.get('/products/cards/', {'category': parent.id})
+        self.assertEqual({card['name'] for card in response.json()['results']}, {'Cube', 'Map'})
+        subtree = Category.objects.filter(**tree.subtree_range('99/')).order_by('pk')
+        self.assertEqual(list(subtree.values_list('pk', flat=True)), [99, 1000])
+        self.assertEqual(tree.recount_categories(), 0)
+        self.assertEqual(self.counts()['Puzzles'], 2)
+
+    def test_list_cards_includes_subcategories(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/cards/', {'category': self.board.id})
+        self.assertEqual({card['name'] for card in response.json()['results']}, {'Chess Set', 'Monopoly'})
+        response = self.client.get('/products/cards/', {'category': 999})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_list_categories_returns_the_tree(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/products/categories/').json()
+        self.assertEqual([(node['name'], node['product_count']) for node in data], [('Books', 1), ('Games', 3)])
+        board = data[1]['children'][0]
+        self.assertEqual((board['name'], board['product_count'], board['parent']), ('Board Games', 2, self.games.id))
+        self.assertEqual([child['name'] for child in board['children']], ['Chess'])
+
+
+class SearchProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = Category.objects.create(name='Board Games')
+        cls.chess = Card.objects.create(name='Chess Set', description='Wooden pieces', price=Decimal('10.00'), category=cls.games)
+        cls.puzzle = Card.objects.create(name='Puzzle', description='A chess themed puzzle', price=Decimal('5.00'))
+        cls.mug = Card.objects.create(name='Mug', description='Ceramic', price=Decimal('3.00'), category=cls.games)
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def search(self, **params):
+        return self.client.get('/products/search/', params).json()
+
+    def test_name_matches_rank_above_description_matches(self):
+        ids = [card['id'] for card in self.search(q='chess')['results']]
+        self.assertEqual(ids, [self.chess.id, self.puzzle.id])
+
+    def test_prefix_and_category_name_match(self):
+        ids = {card['id'] for card in self.search(q='board gam')['results']}
+        self.assertEqual(ids, {self.chess.id, self.mug.id})
+
+    def test_results_are_paginated(self):
+        first = self.search(q='board', limit=1)
+        self.assertEqual(len(first['results']), 1)
+        second = self.search(q='board', limit=1, offset=first['next'])
+        self.assertIsNone(second['next'])
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+
+    def test_index_follows_edits(self):
+        self.games.name = 'Toys'
+        self.games.save()
+        self.assertEqual(self.search(q='board')['results'], [])
+        self.mug.delete()
+        self.assertEqual([card['id'] for card in self.search(q='toys')['results']], [self.chess.id])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search(q='chess')['results']), 2)
+
+
+class TrigramIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = suggest.TrigramIndex([
+            ('category', 1, 'Board Games'),
+            ('card', 1, 'Chess Set'),
+            ('card', 2, 'Cheese Board'),
+            ('card', 3, 'Checkers'),
+        ])
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.index.search('ches', 1), [('card', 1, 'Chess Set')])
+
+    def test_tolerates_typos(self):
+        self.assertEqual(self.index.search('chekers', 1), [('card', 3, 'Checkers')])
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('zzz', 5), [])
+
+
+class SuggestProductsTests(TestCase):
+    def setUp(self):
+        suggest._index = None
+        Card.objects.create(name='Chess Set', description='desc', price=Decimal('10.00'))
+
+    def test_suggest_endpoint(self):
+        response = self.client.get('/products/suggest/', {'q': 'chess'})
+        self.assertEqual(response.json()[0]['name'], 'Chess Set')
+        self.assertEqual(response.json()[0]['type'], 'card')
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = Category.objects.create(name='Games')
+        cls.books = Category.objects.create(name='Books')
+        cls.chess = Card.objects.create(name='Chess', description='d', price=Decimal('10.00'), category=cls.games)
+        cls.dice = Card.objects.create(name='Dice', description='d', price=Decimal('2.00'), category=cls.games)
+        cls.novel = Card.objects.create(name='Novel', description='d', price=Decimal('5.00'), category=cls.books)
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['catalog'].clear()
+        today = timezone.localdate()
+        record_sales([self.line(self.chess, 2), self.line(self.dice, 5)], today - timedelta(days=10))
+        record_sales([self.line(self.chess, 1), self.line(self.novel, 3)], today)
+
+    def line(self, card, quantity):
+        return SimpleNamespace(card_id=card.id, quantity=quantity, unit_price=card.price)
+
+    def test_totals_accumulate(self):
+        chess = CardSales.objects.get(card=self.chess)
+        self.assertEqual((chess.units, chess.revenue), (3, Decimal('30.00')))
+        self.assertEqual(self.games.sales.units, 8)
+
+    def test_bestsellers_all_time(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/bestsellers/')
+        results = response.json()['results']
+        self.assertEqual([(r['name'], r['units_sold']) for r in results], [('Dice', 5), ('Chess', 3), ('Novel', 3)])
+
+    def test_bestsellers_recent_and_by_category(self):
+        response = self.client.get('/products/bestsellers/', {'days': 7})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Novel', 'Chess'])
+        response = self.client.get('/products/bestsellers/', {'category': self.games.id, 'limit': 1})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Dice'])
+        self.assertEqual(self.client.get('/products/bestsellers/', {'category': 'abc'}).status_code, 400)
+
+    def test_categories_include_units_sold(self):
+        Category.objects.create(name='Empty')
+        response = self.client.get('/products/categories/')
+        units = {c['name']: c['units_sold'] for c in response.json()}
+        self.assertEqual(units, {'Games': 8, 'Books': 3, 'Empty': 0})
+
+
+@override_settings(CARD_IMAGE_PIPELINE='local')
+class LocalImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storage = FileSystemStorage(location=media.name, base_url='/media/')
+        patcher = mock.patch.object(Card._meta.get_field('image'), 'storage', storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, size):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_generated_on_upload(self):
+        card = Card.objects.create(name='Chess', description='d', price=1, image=self.upload((1600, 800)))
+        variants = Card.objects.get(pk=card.pk).image_variants['variants']
+        self.assertEqual([(v['name'], v['width']) for v in variants], [('thumb', 200), ('medium', 480), ('large', 1024)])
+
+        [row] = self.client.get('/products/cards/').json()['results']
+        self.assertEqual(row['thumbnail_url'], f"http://testserver{variants[0]['url']}")
+        self.assertTrue(row['image_srcset'].endswith('-large.webp 1024w'))
+
+    def test_small_images_are_not_upscaled(self):
+        card = Card.objects.create(name='Chess', description='d', price=1, image=self.upload((300, 300)))
+        variants = Card.objects.get(pk=card.pk).image_variants['variants']
+        self.assertEqual([v['width'] for v in variants], [200, 300])
+
+    def test_backfill_command(self):
+        card = Card.objects.create(name='Chess', description='d', price=1, image=self.upload((300, 300)))
+        Card.objects.filter(pk=card.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_card_images', stdout=out)
+        self.assertIn('for 1 cards', out.getvalue())
+        self.assertTrue(Card.objects.get(pk=card.pk).image_variants['variants'])
+
+    def test_corrupt_upload_is_saved_without_variants(self):
+        corrupt = SimpleUploadedFile('photo.png', b'not an image', content_type='image/png')
+        with self.assertLogs('products.signals', 'ERROR'):
+            card = Card.objects.create(name='Chess', description='d', price=1, image=corrupt)
+        self.assertEqual(Card.objects.get(pk=card.pk).image_variants, {})
+
+        err = StringIO()
+        call_command('generate_card_images', stdout=StringIO(), stderr=err)
+        self.assertIn('UnidentifiedImageError', err.getvalue())
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            Card.objects.create(name=f'Chess {i}', description='x' * 1000, price=Decimal(i + 1))
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def test_only_requested_fields_are_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/cards/', {'fields': 'name,price', 'ordering': 'price', 'limit': 2})
+        self.assertEqual(response.json()['results'], [{'name': 'Chess 0', 'price': '1.00'}, {'name': 'Chess 1', 'price': '2.00'}])
+        self.assertNotIn('description', queries[0]['sql'])
+
+        # The cursor still works, it is built from the ordering columns
+        response = self.client.get('/products/cards/', {'fields': 'name', 'ordering': 'price', 'cursor': response.json()['next']})
+        self.assertEqual(response.json()['results'], [{'name': 'Chess 2'}])
+
+    def test_search_fields(self):
+        response = self.client.get('/products/search/', {'q': 'chess', 'fields': 'id,name', 'limit': 1})
+        self.assertEqual(list(response.json()['results'][0]), ['id', 'name'])
+
+    def test_unknown_field(self):
+        response = self.client.get('/products/cards/', {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseEncodingTests(TestCase):
+    def test_fast_renderer_matches_drf(self):
+        data = {
+            'price': Decimal('1.50'), 'when': timezone.now(), 'name': 'Caf\u00e9 \u2028', 1: [None, True, 2.5],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @override_settings(
+        RESPONSE_COMPRESSION='gzip',
+        MIDDLEWARE=['backend.middleware.CompressionMiddleware', *settings.MIDDLEWARE],
+    )
+    def test_opt_in_compression(self):
+        for i in range(20):
+            Card.objects.create(name=f'Chess {i}', description='A wooden chess set', price=Decimal('10.00'))
+        response = self.client.get('/products/cards/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 20)
+
+        # The weakened ETag of a compressed response still revalidates
+        response = self.client.get('/products/cards/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class WarmupTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        category = Category.objects.create(name='Games')
+        Card.objects.create(name='Chess', description='d', price=Decimal('10.00'), category=category)
+        self.category = category
+
+    def test_catalog_pages_are_served_from_cache_after_warmup(self):
+        results = warmup(['catalog'])
+        self.assertIsInstance(results['catalog'], float)
+        with self.assertNumQueries(0):
+            self.client.get('/products/cards/')
+            self.client.get('/products/cards/', {'category': self.category.id})
+            self.client.get('/products/categories/')
+
+    def test_failing_steps_are_reported(self):
+        with mock.patch('backend.authentication.jwks_store.refresh', side_effect=OSError('offline')), \
+                self.assertLogs('backend.warmup', 'WARNING') as logs:
+            results = warmup(['jwks', 'imports'])
+        self.assertIn('jwks failed: OSError: offline', logs.output[0])
+        self.assertEqual(results['jwks'], 'OSError: offline')
+        self.assertIsInstance(results['imports'], float)
+
+    def test_command_only_fills_a_shared_catalog_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('warmup', stdout=StringIO())
+        with override_settings(CATALOG_CACHE_BACKEND='redis'):
+            call_command('warmup', stdout=StringIO())
+        with self.assertNumQueries(0):
+            self.client.get('/products/cards/')
+
+
+@override_settings(SERVER_TIMING_HEADER=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        Card.objects.create(name='Chess', description='d', price=Decimal('10.00'))
+
+    def test_server_timing_breakdown(self):
+        timing = self.client.get('/products/cards/')['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+
+    @override_settings(DEBUG=True)
+    def test_metrics_endpoint(self):
+        get_store().clear()
+        self.addCleanup(get_store().clear)
+        with override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_IP_BURST=1):
+            self.client.get('/products/cards/')
+            self.assertEqual(self.client.get('/products/cards/').status_code, 429)
+        body = self.client.get('/metrics').content.decode()
+        self.assertRegex(body, r'http_requests_throttled_total\{scope="catalog"\} [1-9]')
+        self.assertIn('# TYPE catalog_requests_coalesced_total counter', body)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{view="products.views.list_cards",method="GET",le="+Inf"}', body,
+        )
+        self.assertIn('http_requests_total{view="products.views.list_cards",method="GET",status="200"}', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_metrics_need_a_token_in_production(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    def test_json_lines_with_extra_fields(self):
+        record = logging.LogRecord('khalti.views', logging.INFO, __file__, 1, 'khalti initiate', (), None)
+        record.amount = 2500
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual((entry['message'], entry['level'], entry['amount']), ('khalti initiate', 'INFO', 2500))
+
+    def test_sampling_keeps_warnings(self):
+        sample = SampleFilter(rate=0)
+        info = logging.LogRecord('khalti', logging.INFO, __file__, 1, 'x', (), None)
+        warning = logging.LogRecord('khalti', logging.WARNING, __file__, 1, 'x', (), None)
+        self.assertFalse(sample.filter(info))
+        self.assertTrue(sample.filter(warning))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # A second connection to the test database stands in for the replica.
+    # Added after setUpClass, which would otherwise block queries through it.
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = dict(connections['default'].settings_dict)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        caches['catalog'].clear()
+        category = Category.objects.create(name='Games')
+        Card.objects.create(name='Chess set', description='wooden', price=Decimal('10.00'), category=category)
+
+    def tearDown(self):
+        # The flush after each test doesn't reach the full-text index
+        Card.objects.all().delete()
+
+    def queries_per_database(self, *paths, **headers):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                for path in paths:
+                    response = self.client.get(path, **headers)
+                    self.assertEqual(response.status_code, 200)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+        return len(primary), len(replica)
+
+    @override_settings(DATABASE_REPLICA_LAG=0)
+    def test_catalog_reads_go_to_the_replica(self):
+        primary, replica = self.queries_per_database(
+            '/products/cards/', '/products/categories/', '/products/search/?q=chess', '/products/cards/?stream=1',
+        )
+        self.assertEqual(primary, 0)
+        self.assertEqual(replica, 5)
+
+    def test_catalog_reads_right_after_a_write_use_the_primary(self):
+        # setUp just wrote to the catalog; the replica may not have it yet
+        primary, replica = self.queries_per_database('/products/cards/', '/products/categories/')
+        self.assertEqual((primary, replica), (2, 0))
+        with override_settings(DATABASE_REPLICA_LAG=0):
+            Card.objects.create(name='Go', description='stones', price=Decimal('5.00'))
+            primary, replica = self.queries_per_database('/products/cards/')
+        self.assertEqual((primary, replica), (0, 1))
+
+    def test_purchase_history_reads_from_the_replica(self):
+        PurchaseHistory.objects.create(
+            user_sub='auth0|1', user_email='a@example.com', user_name='A', total_amount=10,
+            items=[], pidx='pidx-1', status='Completed', purchase_order_id='order-1',
+        )
+        principal = Auth0User({'sub': 'auth0|1'})
+        with mock.patch.object(Auth0JSONWebTokenAuthentication, 'authenticate', return_value=(principal, 'token')):
+            primary, replica = self.queries_per_database('/khalti/history/', HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual((primary, replica), (0, 1))
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        @read_replica
+        def view():
+            before = Category.objects.all().db
+            Category.objects.create(name='Puzzles')
+            return before, Category.objects.all().db
+
+        self.assertEqual(view(), ('replica', 'default'))
+        self.assertEqual(Category.objects.all().db, 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(view.__wrapped__.__name__, 'view')
+            self.assertEqual(Category.objects.all().db, 'default')
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    # sqlite3 connections stand in for PostgreSQL ones
+    def make_pool(self, **options):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:', check_same_thread=False), **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_returned_connections_are_reused(self):
+        pool = self.make_pool(max_size=2)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats(), {'open': 1, 'idle': 0, 'max_size': 2})
+
+    def test_waits_for_a_free_connection(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        held = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        threading.Timer(0.01, pool.putconn, [held]).start()
+        pool.timeout = 5
+        self.assertIs(pool.getconn(), held)
+
+    def test_threads_share_at_most_max_size_connections(self):
+        pool = self.make_pool(max_size=2)
+        seen = set()
+
+        def work():
+            for _ in range(5):
+                conn = pool.getconn()
+                seen.add(id(conn))
+                time.sleep(0.001)
+                pool.putconn(conn)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(len(seen), 2)
+        self.assertEqual(pool.stats()['idle'], pool.stats()['open'])
+
+    def test_broken_and_expired_connections_are_replaced(self):
+        pool = self.make_pool(reset=lambda conn: False)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIsNot(pool.getconn(), first)
+
+        pool = self.make_pool(max_lifetime=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIsNot(pool.getconn(), first)
+
+
+class StubConnection:
+    """Just enough of a psycopg connection for the pooled backend."""
+
+    def __init__(self):
+        self.closed = 0
+        self.info = SimpleNamespace(transaction_status=pool_base.TRANSACTION_IDLE)
+        self.rollbacks = 0
+        self.rollback_error = None
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.rollback_error:
+            raise self.rollback_error
+        self.info.transaction_status = pool_base.TRANSACTION_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+
+        def connect(wrapper, conn_params):
+            self.opened.append(StubConnection())
+            return self.opened[-1]
+
+        patcher = mock.patch.object(pool_base.base.DatabaseWrapper, 'get_new_connection', autospec=True, side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: pool_base._pools.pop('pool-test').close())
+        self.wrapper = self.make_wrapper()
+
+    def make_wrapper(self):
+        settings_dict = {
+            'ENGINE': 'backend.postgresql_pool', 'NAME': 'test', 'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '',
+            'OPTIONS': {}, 'POOL': {'max_size': 1, 'timeout': 0.05}, 'TIME_ZONE': None, 'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': False, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False, 'TEST': {},
+        }
+        return pool_base.DatabaseWrapper(settings_dict, alias='pool-test')
+
+    def checkout(self, wrapper=None):
+        wrapper = wrapper or self.wrapper
+        wrapper.connection = wrapper.get_new_connection({})
+        return wrapper.connection
+
+    def test_connections_are_returned_reset_and_reused(self):
+        first = self.checkout()
+        self.assertEqual(self.wrapper.isolation_level, pool_base.IsolationLevel.READ_COMMITTED)
+        first.info.transaction_status = 2  # Left inside a transaction
+        self.wrapper.close()
+        self.assertIsNone(self.wrapper.connection)
+        self.assertEqual((first.rollbacks, first.closed), (1, 0))
+
+        # Another wrapper (thread) gets the same server connection back
+        self.assertIs(self.checkout(self.make_wrapper()), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_pool_size_is_shared_by_wrappers(self):
+        self.checkout()
+        with self.assertRaises(PoolTimeout):
+            self.checkout(self.make_wrapper())
+        self.wrapper.close()
+        self.checkout(self.make_wrapper())
+
+    def test_broken_connections_are_not_reused(self):
+        broken = self.checkout()
+        broken.info.transaction_status = pool_base.TRANSACTION_UNKNOWN
+        self.wrapper.close()
+        self.assertEqual(broken.closed, 1)
+
+        failing = self.checkout()
+        self.assertIsNot(failing, broken)
+        failing.info.transaction_status = 3  # In a failed transaction
+        failing.rollback_error = RuntimeError('server closed the connection')
+        self.wrapper.close()
+        self.assertEqual(failing.closed, 1)
+
+        closed = self.checkout()
+        closed.closed = 1
+        self.wrapper.close()
+        self.assertIsNot(self.checkout(), closed)
+        self.assertEqual(len(self.opened), 4)
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def import_catalog(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, '--batch-size', '2', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_rows_are_upserted_on_sku(self):
+        Category.objects.create(name='Games')
+        path = self.write('cards.csv', (
+            'sku,name,description,price,category,image\n'
+            'G-1,Chess,Wooden set,10.00,Games,\n'
+            'G-2,Go,Stones,25.5,Games,\n'
+            'B-1,Atlas,Maps,12,Books,\n'
+        ))
+        out, _ = self.import_catalog(path)
+        self.assertIn('3 created, 0 updated, 0 unchanged', out)
+        self.assertIn('1 new categories', out)
+        self.assertIn('rows/s', out)
+        books = Card.objects.get(sku='B-1').category
+        self.assertEqual((books.name, books.path, books.product_count), ('Books', f'{books.pk}/', 1))
+        self.assertEqual(search.search_card_ids('stones', 10), [Card.objects.get(sku='G-2').pk])
+
+        cart = Cart.objects.create(user_sub='auth0|1')
+        add_items(cart, {Card.objects.get(sku='G-1').pk: 2})
+        path = self.write('changes.csv', (
+            'sku,name,description,price,category,image\n'
+            'G-1,Chess,Wooden set,15.00,Games,\n'
+            'G-2,Go,Stones,25.50,Games,\n'
+        ))
+        out, _ = self.import_catalog(path)
+        self.assertIn('0 created, 1 updated, 1 unchanged', out)
+        self.assertEqual(Card.objects.count(), 3)
+        cart.refresh_from_db()
+        self.assertEqual(cart.total, Decimal('30.00'))
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        path = self.write('cards.jsonl', (
+            '{"sku": "A", "name": "Chess", "price": "10"}\n'
+            '{"sku": "B", "name": "Go", "price": "ten"}\n'
+            'not json\n'
+            '{"name": "No sku", "price": 1}\n'
+        ))
+        out, err = self.import_catalog(path)
+        self.assertIn('1 created', out)
+        self.assertIn('3 errors', out)
+        self.assertIn("line 2: Invalid price 'ten'", err)
+        self.assertIn('line 4: sku is required', err)
+        self.assertEqual(list(Card.objects.values_list('sku', flat=True)), ['A'])
+
+        with mock.patch('products.catalog_io.MAX_REPORTED_ERRORS', 1):
+            out, err = self.import_catalog(path)
+        self.assertIn('3 errors', out)
+        self.assertEqual(err.splitlines(), ["line 2: Invalid price 'ten'", '... and 2 more errors'])
+
+    def test_rows_created_concurrently_are_updated(self):
+        Card.objects.create(sku='G-1', name='Chess', price=10)
+        path = self.write('cards.csv', 'sku,name,price\nG-1,Chess,15\n')
+        # As if another import added the card after the chunk looked it up
+        with mock.patch('django.db.models.query.QuerySet.in_bulk', return_value={}):
+            self.import_catalog(path)
+        self.assertEqual(Card.objects.get().price, Decimal('15.00'))
+
+        categories = CategoryMap()
+        Category.objects.create(name='Games')
+        categories.resolve(['Games', 'Books'])
+        self.assertEqual(categories.created, 1)
+        self.assertEqual(set(categories.ids), {'Games', 'Books'})
+
+    def test_export_round_trip(self):
+        category = Category.objects.create(name='Games')
+        Card.objects.create(sku='G-1', name='Chess', description='Wooden, "classic"', price=10, category=category)
+        Card.objects.create(name='Go', description='Stones', price=Decimal('25.50'))
+        for format in ('csv', 'jsonl'):
+            path = f'{self.directory}/export.{format}'
+            err = StringIO()
+            call_command('export_catalog', path, '--assign-skus', stderr=err)
+            self.assertIn('Exported 2 cards', err.getvalue())
+            out, _ = self.import_catalog(path)
+            self.assertIn('0 created, 0 updated, 2 unchanged', out)
+        self.assertEqual(Card.objects.get(name='Go').sku, f'CARD-{Card.objects.get(name="Go").pk}')
+
+    @override_settings(CARD_IMAGE_PIPELINE='local')
+    def test_images_are_uploaded_with_variants(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storage = FileSystemStorage(location=media.name, base_url='/media/')
+        patcher = mock.patch.object(Card._meta.get_field('image'), 'storage', storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Image.new('RGB', (600, 300), 'red').save(f'{self.directory}/chess.png')
+        path = self.write('cards.csv', 'sku,name,price,image\nG-1,Chess,10,chess.png\n')
+
+        out, _ = self.import_catalog(path, '--image-root', self.directory)
+        self.assertIn('1 images', out)
+        card = Card.objects.get(sku='G-1')
+        self.assertTrue(card.image.name.startswith('cards/chess'))
+        self.assertEqual([v['width'] for v in card.image_variants['variants']], [200, 480, 600])
+
+
+class CardAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.games = Category.objects.create(name='Games')
+        for i in range(3):
+            Card.objects.create(sku=f'G-{i}', name=f'Game {i}', description='plain', price=1, category=cls.games)
+        Card.objects.create(sku='X-1', name='Chess', description='wooden board', price=1)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/admin/products/card/').status_code, 200)
+        for i in range(3, 10):
+            Card.objects.create(sku=f'G-{i}', name=f'Game {i}', description='plain', price=1, category=self.games)
+        with self.assertNumQueries(len(context)):
+            self.client.get('/admin/products/card/')
+
+    def test_search_goes_through_the_full_text_index(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/products/card/', {'q': 'woode'})
+        self.assertContains(response, 'Chess')
+        self.assertNotContains(response, 'Game 1')
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertIn(search.SQLITE_TABLE, sql)
+        self.assertNotIn('LIKE', sql)
+
+        response = self.client.get('/admin/products/card/', {'q': 'G-2'})
+        self.assertContains(response, 'Game 2')
+        self.assertNotContains(response, 'Game 1')
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_IP_BURST=2, RATE_LIMIT_USER_BURST=3)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        get_store().clear()
+        self.addCleanup(get_store().clear)
+
+    def test_buckets_per_ip_and_per_sub(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/products/cards/').status_code, 200)
+        response = self.client.get('/products/search/', {'q': 'chess'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.get('/products/cards/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+        principal = Auth0User({'sub': 'auth0|1'})
+        with mock.patch.object(Auth0JSONWebTokenAuthentication, 'authenticate', return_value=(principal, 'token')):
+            statuses = [self.client.get('/products/cards/').status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        statuses = [
+            self.client.get('/products/cards/', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code for i in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_forwarded_for_behind_a_proxy(self):
+        # The proxy appends the address it saw; whatever the client sent before it is ignored
+        statuses = [
+            self.client.get('/products/cards/', HTTP_X_FORWARDED_FOR=f'10.9.9.{i}, 198.51.100.7').status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_store_size_is_capped(self):
+        store = LocalBucketStore(max_buckets=2)
+        for key in ('a', 'b', 'c'):
+            store.take(key, 1, 1)
+        self.assertEqual(len(store), 2)
+        self.assertGreater(store.take('c', 1, 1), 0)
+        self.assertEqual(store.take('a', 1, 1), 0)  # Evicted, so full again
+
+    def test_bucket_refills(self):
+        store = LocalBucketStore()
+        with mock.patch('backend.throttling.time.monotonic', side_effect=[0, 0, 0, 0.25, 0.5]):
+            self.assertEqual(store.take('k', 2, 2), 0)
+            self.assertEqual(store.take('k', 2, 2), 0)
+            self.assertEqual(store.take('k', 2, 2), 0.5)
+            self.assertEqual(store.take('k', 2, 2), 0.25)
+            self.assertEqual(store.take('k', 2, 2), 0)
+
+
+class RequestCoalescingTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight, release, calls = SingleFlight(), threading.Event(), []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', work))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.001)
+        time.sleep(0.05)  # Let the others reach the wait
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('result', False)] + [('result', True)] * 4)
+        # Nothing is left behind: the next call runs again
+        self.assertEqual(flight.do('key', lambda: 'again'), ('again', False))
+
+    def test_identical_cache_misses_reuse_the_serialized_body(self):
+        caches['catalog'].clear()
+        started, release, calls = threading.Event(), threading.Event(), []
+
+        @cached_catalog_response('coalesce_test')
+        def view(request):
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return Response({'calls': len(calls)})
+
+        with mock.patch('products.cache.get_catalog_version', return_value=1):
+            request = RequestFactory().get('/', {'q': 'x'})
+            responses = []
+            first = threading.Thread(target=lambda: responses.append(view(request)))
+            first.start()
+            started.wait(5)
+            others = [threading.Thread(target=lambda: responses.append(view(request))) for _ in range(3)]
+            for thread in others:
+                thread.start()
+            time.sleep(0.05)
+            release.set()
+            for thread in [first, *others]:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({response.content for response in responses}, {b'{"calls":1}'})
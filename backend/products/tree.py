@@ -0,0 +1,131 @@
+"""
+Category tree helpers.
+
+Each category stores a materialized path of its ancestors' ids and its own,
+e.g. "3/17/" for category 17 under 3. A subtree is every path starting with
+that one, so "everything under a category" is one indexed prefix scan, no
+recursion. It is a LIKE 'path%' rather than a range on purpose: how "/"
+sorts against the digits depends on the collation (glibc and ICU locales
+ignore it), while a prefix match doesn't, and on PostgreSQL Django backs the
+indexed path column with a varchar_pattern_ops index for it.
+
+`product_count` holds the number of cards in a category and everything below
+it. The Card signals adjust it incrementally; bulk writes (imports, seeding,
+category deletes) call recount_categories() instead.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import CharField, Count, F, Subquery, Value
+from django.db.models.functions import Cast, Concat, Substr
+
+from .models import Card, Category
+
+SEPARATOR = '/'
+
+
+def subtree_range(path, prefix=''):
+    """
+    Lookups selecting the subtree rooted at `path`; `prefix` points them at
+    a related category, e.g. 'category__' for cards.
+    """
+    return {f'{prefix}path__startswith': path}
+
+
+def subtree_of(category_id, prefix=''):
+    """
+    Like subtree_range, with the path read by a subquery so the caller's
+    query stays a single statement. Unknown ids select nothing.
+    """
+    paths = Category.objects.filter(pk=category_id).order_by()
+    return {f'{prefix}path__startswith': Subquery(paths.values('path'))}
+
+
+def ancestor_ids(path):
+    """Ids on `path`, root first and the category itself last."""
+    return [int(part) for part in path.split(SEPARATOR) if part]
+
+
+def assign_root_paths():
+    # bulk_create skips save(), so categories created that way (imports,
+    # seeding) have no path yet; they are always roots
+    Category.objects.filter(path='').update(path=Concat(Cast('id', CharField()), Value(SEPARATOR)))
+
+
+def adjust_counts(category_ids, delta):
+    """Add `delta` to the product_count of the given categories and all their ancestors."""
+    paths = Category.objects.filter(id__in=[pk for pk in category_ids if pk is not None]).values_list('path', flat=True)
+    ids = {pk for path in paths for pk in ancestor_ids(path)}
+    if ids and delta:
+        Category.objects.filter(id__in=ids).update(product_count=F('product_count') + delta)
+
+
+def move_cards(old_category_id, new_category_id, count=1):
+    if old_category_id == new_category_id:
+        return
+    with transaction.atomic():
+        adjust_counts([old_category_id], -count)
+        adjust_counts([new_category_id], count)
+
+
+def recount_categories():
+    """
+    Recompute every product_count from one GROUP BY over the cards, folding
+    the direct counts up the paths in Python.
+    """
+    direct = dict(
+        Card.objects.filter(category__isnull=False).values_list('category_id').annotate(n=Count('id')).order_by()
+    )
+    totals = Counter()
+    categories = list(Category.objects.only('id', 'path', 'product_count'))
+    for category in categories:
+        for pk in ancestor_ids(category.path):
+            totals[pk] += direct.get(category.pk, 0)
+    changed = []
+    for category in categories:
+        if category.product_count != totals[category.pk]:
+            category.product_count = totals[category.pk]
+            changed.append(category)
+    Category.objects.bulk_update(changed, ['product_count'], batch_size=500)
+    return len(changed)
+
+
+def place(category):
+    """
+    Give a saved category the path its parent implies. When it moved, the
+    paths of its descendants are rewritten and its cards are counted under
+    the new ancestors instead of the old ones.
+    """
+    # Read from the database: the instances passed in may be stale
+    parent_path = Category.objects.filter(pk=category.parent_id).values_list('path', flat=True).first() or ''
+    path = f'{parent_path}{category.pk}{SEPARATOR}'
+    old_path, count = Category.objects.filter(pk=category.pk).values_list('path', 'product_count').get()
+    if path == old_path:
+        category.path = path
+        return
+
+    with transaction.atomic():
+        if old_path:
+            old_ancestors = ancestor_ids(old_path)[:-1]
+            Category.objects.filter(id__in=old_ancestors).update(product_count=F('product_count') - count)
+            Category.objects.filter(**subtree_range(old_path)).update(
+                path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+            )
+        else:
+            Category.objects.filter(pk=category.pk).update(path=path)
+        Category.objects.filter(id__in=ancestor_ids(parent_path)).update(product_count=F('product_count') + count)
+    category.path = path
+
+
+def build_tree(nodes):
+    """
+    Nest serialized categories (dicts with `id` and `parent`) under their
+    parents and return the roots. Each node gets a `children` list; siblings
+    keep the order they had in `nodes`.
+    """
+    by_id = {node['id']: dict(node, children=[]) for node in nodes}
+    roots = []
+    for node in by_id.values():
+        parent = by_id.get(node['parent'])
+        (parent['children'] if parent else roots).append(node)
+    return roots
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import list_cards, list_categories, search_products
+from .views import list_cards, list_categories, search_products, suggest_products, bestsellers
 
 urlpatterns = [
     path('cards/', list_cards),
     path('categories/', list_categories),
     path('search/', search_products),
+    path('suggest/', suggest_products),
+    path('bestsellers/', bestsellers),
 ]
\ No newline at end of file
@@ -1,37 +1,179 @@
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import render
-from .models import Card, Category
+from django.utils import timezone
+from .models import Card, CardSales, Category, DailyCardSales
 from rest_framework.response import Response
-from .serializers import CardSerializer, CategorySerializer
-from rest_framework.decorators import api_view
+from .serializers import (
+    CategorySalesSerializer, InvalidFields, card_rows, parse_fields, serialize_card_row, serialize_card_rows,
+)
+from rest_framework.decorators import api_view, throttle_classes
+from backend.routers import read_replica
+from backend.throttling import TokenBucketThrottle
+from .pagination import KEYSET_ORDERINGS, InvalidCursor, get_page_size, keyset_columns, keyset_page
+from .streaming import streaming_json_response
+from .cache import cached_catalog_response
+from .facets import card_facets
+from . import search, tree
+from .suggest import suggest
 from . import models
 
 @api_view(['GET'])
+@throttle_classes([TokenBucketThrottle])
+@read_replica
+@cached_catalog_response('list_cards')
 def list_cards(request):
     category_id = request.GET.get('category', None)
-    
-    if category_id:
-        cards = Card.objects.filter(category_id=category_id)
-    else:
-        cards = Card.objects.all()
-    
-    serializer = CardSerializer(cards, many=True, context={"request": request})
-    return Response(serializer.data)
+    ordering = request.GET.get('ordering', 'id')
+
+    if ordering not in KEYSET_ORDERINGS:
+        return Response({"error": f"Unsupported ordering '{ordering}'"}, status=400)
+    try:
+        fields = parse_fields(request)
+    except InvalidFields as e:
+        return Response({"error": str(e)}, status=400)
+
+    cards = Card.objects.all()
+    if category_id and not category_id.isdigit():
+        cards = cards.none()
+    elif category_id:
+        # The category and everything below it, by a range on the category
+        # path; filtering on category_id keeps the (category_id, ...) indexes usable
+        cards = cards.filter(category_id__in=Category.objects.filter(**tree.subtree_of(category_id)).values('id'))
+    for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+        if request.GET.get(param):
+            try:
+                price = Decimal(request.GET[param])
+            except InvalidOperation:
+                price = None
+            if price is None or not price.is_finite():
+                return Response({"error": f"{param} must be a number"}, status=400)
+            cards = cards.filter(**{lookup: price})
+
+    # ?stream=1 returns the whole (filtered) catalog as a flat JSON array,
+    # fed row by row from a server-side cursor
+    if request.GET.get('stream') in ('1', 'true'):
+        cards = card_rows(cards.order_by(*KEYSET_ORDERINGS[ordering]), fields)
+        return streaming_json_response(cards, lambda row: serialize_card_row(row, request, fields))
+
+    try:
+        # The ordering columns are always fetched, the cursor is built from them
+        page, next_cursor = keyset_page(
+            card_rows(cards, fields, keyset_columns(ordering)), ordering,
+            cursor=request.GET.get('cursor'),
+            page_size=get_page_size(request),
+        )
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=400)
+
+    data = {
+        "results": serialize_card_rows(page, request, fields),
+        "next": next_cursor,
+    }
+    # Counts per category and price bucket over the filtered cards, one
+    # aggregate query
+    if request.GET.get('facets') in ('1', 'true'):
+        data["facets"] = card_facets(cards)
+    return Response(data)
 
 
 @api_view(['GET'])
+@read_replica
+@cached_catalog_response('list_categories')
 def list_categories(request):
-    categories = Category.objects.all()
-    serializer = CategorySerializer(categories, many=True)
-    return Response(serializer.data)
+    # The whole tree in one query: product_count is stored on each node and
+    # units_sold comes from the CategorySales rollup (one LEFT JOIN), never
+    # from the order table
+    categories = Category.objects.annotate(units_sold=Coalesce('sales__units', Value(0)))
+    serializer = CategorySalesSerializer(categories, many=True)
+    return Response(tree.build_tree(serializer.data))
 
 @api_view(['GET'])
+@throttle_classes([TokenBucketThrottle])
+@read_replica
+@cached_catalog_response('search_products')
 def search_products(request):
     query = request.GET.get('q', '')
+    limit = get_page_size(request)
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError:
+        return Response({"error": "offset must be an integer"}, status=400)
+    try:
+        fields = parse_fields(request)
+    except InvalidFields as e:
+        return Response({"error": str(e)}, status=400)
+
+    # Ranked ids come from the full-text index; fetch one extra to know
+    # whether there is another page
+    ids = search.search_card_ids(query, limit + 1, offset) if query else []
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+
+    rows = {row['id']: row for row in card_rows(Card.objects.filter(id__in=ids), fields)} if ids else {}
+    results = [serialize_card_row(rows[card_id], request, fields) for card_id in ids if card_id in rows]
+
+    return Response({
+        "results": results,
+        "next": offset + limit if has_more else None,
+    })
+
+
+@api_view(['GET'])
+def suggest_products(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=400)
+
+    return Response([
+        {"type": kind, "id": obj_id, "name": name}
+        for kind, obj_id, name in suggest(query, limit)
+    ])
+
+@api_view(['GET'])
+@cached_catalog_response('bestsellers')
+def bestsellers(request):
+    """
+    Top-selling cards from the precomputed sales rollups. ?days=N limits it
+    to the last N days, ?category= to one category.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+        days = int(request.GET['days']) if request.GET.get('days') else None
+    except ValueError:
+        return Response({"error": "limit and days must be integers"}, status=400)
+    category_id = request.GET.get('category')
+    if category_id and not category_id.isdigit():
+        return Response({"error": "category must be an integer"}, status=400)
 
-    if query:
-        products = Card.objects.filter(name__icontains=query)
+    if days is None:
+        # All-time totals: a walk down the units index
+        totals = CardSales.objects.all()
+        if category_id:
+            totals = totals.filter(card__category_id=category_id)
+        top = totals.order_by('-units', 'card_id').values_list('card_id', 'units')[:limit]
     else:
-        products = Card.objects.none()
+        since = timezone.localdate() - timedelta(days=max(days, 1) - 1)
+        totals = DailyCardSales.objects.filter(day__gte=since)
+        if category_id:
+            totals = totals.filter(card__category_id=category_id)
+        top = (
+            totals.values('card_id')
+            .annotate(total=Sum('units'))
+            .order_by('-total', 'card_id')
+            .values_list('card_id', 'total')[:limit]
+        )
+    top = list(top)
 
-    serializer = CardSerializer(products, many=True, context={"request": request})
-    return Response(serializer.data)
\ No newline at end of file
+    ids = [card_id for card_id, _ in top]
+    rows = {row['id']: row for row in card_rows(Card.objects.filter(id__in=ids))} if ids else {}
+    results = []
+    for card_id, units in top:
+        if card_id in rows:
+            results.append({**serialize_card_row(rows[card_id], request), "units_sold": units})
+    return Response({"results": results})
@@ -7,6 +7,7 @@ import { API_BASE } from "./api";
 
 const Card = ({
   image,
+  srcSet,
   name,
   description,
   price,
@@ -45,6 +46,7 @@ const Card = ({
       const orderId = productId || `${Date.now()}`;
 
       const items = [{
+        id: productId,
         name: name,
         quantity: qty,
         price: price
@@ -60,7 +62,9 @@ const Card = ({
       // Store items in localStorage for later retrieval after payment
       localStorage.setItem('pending_purchase_items', JSON.stringify(items));
 
-      const res = await api.post("/khalti/initiate/", payload);
+      const res = await api.post("/khalti/initiate/", payload, {
+        headers: { "Idempotency-Key": crypto.randomUUID() },
+      });
       const { payment_url } = res.data;
 
       window.location.href = payment_url;
@@ -72,6 +76,7 @@ const Card = ({
 
   const handleAddtoCart = () => {
     const cartItem = {
+      id: productId,
       image,
       name,
       price,
@@ -85,7 +90,12 @@ const Card = ({
 
   return (
     <div className="w-64 bg-white shadow-md rounded-xl p-3">
-      <img src={image} className="w-full h-40 object-cover rounded-lg" alt={name} />
+      <img
+        src={image}
+        srcSet={srcSet || undefined}
+        sizes="(min-width: 1024px) 25vw, (min-width: 640px) 50vw, 100vw"
+        loading="lazy"
+        className="w-full h-40 object-cover rounded-lg" alt={name} />
       {category_name && (
         <span className="inline-block bg-blue-100 text-blue-800 text-xs px-2 py-1 rounded mt-2">
           {category_name}
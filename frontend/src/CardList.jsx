@@ -2,31 +2,48 @@ import { useEffect, useState } from "react";
 import Card from "./Card";
 import { API_BASE } from "./api";
 
+// Depth-first list of the category tree, one filter button per node
+const flattenCategories = (nodes, depth = 0) =>
+  nodes.flatMap(node => [{ ...node, depth }, ...flattenCategories(node.children || [], depth + 1)]);
 
 function CardList() {
   const [cardList, setcardList] = useState([]);
   const [categories, setCategories] = useState([]);
   const [selectedCategory, setSelectedCategory] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [ordering, setOrdering] = useState("id");
+  const [minPrice, setMinPrice] = useState("");
+  const [maxPrice, setMaxPrice] = useState("");
 
   useEffect(() => {
     // Fetch categories
     fetch(`${API_BASE}/products/categories/`)
       .then(res => res.json())
-      .then(data => setCategories(data))
+      .then(data => setCategories(flattenCategories(data)))
       .catch(err => console.error("Error fetching categories:", err));
   }, []);
 
-  useEffect(() => {
-    // Fetch products, optionally filtered by category
-    const url = selectedCategory
-      ? `${API_BASE}/products/cards/?category=${selectedCategory}`
-      : `${API_BASE}/products/cards/`;
+  // Fetch one page of products, optionally filtered by category
+  const fetchCards = (cursor) => {
+    const params = new URLSearchParams();
+    if (selectedCategory) params.set("category", selectedCategory);
+    if (ordering !== "id") params.set("ordering", ordering);
+    if (minPrice) params.set("min_price", minPrice);
+    if (maxPrice) params.set("max_price", maxPrice);
+    if (cursor) params.set("cursor", cursor);
 
-    fetch(url)
+    return fetch(`${API_BASE}/products/cards/?${params}`)
       .then(res => res.json())
-      .then(data => setcardList(data))
+      .then(data => {
+        setcardList(prev => (cursor ? [...prev, ...data.results] : data.results));
+        setNextCursor(data.next);
+      })
       .catch(err => console.error("Error fetching products:", err));
-  }, [selectedCategory]);
+  };
+
+  useEffect(() => {
+    fetchCards(null);
+  }, [selectedCategory, ordering, minPrice, maxPrice]);
 
   return (
     <div className="p-6">
@@ -50,17 +67,44 @@ function CardList() {
               : "bg-gray-200 text-gray-700 hover:bg-gray-300"
               }`}
           >
-            {category.name}
+            {"› ".repeat(category.depth)}{category.name}
+            <span className="ml-2 text-sm opacity-75">{category.product_count}</span>
           </button>
         ))}
       </div>
 
+      {/* Sorting and price range, applied by the API */}
+      <div className="mb-6 flex flex-wrap items-center gap-2">
+        <select
+          value={ordering}
+          onChange={e => setOrdering(e.target.value)}
+          className="px-3 py-2 rounded-lg bg-gray-200 text-gray-700"
+        >
+          <option value="id">Featured</option>
+          <option value="newest">Newest</option>
+          <option value="price">Price: low to high</option>
+          <option value="-price">Price: high to low</option>
+          <option value="name">Name</option>
+        </select>
+        <input
+          type="number" min="0" placeholder="Min price" value={minPrice}
+          onChange={e => setMinPrice(e.target.value)}
+          className="w-28 px-3 py-2 rounded-lg bg-gray-200 text-gray-700"
+        />
+        <input
+          type="number" min="0" placeholder="Max price" value={maxPrice}
+          onChange={e => setMaxPrice(e.target.value)}
+          className="w-28 px-3 py-2 rounded-lg bg-gray-200 text-gray-700"
+        />
+      </div>
+
       {/* Product Grid */}
       <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 lg:grid-cols-4 gap-6">
         {cardList.map((card) => (
           <Card
             key={card.id}
             image={card.image_url}
+            srcSet={card.image_srcset}
             name={card.name}
             description={card.description}
             price={card.price}
@@ -69,6 +113,17 @@ function CardList() {
           />
         ))}
       </div>
+
+      {nextCursor && (
+        <div className="mt-6 flex justify-center">
+          <button
+            onClick={() => fetchCards(nextCursor)}
+            className="px-4 py-2 rounded-lg font-semibold bg-gray-200 text-gray-700 hover:bg-gray-300 transition"
+          >
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 }
@@ -38,6 +38,7 @@ export default function Cart() {
       const total = totalAmount;
 
       const items = cart.map(item => ({
+        id: item.id,
         name: item.name,
         quantity: item.qty,
         price: item.price
@@ -52,7 +53,9 @@ export default function Cart() {
       // Store items in localStorage for later retrieval after payment
       localStorage.setItem('pending_purchase_items', JSON.stringify(items));
 
-      const res = await api.post("/khalti/initiate/", payload);
+      const res = await api.post("/khalti/initiate/", payload, {
+        headers: { "Idempotency-Key": crypto.randomUUID() },
+      });
       const { payment_url } = res.data;
       console.log("Redirecting to Khalti payment...");
       window.location.href = payment_url;
@@ -39,7 +39,7 @@ const Header = () => {
       const fetchSuggestions = async () => {
         try {
           const res = await api.get(
-            `${API_BASE}/products/search/?q=${query}`
+            `${API_BASE}/products/suggest/?q=${encodeURIComponent(query)}`
           );
           setSuggestions(res.data);
         } catch (err) {
@@ -95,7 +95,7 @@ const Header = () => {
           <div className="absolute left-0 right-0 bg-white shadow-lg rounded mt-1 max-h-60 overflow-y-auto z-50">
             {suggestions.map((item) => (
               <div
-                key={item.id}
+                key={`${item.type}-${item.id}`}
                 onClick={() => handleSelect(item.name)}
                 className="p-2 hover:bg-gray-100 cursor-pointer"
               >
@@ -6,6 +6,7 @@ import { AuthContext } from "./AuthContext";
 function PurchaseHistory() {
     const { isAuthenticated } = useContext(AuthContext);
     const [purchases, setPurchases] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const navigate = useNavigate();
@@ -20,16 +21,19 @@ function PurchaseHistory() {
         fetchPurchaseHistory();
     }, [isAuthenticated, navigate]);
 
-    const fetchPurchaseHistory = async () => {
+    const fetchPurchaseHistory = async (cursor = null) => {
         try {
             setLoading(true);
             setError(null);
 
             console.log('Fetching purchase history...');
-            const response = await api.get("/khalti/history/");
+            const response = await api.get("/khalti/history/", {
+                params: cursor ? { cursor } : {},
+            });
             console.log('Response:', response.data);
 
-            setPurchases(response.data);
+            setPurchases(prev => (cursor ? [...prev, ...response.data.results] : response.data.results));
+            setNextCursor(response.data.next);
         } catch (err) {
             console.error('Error:', err);
             setError(err.response?.data?.error || err.message || "Failed to load purchase history");
@@ -44,7 +48,7 @@ function PurchaseHistory() {
                 <h2 className="text-2xl font-bold text-red-600 mb-4">Error</h2>
                 <p className="text-gray-700 mb-4">{error}</p>
                 <button
-                    onClick={fetchPurchaseHistory}
+                    onClick={() => fetchPurchaseHistory()}
                     className="bg-blue-500 text-white px-6 py-2 rounded hover:bg-blue-600"
                 >
                     Retry
@@ -65,7 +69,7 @@ function PurchaseHistory() {
                 </button>
             </div>
 
-            {loading ? (
+            {loading && purchases.length === 0 ? (
                 <div className="text-center py-12">
                     <p className="text-xl text-gray-600">Loading your purchases...</p>
                 </div>
@@ -139,6 +143,17 @@ function PurchaseHistory() {
                             )}
                         </div>
                     ))}
+
+                    {nextCursor && (
+                        <div className="text-center">
+                            <button
+                                onClick={() => fetchPurchaseHistory(nextCursor)}
+                                className="bg-gray-200 text-gray-700 px-6 py-2 rounded hover:bg-gray-300"
+                            >
+                                Load more
+                            </button>
+                        </div>
+                    )}
                 </div>
             )}
         </div>
@@ -14,7 +14,7 @@ export default function SearchPage() {
     const fetchResults = async () => {
       const res = await api.get(`${API_BASE}/products/search/?q=${query}`);
       console.log(res.data);
-      setResults(res.data);
+      setResults(res.data.results);
     };
 
     fetchResults();
@@ -28,6 +28,7 @@ export default function SearchPage() {
           <Card
             key={item.id}
             image={item.image_url}  // <-- explicitly map it
+            srcSet={item.image_srcset}
             name={item.name}
             description={item.description}
             price={item.price}
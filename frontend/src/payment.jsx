@@ -21,7 +21,7 @@ function PaymentSuccess() {
     verifyPayment();
   }, [pidx]);
 
-  const verifyPayment = async () => {
+  const verifyPayment = async (attempt = 0) => {
     try {
       console.log('Cart contents:', cart);
 
@@ -47,6 +47,8 @@ function PaymentSuccess() {
       const response = await api.post("/khalti/verify/", {
         pidx: pidx,
         items: items
+      }, {
+        headers: { "Idempotency-Key": `verify-${pidx}` },
       });
 
       if (response.data.status === "Completed") {
@@ -64,6 +66,9 @@ function PaymentSuccess() {
         setTimeout(() => {
           navigate("/");
         }, 3000);
+      } else if (["Initiated", "Pending"].includes(response.data.status) && attempt < 10) {
+        // Not confirmed yet - the server reconciles it in the background
+        setTimeout(() => verifyPayment(attempt + 1), 3000);
       } else {
         setStatus("failed");
       }